@@ -59,6 +59,9 @@ app.listen(port, () =>
   console.log(`✅ Server running successfully at: http://localhost:${port}`)
 );
 
+// 预先拉起常驻 Python worker（import / 连接预热），首个日历请求无需冷启动
+require("./utils/pyWorker").start();
+
 // -----------------------------
 // 🧩 健康检查
 // -----------------------------
@@ -3,8 +3,30 @@
 const express = require("express");
 const path = require("path");
 
+const pyWorker = require("../utils/pyWorker");
+
 const router = express.Router();
 
+const WORKER_TIMEOUT = 10 * 60 * 1000; // worker 内单次抓取上限
+const RESPONSE_WAIT = 120000;          // HTTP 请求最多等待时间，超出返回 202
+const TIMED_OUT = Symbol("timeout");
+let INFLIGHT = null;                   // 同一时间只跑一个 fetch_all
+
+const delay = (ms) => new Promise((r) => setTimeout(r, ms));
+
+function writeCalendarCache(dataDir, cachePath, parsed) {
+  const fs = require("fs");
+  if (!fs.existsSync(dataDir)) fs.mkdirSync(dataDir, { recursive: true });
+  fs.writeFileSync(cachePath, JSON.stringify(parsed, null, 2), "utf-8");
+  console.log("✅ 写入缓存成功:", cachePath, "条数:", Array.isArray(parsed) ? parsed.length : "N/A");
+}
+
+// Python worker 健康/就绪探针
+router.get("/health", async (req, res) => {
+  const h = await pyWorker.health();
+  res.status(h.status === "ready" ? 200 : 503).json({ ok: h.status === "ready", worker: h });
+});
+
 router.get("/", async (req, res) => {
   console.log("🟣 [/api/earningsCalendar] 请求触发");
 
@@ -41,48 +63,36 @@ router.get("/", async (req, res) => {
       console.log("⚙️ 缓存缺失，准备调用 Python 脚本");
     }
 
-    // 同步调用 Python 抓取
-    console.log("⚙️ 缓存缺失，调用 Python 抓取...");
-    const { spawnSync, spawn } = require("child_process");
-    const pyPath = path.join(__dirname, "../../tools/earnings_calendar_fetch.py");
-    const pyExe  = path.join(process.cwd(), ".venv/Scripts/python.exe");
-    const runCwd = path.join(__dirname, "../..");
-
-    console.log("🔎 调试路径：", { pyExe, pyPath, runCwd, cachePath });
-
-    console.time("⏱️ Python抓取耗时");
-    const pyRun = spawnSync(pyExe, [pyPath], {
-      cwd: runCwd,
-      env: process.env,
-      timeout: 120000,
-      maxBuffer: 10 * 1024 * 1024,
-      encoding: "utf-8",
-    });
-    console.timeEnd("⏱️ Python抓取耗时");
-
-    if (pyRun.error) {
-      console.error("❌ spawnSync error:", pyRun.error);
-      if (pyRun.error.code === "ETIMEDOUT") {
-        console.warn("⏳ 首次抓取超时，后台改用异步预热并返回占位响应");
-        const child = spawn(pyExe, [pyPath], { cwd: runCwd, env: process.env });
-        child.stdout.on("data", (d) => console.log("🐍(bg) stdout:", d.toString().slice(0, 200)));
-        child.stderr.on("data", (d) => console.log("🐍(bg) stderr:", d.toString().slice(0, 200)));
-        return res.status(202).json({ ok: false, warmingUp: true, msg: "首次抓取较慢，已在后台预热，请稍后再试" });
-      }
+    // 交给常驻 Python worker 抓取（异步，不阻塞事件循环）
+    console.log("⚙️ 缓存缺失，调用 Python worker 抓取...");
+    if (!INFLIGHT) {
+      console.time("⏱️ Python抓取耗时");
+      INFLIGHT = pyWorker
+        .call("fetch_all", { incremental: true, meta: true }, WORKER_TIMEOUT)
+        .then(({ rows, stale }) => {
+          // 过期快照（worker 正在后台刷新）不写当天文件，否则刷新结果要到明天才能被读到
+          if (stale) console.warn("⏳ worker 返回过期快照，后台刷新中，不写当日缓存");
+          else writeCalendarCache(dataDir, cachePath, rows);
+          return rows;
+        })
+        .finally(() => {
+          console.timeEnd("⏱️ Python抓取耗时");
+          INFLIGHT = null;
+        });
     }
 
-    console.log("🐍 Python 结束:", { status: pyRun.status, signal: pyRun.signal });
-    console.log("🐍 Python stdout 前 500 字符:\n", (pyRun.stdout || "").slice(0, 500));
-    if (pyRun.stderr) console.log("🐍 Python stderr 前 500 字符:\n", pyRun.stderr.slice(0, 500));
+    const job = INFLIGHT;
+    const parsed = await Promise.race([job, delay(RESPONSE_WAIT).then(() => TIMED_OUT)]);
+    if (parsed === TIMED_OUT) {
+      // 抓取仍在 worker 中继续，完成后自动写缓存
+      job.catch((e) => console.error("❌ 后台抓取失败:", e.message));
+      console.warn("⏳ 首次抓取较慢，返回占位响应，worker 继续在后台抓取");
+      return res.status(202).json({ ok: false, warmingUp: true, msg: "首次抓取较慢，已在后台预热，请稍后再试" });
+    }
 
-    const parsed = JSON.parse(pyRun.stdout || "[]");
     if (Array.isArray(parsed) && parsed.length === 0) {
       console.warn("⚠️ Python 返回空数组，可能是数据源无数据或网络受限");
     }
-
-    if (!fs.existsSync(dataDir)) fs.mkdirSync(dataDir, { recursive: true });
-    fs.writeFileSync(cachePath, JSON.stringify(parsed, null, 2), "utf-8");
-    console.log("✅ 写入缓存成功:", cachePath, "条数:", Array.isArray(parsed) ? parsed.length : "N/A");
     return res.json({ ok: true, data: parsed, fetched: true });
 
   } catch (err) {
@@ -96,6 +106,66 @@ router.get("/", async (req, res) => {
   }
 });
 
+// 流式输出：NDJSON 边抓边推，前端可先渲染 today / thisWeek，远期记录补全后陆续到达
+// 每行 {"type":"row","stage":...,"row":{...}}，最后一行 {"type":"summary",...}
+router.get("/stream", (req, res) => {
+  const { spawn } = require("child_process");
+  const today = new Date().toISOString().split("T")[0];
+  const dataDir = path.join(__dirname, "../../data");
+  const cachePath = path.join(dataDir, `earnings_calendar_${today}.json`);
+  const scriptPath = path.join(__dirname, "../../tools/earnings_calendar_fetch.py");
+
+  const args = [scriptPath, "--stream"];
+  if (req.query.force === "1") args.push("--force");
+  const py = spawn(pyWorker.resolvePyExe(), args, { cwd: path.join(__dirname, "../.."), env: process.env });
+
+  res.setHeader("Content-Type", "application/x-ndjson; charset=utf-8");
+  res.setHeader("Cache-Control", "no-cache");
+  res.setHeader("X-Accel-Buffering", "no");
+
+  const rows = new Map(); // symbol|date -> row，后到的（补全后）覆盖先到的
+  let buf = "";
+  py.stdout.on("data", (d) => {
+    buf += d.toString();
+    let idx;
+    while ((idx = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, idx);
+      buf = buf.slice(idx + 1);
+      if (!line.trim()) continue;
+      // 先校验再转发：混进 stdout 的非 JSON 行（第三方库的 print 等）不发给客户端
+      let rec;
+      try {
+        rec = JSON.parse(line);
+      } catch (e) {
+        console.warn("⚠️ [stream] 无法解析输出，已丢弃:", line.slice(0, 200));
+        continue;
+      }
+      if (!rec || typeof rec !== "object" || !rec.type) {
+        console.warn("⚠️ [stream] 非预期的记录，已丢弃:", line.slice(0, 200));
+        continue;
+      }
+      res.write(line + "\n");
+      if (rec.type === "row" && rec.row) rows.set(`${rec.row.symbol}|${rec.row.date}`, rec.row);
+      if (rec.type === "summary" && !rec.cached && rows.size > 0) {
+        writeCalendarCache(dataDir, cachePath, [...rows.values()]);
+      }
+    }
+  });
+  py.stderr.on("data", (d) => console.log("🐍(stream)", d.toString().trimEnd().slice(0, 500)));
+  py.on("close", (code) => {
+    if (code !== 0) res.write(JSON.stringify({ type: "error", error: `python exited with code ${code}` }) + "\n");
+    res.end();
+  });
+  py.on("error", (err) => {
+    console.error("❌ [stream] 启动 Python 失败:", err.message);
+    res.end(JSON.stringify({ type: "error", error: err.message }) + "\n");
+  });
+  // 客户端提前断开就停止抓取
+  res.on("close", () => {
+    if (py.exitCode === null) py.kill();
+  });
+});
+
 // 手动刷新（含冷却时间）
 router.get("/refresh", async (req, res) => {
   try {
@@ -123,30 +193,16 @@ router.get("/refresh", async (req, res) => {
 
     fs.writeFileSync(cooldownPath, JSON.stringify({ lastRefresh: now }, null, 2));
 
-    const { spawn } = require("child_process");
-    const pyPath = path.join(__dirname, "../../tools/earnings_calendar_fetch.py");
-    const pyExe = path.join(process.cwd(), "../.venv/Scripts/python.exe");
-    const runCwd = path.join(__dirname, "../..");
-    console.log("🚀 手动刷新：执行 Python 抓取任务...", { pyExe, pyPath, runCwd });
-    
-    const child = spawn(pyExe, [pyPath], { cwd: runCwd, env: process.env });
-    let stdout = "", stderr = "";
-    child.stdout.on("data", (d) => (stdout += d.toString()));
-    child.stderr.on("data", (d) => (stderr += d.toString()));
-    
-
-    child.on("close", () => {
-      if (stderr) console.log("🐍 Python stderr:", stderr);
-      try {
-        const parsed = JSON.parse(stdout);
-        fs.writeFileSync(cachePath, JSON.stringify(parsed, null, 2), "utf-8");
-        console.log("✅ 已手动刷新缓存:", cachePath);
-        res.json({ ok: true, msg: "财报数据已手动刷新成功 ✅" });
-      } catch (e) {
-        console.error("❌ JSON parse error:", e.message);
-        res.status(500).json({ ok: false, msg: "Python 输出解析失败" });
-      }
-    });
+    console.log("🚀 手动刷新：交给 Python worker 执行抓取任务...");
+    try {
+      const parsed = await pyWorker.call("fetch_all", { force: true }, WORKER_TIMEOUT);
+      writeCalendarCache(dataDir, cachePath, parsed);
+      console.log("✅ 已手动刷新缓存:", cachePath);
+      res.json({ ok: true, msg: "财报数据已手动刷新成功 ✅" });
+    } catch (e) {
+      console.error("❌ worker 刷新失败:", e.message);
+      res.status(500).json({ ok: false, msg: "Python 抓取失败" });
+    }
   } catch (err) {
     console.error("手动刷新出错:", err);
     res.status(500).json({ ok: false, msg: err.message });
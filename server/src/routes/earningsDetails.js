@@ -1,5 +1,6 @@
 const express = require("express");
 const fetch = require("node-fetch");
+const pyWorker = require("../utils/pyWorker");
 const router = express.Router();
 
 const cache = new Map();
@@ -54,6 +55,22 @@ router.get("/:symbol", async (req, res) => {
   }
 });
 
+// 个股基本面快照（本地 bundle，过期的块由 worker 后台刷新）
+// GET /api/earningsDetails/AAPL/fundamentals?sections=info,quarterly_financials
+router.get("/:symbol/fundamentals", async (req, res) => {
+  const symbol = String(req.params.symbol || "").toUpperCase();
+  if (!/^[A-Z0-9.\-^=]{1,15}$/.test(symbol)) {
+    return res.status(400).json({ ok: false, error: "Invalid symbol" });
+  }
+  const sections = req.query.sections ? String(req.query.sections).split(",").filter(Boolean) : null;
+  try {
+    const data = await pyWorker.call("fundamentals", { symbol, sections }, 5 * 60 * 1000);
+    res.json({ ok: true, data });
+  } catch (err) {
+    res.status(500).json({ ok: false, error: err.message });
+  }
+});
+
 function getAISummary(eps, income, prevIncome) {
   const epsDiff = eps.surprisePercentage ? Number(eps.surprisePercentage) : 0;
   const revDiff =
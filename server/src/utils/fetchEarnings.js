@@ -400,126 +400,110 @@ async function getYahooRevenue(symbol) {
   }
 }
 
-async function getRevenueFromYfinance(symbol) {
-  console.log(`🐍 [yfinance] 调用 Python 获取 ${symbol} 营收...`);
-
-  // 1) Python 代码：把 NaN 规范为 null，并禁止 allow_nan
-  const pyCode = `
-import json, sys
-try:
-    import yfinance as yf
-    import math
-except Exception as e:
-    print("[]")
-    sys.exit(0)
-
-sym = sys.argv[1]
-t = yf.Ticker(sym)
-q = getattr(t, "quarterly_financials", None)
-
-out = []
-try:
-    if q is not None and hasattr(q, "empty") and (not q.empty):
-        # 行名可能是 "Total Revenue" 或 "TotalRevenue"
-        key = None
-        for k in ["Total Revenue", "TotalRevenue", "Total revenue", "TotalRevenueNet"]:
-            if k in q.index:
-                key = k
-                break
-        if key is None and len(q.index) > 0:
-            # 兜底：挑一个包含 revenue/sales 的行
-            for nm in q.index:
-                if "revenue" in str(nm).lower() or "sales" in str(nm).lower():
-                    key = nm
-                    break
-        if key is not None:
-            for col in q.columns:
-                val = q.at[key, col]
-                try:
-                    f = float(val)
-                    if math.isnan(f) or math.isinf(f):
-                        f = None
-                except Exception:
-                    f = None
-                out.append({"date": str(col)[:10], "revenue": f})
-except Exception:
-    pass
-
-print(json.dumps(out, allow_nan=False))
-  `;
-
-  const { spawnSync, spawn } = require("child_process");
-  const os = require("os");
-  const fs = require("fs");
-  const path = require("path");
-
-  // 2) 临时脚本放系统临时目录，避免权限/路径问题；文件名唯一
-  const pyPath = path.join(os.tmpdir(), `yf_rev_${symbol}_${Date.now()}.py`);
-  fs.writeFileSync(pyPath, pyCode);
+/** ====== yfinance 季度营收（常驻 Python worker，批量） ======
+ * 同一轮事件循环里的多个 symbol 合并成一次 worker 调用（tools/yf_revenue_fetch.py 的 fetch_batch），
+ * 不再每个 symbol 写临时脚本 + 冷启动一个 Python 进程
+ */
+const pyWorker = require("./pyWorker");
 
-  let pyExe = fs.existsSync(path.join(process.cwd(), ".venv/Scripts/python.exe"))
-    ? path.join(process.cwd(), ".venv/Scripts/python.exe")
-    : "python";
+const YF_REVENUE_TIMEOUT = 5 * 60 * 1000;
+const YF_REVENUE_BATCH_WAIT = 25; // ms，攒批窗口
+let revenueQueue = null;          // symbol -> [resolve, ...]
 
-  // 3) 检查依赖
-  const check = spawnSync(pyExe, ["-c", "import yfinance"], { encoding: "utf-8" });
-  if (check.stderr && check.stderr.includes("ModuleNotFoundError")) {
-    console.log("⚙️ 自动安装 yfinance 依赖...");
-    spawnSync(pyExe, ["-m", "pip", "install", "yfinance", "pandas"], { stdio: "inherit" });
+function toRevenueIndex(result) {
+  const idx = new Map();
+  for (const r of (result && result.items) || []) {
+    const date = toISO(String(r.period || "").slice(0, 10));
+    if (date && r.revenue != null) idx.set(date, Number(r.revenue));
   }
+  return { ok: idx.size > 0, index: idx };
+}
 
-  // 4) 执行 + 容错清理
-  return new Promise((resolve) => {
-    const child = spawn(pyExe, [pyPath, symbol], { stdio: ["ignore", "pipe", "pipe"] });
-    let stdout = "";
-    child.stdout.on("data", (d) => (stdout += d.toString()));
-    child.stderr.on("data", (d) => console.log("🐍 [stderr]", d.toString()));
+async function getRevenueFromYfinanceBatch(symbols) {
+  const out = new Map();
+  try {
+    const results = await pyWorker.call("yf_revenue", { symbols }, YF_REVENUE_TIMEOUT);
+    for (const sym of symbols) out.set(sym, toRevenueIndex(results[sym]));
+  } catch (e) {
+    console.log("⚠️ [yfinance] worker 调用失败:", e.message);
+    for (const sym of symbols) out.set(sym, { ok: false, index: new Map() });
+  }
+  return out;
+}
 
-    child.on("error", (err) => {
-      console.log("⚠️ [yfinance] 调用失败:", err.message);
-      if (fs.existsSync(pyPath)) try { fs.unlinkSync(pyPath); } catch {}
-      resolve({ ok: false, index: new Map() });
-    });
+async function flushRevenueQueue() {
+  const queue = revenueQueue;
+  revenueQueue = null;
+  const symbols = [...queue.keys()];
+  console.log(`🐍 [yfinance] 批量获取营收: ${symbols.join(", ")}`);
+  const results = await getRevenueFromYfinanceBatch(symbols);
+  for (const [sym, waiters] of queue) {
+    const r = results.get(sym);
+    console.log(`✅ [yfinance] ${sym} 获取 ${r.index.size} 条季度营收`);
+    waiters.forEach((resolve) => resolve(r));
+  }
+}
 
-    child.on("close", () => {
-      try {
-        const arr = JSON.parse(stdout.trim() || "[]");  // 这里不会再出现 NaN
-        const idx = new Map(arr
-          .filter(r => r && r.date && r.revenue != null)
-          .map((r) => [r.date, Number(r.revenue)])
-        );
-        console.log(`✅ [yfinance] ${symbol} 获取 ${idx.size} 条季度营收`);
-        resolve({ ok: idx.size > 0, index: idx });
-      } catch (e) {
-        console.log("⚠️ [yfinance] 解析失败:", e.message);
-        resolve({ ok: false, index: new Map() });
-      } finally {
-        if (fs.existsSync(pyPath)) try { fs.unlinkSync(pyPath); } catch {}
-      }
-    });
+function getRevenueFromYfinance(symbol) {
+  const sym = String(symbol).toUpperCase();
+  if (!revenueQueue) {
+    revenueQueue = new Map();
+    setTimeout(flushRevenueQueue, YF_REVENUE_BATCH_WAIT);
+  }
+  return new Promise((resolve) => {
+    if (!revenueQueue.has(sym)) revenueQueue.set(sym, []);
+    revenueQueue.get(sym).push(resolve);
   });
 }
 
 
 /**
- * 替代实现：先尝试 Python 缓存 → EDGAR (SEC company_facts) → FMP → Finnhub → EODHD
- * 并输出每个来源的状态（便于在控制台确认哪个 source 生效）
+ * 季度营收：按 provider_router 的实测排序依次尝试（默认 yfinance → EDGAR），
+ * 每个来源的耗时 / 是否有结果回报给 router，后续请求自动偏向最快且最完整的来源
  */
-async function getFinnhubRevenueQuarterly(symbol) {
-  console.log(`\n🔍 [RevenueFetch] 开始抓取 ${symbol} 营收数据...`);
+const REVENUE_SOURCES = {
+  yfinance: getRevenueFromYfinance,
+  edgar: getEdgarRevenueQuarterly,
+};
+const REVENUE_LABELS = { yfinance: "yfinance", edgar: "EDGAR (SEC)" };
 
-  // 1️⃣ 优先使用 yfinance
-  const y = await getRevenueFromYfinance(symbol);
-  if (y.ok && y.index.size > 0) {
-    console.log("→ 使用来源：yfinance");
-    return y;
+async function rankRevenueSources(symbol) {
+  const defaults = Object.keys(REVENUE_SOURCES);
+  try {
+    const order = await pyWorker.call("provider_rank", { kind: "revenue", candidates: defaults, symbol }, 5000);
+    return Array.isArray(order) && order.length ? order : defaults;
+  } catch (e) {
+    return defaults;
   }
+}
 
-  // 2️⃣ 再试 EDGAR
-  const e = await getEdgarRevenueQuarterly(symbol);
-  if (e.ok && e.index.size > 0) {
-    console.log("→ 使用来源：EDGAR (SEC)");
-    return e;
+function recordRevenueSource(symbol, provider, latency, ok, size) {
+  // 季度营收的“完整度”按拿到的季度数折算（8 个季度算满）
+  const fill = Math.min(1, size / 8);
+  pyWorker
+    .call("provider_record", { kind: "revenue", provider, symbol, latency, ok, fill }, 5000)
+    .catch(() => {});
+}
+
+async function getFinnhubRevenueQuarterly(symbol) {
+  console.log(`\n🔍 [RevenueFetch] 开始抓取 ${symbol} 营收数据...`);
+
+  const order = await rankRevenueSources(symbol);
+  console.log(`🧭 [RevenueFetch] 来源顺序: ${order.join(" → ")}`);
+  for (const name of order) {
+    const t0 = Date.now();
+    let r = { ok: false, index: new Map() };
+    try {
+      r = await REVENUE_SOURCES[name](symbol);
+    } catch (e) {
+      console.log(`⚠️ [RevenueFetch] ${name} 异常:`, e.message);
+    }
+    const hit = Boolean(r.ok && r.index.size > 0);
+    recordRevenueSource(symbol, name, (Date.now() - t0) / 1000, hit, r.index.size);
+    if (hit) {
+      console.log(`→ 使用来源：${REVENUE_LABELS[name]}`);
+      return r;
+    }
   }
 
   console.log("❌ [RevenueFetch] 所有来源均无结果");
@@ -0,0 +1,140 @@
+// server/src/utils/pyWorker.js
+// 常驻 Python worker（tools/calendar_worker.py）的 Node 端封装
+// - 进程只启动一次，请求通过 stdin/stdout JSON-lines 复用
+// - call() 返回 Promise，不阻塞事件循环
+// - worker 退出后自动在下次调用时重启
+const { spawn } = require("child_process");
+const fs = require("fs");
+const path = require("path");
+
+const WORKER_PATH = path.join(__dirname, "../../tools/calendar_worker.py");
+const RUN_CWD = path.join(__dirname, "../..");
+
+let child = null;
+let ready = false;
+let readyWaiters = [];
+let seq = 0;
+let buf = "";
+let startedAt = 0;
+const PENDING = new Map(); // id -> { resolve, reject, timer, method }
+
+function resolvePyExe() {
+  const candidates = [
+    path.join(process.cwd(), ".venv/Scripts/python.exe"),
+    path.join(process.cwd(), "../.venv/Scripts/python.exe"),
+    path.join(process.cwd(), ".venv/bin/python"),
+  ];
+  return candidates.find((p) => fs.existsSync(p)) || "python";
+}
+
+function onLine(line) {
+  if (!line.trim()) return;
+  let msg;
+  try {
+    msg = JSON.parse(line);
+  } catch (e) {
+    console.warn("⚠️ [pyWorker] 无法解析 worker 输出:", line.slice(0, 200));
+    return;
+  }
+
+  if (msg.event === "ready") {
+    ready = true;
+    console.log("✅ [pyWorker] worker 就绪, pid =", msg.pid);
+    readyWaiters.forEach((fn) => fn());
+    readyWaiters = [];
+    return;
+  }
+
+  const p = PENDING.get(msg.id);
+  if (!p) return;
+  PENDING.delete(msg.id);
+  clearTimeout(p.timer);
+  if (msg.ok) p.resolve(msg.result);
+  else p.reject(new Error(msg.error || `${p.method} failed`));
+}
+
+function start() {
+  if (child) return child;
+
+  const pyExe = resolvePyExe();
+  console.log("🚀 [pyWorker] 启动 Python worker:", { pyExe, WORKER_PATH });
+  ready = false;
+  buf = "";
+  startedAt = Date.now();
+  child = spawn(pyExe, [WORKER_PATH], {
+    cwd: RUN_CWD,
+    env: process.env,
+    stdio: ["pipe", "pipe", "pipe"],
+  });
+
+  child.stdout.on("data", (d) => {
+    buf += d.toString();
+    let idx;
+    while ((idx = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, idx);
+      buf = buf.slice(idx + 1);
+      onLine(line);
+    }
+  });
+  child.stderr.on("data", (d) => console.log("🐍(worker)", d.toString().trimEnd().slice(0, 500)));
+
+  const onExit = (reason) => {
+    console.warn("⚠️ [pyWorker] worker 退出:", reason);
+    child = null;
+    ready = false;
+    for (const [id, p] of PENDING) {
+      clearTimeout(p.timer);
+      p.reject(new Error(`python worker exited (${reason})`));
+      PENDING.delete(id);
+    }
+  };
+  child.on("exit", (code, signal) => onExit(`code=${code} signal=${signal}`));
+  child.on("error", (err) => onExit(err.message));
+  return child;
+}
+
+function whenReady(timeoutMs = 60000) {
+  start();
+  if (ready) return Promise.resolve();
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => reject(new Error("python worker not ready")), timeoutMs);
+    readyWaiters.push(() => {
+      clearTimeout(timer);
+      resolve();
+    });
+  });
+}
+
+function call(method, params = {}, timeoutMs = 120000) {
+  const proc = start();
+  const id = ++seq;
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      PENDING.delete(id);
+      const err = new Error(`${method} timed out after ${timeoutMs}ms`);
+      err.code = "ETIMEDOUT";
+      reject(err);
+    }, timeoutMs);
+    PENDING.set(id, { resolve, reject, timer, method });
+    // worker 启动期间写入的请求会在 stdin 缓冲，就绪后按序处理
+    proc.stdin.write(JSON.stringify({ id, method, params }) + "\n");
+  });
+}
+
+// 健康/就绪探针：worker 未就绪时只返回本地状态，不等待
+async function health(timeoutMs = 3000) {
+  const local = { ready, pid: child ? child.pid : null, pending: PENDING.size, startedAt };
+  if (!child || !ready) return { ...local, status: child ? "starting" : "stopped" };
+  try {
+    const remote = await call("health", {}, timeoutMs);
+    return { ...local, ...remote };
+  } catch (e) {
+    return { ...local, status: "unresponsive", error: e.message };
+  }
+}
+
+function stop() {
+  if (child) child.kill();
+}
+
+module.exports = { start, whenReady, call, health, stop, resolvePyExe };
@@ -0,0 +1,87 @@
+# server/tools/bench_calendar_columnar.py
+"""
+逐行 vs 列式：标准化 + 分组的耗时对比（合成 FMP 数据，不访问网络）
+
+列式 normalize 比逐行慢（dict 列表和 DataFrame 来回转换），线上只采用列式 group_by_time。
+
+    python bench_calendar_columnar.py            # 默认 10000 / 100000 行
+    python bench_calendar_columnar.py 50000      # 自定义行数
+
+同时校验两条路径输出一致。
+"""
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+import earnings_calendar_fetch as ecf
+import calendar_columnar
+
+
+def synth_fmp(n, today, seed=42):
+    rnd = random.Random(seed)
+    sectors = ["Technology", "Healthcare", "Energy", "Financial Services", "", None]
+    rows = []
+    for i in range(n):
+        day = today + timedelta(days=rnd.randint(-3, 40))
+        rows.append({
+            "symbol": f"SYM{i:06d}",
+            "date": day.strftime("%Y-%m-%d") if rnd.random() > 0.01 else "bad-date",
+            "eps": rnd.choice([None, 0, round(rnd.uniform(-2, 5), 2)]),
+            "epsEstimate": rnd.choice([None, round(rnd.uniform(-2, 5), 2)]),
+            "revenue": rnd.choice([None, rnd.randint(1, 10 ** 10)]),
+            "revenueEstimate": rnd.choice([None, rnd.randint(1, 10 ** 10)]),
+            "time": rnd.choice(["amc", "bmo", "", None]),
+            "marketCap": rnd.choice([None, rnd.randint(10 ** 6, 10 ** 12)]),
+            "price": rnd.choice([None, round(rnd.uniform(1, 500), 2)]),
+            "sector": rnd.choice(sectors),
+        })
+    return rows
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def bench(n, today):
+    payload = synth_fmp(n, today)
+
+    rows_old, t_norm_old = timed(ecf.normalize_fmp_rows, payload)
+    groups_old, t_group_old = timed(ecf.group_by_time_rows, rows_old, today)
+
+    rows_new, t_norm_new = timed(calendar_columnar.normalize, payload, "FMP")
+    groups_new, t_group_new = timed(calendar_columnar.group_by_time, rows_new, today)
+
+    same = rows_old == rows_new and groups_old == groups_new
+    return {
+        "rows": n,
+        "normalize": (t_norm_old, t_norm_new),
+        "group": (t_group_old, t_group_new),
+        "same": same,
+    }
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000]
+    today = datetime.now().date()
+    ecf.log = lambda msg: None   # 逐行版本对无效日期逐条打日志，基准里静音
+
+    print(f"{'rows':>8} | {'stage':<9} | {'row-wise':>10} | {'columnar':>10} | {'speedup':>7}")
+    print("-" * 56)
+    for n in sizes:
+        r = bench(n, today)
+        for stage in ("normalize", "group"):
+            old, new = r[stage]
+            print(f"{n:>8} | {stage:<9} | {old * 1000:>8.1f}ms | {new * 1000:>8.1f}ms | {old / new:>6.1f}x")
+        # 线上路径：逐行 normalize + 列式 group_by_time
+        total_old = r["normalize"][0] + r["group"][0]
+        total_new = r["normalize"][0] + r["group"][1]
+        print(f"{n:>8} | {'total*':<9} | {total_old * 1000:>8.1f}ms | {total_new * 1000:>8.1f}ms | {total_old / total_new:>6.1f}x")
+        print(f"{'':>8}   输出一致: {'✅' if r['same'] else '❌'}")
+    print("* total 为线上实际路径：normalize 用逐行实现，只有 group 走列式")
+
+
+if __name__ == "__main__":
+    main()
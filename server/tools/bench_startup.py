@@ -0,0 +1,160 @@
+# server/tools/bench_startup.py
+"""
+各脚本的冷启动耗时（每次都起新进程，和 Node 按请求 spawn 的情况一致）
+
+- import：python -c "import <tool>" 的墙钟时间（减去空解释器启动时间），
+  并列出 import 时顺带加载了哪些重模块（pandas / yfinance / openbb / asyncio ...）
+- 缓存命中：在临时目录里放一份新鲜缓存，跑一遍完整命令行，看缓存命中路径的端到端耗时
+
+    python bench_startup.py                     # 默认每项 5 次，取中位数
+    python bench_startup.py --runs 10 --json
+    python bench_startup.py --record            # 结果追加到 ../data/startup_bench.ndjson，便于跟踪变化
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RECORD_FILE = os.path.join(HERE, "..", "data", "startup_bench.ndjson")
+
+TOOLS = [
+    "earnings_calendar_fetch",
+    "multi_revenue_fetch",
+    "yf_revenue_fetch",
+    "openbb_earnings_calendar",
+    "finnhub_full_dump",
+    "schema_profile",
+    "revenue_store",
+    "provider_router",
+    "negative_cache",
+    "calendar_worker",
+]
+HEAVY = ("openbb", "yfinance", "pandas", "numpy", "httpx", "requests", "asyncio", "sqlite3")
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def median(xs):
+    xs = sorted(xs)
+    n = len(xs)
+    if not n:
+        return None
+    return xs[n // 2] if n % 2 else (xs[n // 2 - 1] + xs[n // 2]) / 2
+
+
+def _timed(argv, cwd, env=None):
+    t0 = time.perf_counter()
+    p = subprocess.run(argv, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - t0, p
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = HERE + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    return env
+
+
+def baseline(runs):
+    return median([_timed([sys.executable, "-c", "pass"], HERE)[0] for _ in range(runs)])
+
+
+def bench_import(mod, runs, base):
+    # calendar_worker 会把 sys.stdout 换成 stderr，这里用 sys.__stdout__
+    code = (f"import sys, json\nimport {mod}\n"
+            f"sys.__stdout__.write(json.dumps([m for m in {HEAVY!r} if m in sys.modules]) + '\\n')")
+    walls = []
+    heavy = []
+    for _ in range(runs):
+        wall, p = _timed([sys.executable, "-c", code], HERE, _env())
+        if p.returncode != 0:
+            err = (p.stderr.strip().splitlines() or ["?"])[-1]
+            return {"tool": mod, "error": err}
+        walls.append(wall)
+        heavy = json.loads(p.stdout.strip().splitlines()[-1])
+    return {"tool": mod, "wall": round(median(walls), 4), "import": round(max(median(walls) - base, 0), 4),
+            "heavy": heavy}
+
+
+# === 缓存命中场景：临时目录里准备新鲜缓存后跑完整命令行 ===
+def _setup_calendar(tmp):
+    today = datetime.now().strftime("%Y-%m-%d")
+    rows = [{"symbol": "AAPL", "date": today, "eps": 1.2, "revenueEstimate": 9e10, "time": "amc", "source": "FMP"}]
+    with open(os.path.join(tmp, "calendar_cache.json"), "w", encoding="utf-8") as f:
+        json.dump(rows, f)
+
+
+def _setup_openbb(tmp):
+    with open(os.path.join(tmp, "upcoming_earnings_openbb.csv"), "w", encoding="utf-8") as f:
+        f.write("Ticker,Earnings Date,EPS Est,Revenue Est\nAAPL,2025-01-30,2.1,1.2e11\n")
+
+
+SCENARIOS = [
+    ("earnings_calendar_fetch (cache hit)", "earnings_calendar_fetch.py", [], _setup_calendar),
+    ("openbb_earnings_calendar (cache hit)", "openbb_earnings_calendar.py", [], _setup_openbb),
+]
+
+
+def bench_scenario(name, script, args, setup, runs, base):
+    tmp = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        setup(tmp)
+        walls = []
+        for _ in range(runs):
+            wall, p = _timed([sys.executable, os.path.join(HERE, script)] + args, tmp, _env())
+            if p.returncode != 0:
+                err = (p.stderr.strip().splitlines() or ["?"])[-1]
+                return {"tool": name, "error": err}
+            walls.append(wall)
+        return {"tool": name, "wall": round(median(walls), 4), "import": round(max(median(walls) - base, 0), 4)}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def run(runs=5):
+    base = baseline(runs)
+    log(f"🐍 空解释器启动 {base * 1000:.0f}ms（下面的 import 列已扣除）")
+    results = []
+    for mod in TOOLS:
+        results.append(bench_import(mod, runs, base))
+        log(f"⏱️ {mod} 完成")
+    for name, script, args, setup in SCENARIOS:
+        results.append(bench_scenario(name, script, args, setup, runs, base))
+        log(f"⏱️ {name} 完成")
+    return {"at": datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+            "runs": runs, "baseline": round(base, 4), "results": results}
+
+
+def print_table(report):
+    print(f"\n{'tool':<40} {'wall':>8} {'import':>8}  heavy modules")
+    for r in report["results"]:
+        if "error" in r:
+            print(f"{r['tool']:<40} {'-':>8} {'-':>8}  ❌ {r['error'][:60]}")
+            continue
+        heavy = ",".join(r.get("heavy", [])) or "-"
+        print(f"{r['tool']:<40} {r['wall'] * 1000:>6.0f}ms {r['import'] * 1000:>6.0f}ms  {heavy}")
+
+
+def main():
+    argv = sys.argv[1:]
+    runs = int(argv[argv.index("--runs") + 1]) if "--runs" in argv else 5
+    report = run(runs)
+    if "--json" in argv:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+    if "--record" in argv:
+        os.makedirs(os.path.dirname(RECORD_FILE), exist_ok=True)
+        with open(RECORD_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+        log(f"💾 已追加到 {RECORD_FILE}")
+
+if __name__ == "__main__":
+    main()
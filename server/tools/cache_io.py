@@ -0,0 +1,164 @@
+# server/tools/cache_io.py
+"""
+缓存文件的原子写入 + 进程间锁
+
+- atomic_write_json：先写同目录临时文件、fsync，再 os.replace 覆盖，读者永远看不到半截文件
+- FileLock：基于 O_CREAT|O_EXCL 的锁文件（Windows / Linux 通用），持有期间心跳续期，
+  超过 stale 秒没有心跳的锁视为残留自动清理；只删除自己 token 的锁
+- read_json：读取并返回 (data, age_seconds)；解析失败会记日志而不是静默吞掉
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import tempfile
+import threading
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    d = os.path.dirname(os.path.abspath(path))
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=d)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_json(path):
+    """返回 (data, age)；文件不存在或损坏返回 (None, None)"""
+    if not os.path.exists(path):
+        return None, None
+    try:
+        age = time.time() - os.path.getmtime(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f), age
+    except Exception as e:
+        log(f"⚠️ 缓存文件损坏，忽略: {path} ({e})")
+        return None, None
+
+
+class FileLock:
+    """
+    with FileLock("calendar_cache.json.lock"):
+        ...
+    acquire(timeout=0) 为非阻塞；timeout=None 一直等
+
+    - 锁文件里写 pid + 随机 token；release() / 清理残留锁时都先核对 token，不会删掉别人的锁
+    - 持有期间后台线程每 stale/4 秒 touch 一次 mtime（心跳），刷新跑得再久也不会被当成残留锁；
+      只有持锁进程已经退出 / 卡死不再心跳，超过 stale 秒才会被清理
+    """
+
+    def __init__(self, path, stale=600, poll=0.5):
+        self.path = path
+        self.stale = stale
+        self.poll = poll
+        self.held = False
+        self.token = None
+        self._stop = None
+
+    def _read_token(self, path=None):
+        try:
+            with open(path or self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("token")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _try(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            self._break_stale()
+            return False
+        token = uuid.uuid4().hex
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps({"pid": os.getpid(), "token": token, "at": time.time()}))
+        self.token = token
+        self.held = True
+        self._start_heartbeat()
+        return True
+
+    def _start_heartbeat(self):
+        self._stop = threading.Event()
+        stop, interval = self._stop, max(0.5, self.stale / 4.0)
+
+        def beat():
+            while not stop.wait(interval):
+                if self._read_token() != self.token:
+                    return   # 锁已经不是自己的了（被人清理过），不再续期
+                try:
+                    os.utime(self.path, None)
+                except OSError:
+                    return
+
+        threading.Thread(target=beat, name=f"lock-heartbeat:{os.path.basename(self.path)}", daemon=True).start()
+
+    def _break_stale(self):
+        """
+        清理残留锁：先把锁文件原子改名到自己独占的临时名，再确认改走的确实是刚才判定过期的那一份；
+        如果在判定和改名之间别人刚好拿到了新锁，把它原样放回去
+        """
+        try:
+            if time.time() - os.path.getmtime(self.path) <= self.stale:
+                return
+            seen = self._read_token()
+            grave = f"{self.path}.{uuid.uuid4().hex}.stale"
+            os.rename(self.path, grave)
+        except FileNotFoundError:
+            return
+        if self._read_token(grave) == seen and time.time() - os.path.getmtime(grave) > self.stale:
+            log(f"🧹 清理残留锁: {self.path}")
+            os.remove(grave)
+            return
+        try:
+            os.link(grave, self.path)   # 放回（目标已存在时失败，说明又有人抢先建了锁）
+        except OSError:
+            pass
+        os.remove(grave)
+
+    def locked(self):
+        """是否有人（包括自己）持有锁"""
+        if not os.path.exists(self.path):
+            return False
+        self._break_stale()
+        return os.path.exists(self.path)
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._try():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(self.poll)
+        return True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            if self._stop is not None:
+                self._stop.set()
+            if self._read_token() != self.token:
+                log(f"⚠️ 锁已不属于本进程，不删除: {self.path}")
+                return
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
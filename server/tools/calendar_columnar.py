@@ -0,0 +1,115 @@
+# server/tools/calendar_columnar.py
+"""
+列式（NumPy / pandas）版本的日历标准化与分组
+
+- normalize(payload, source)：把 FMP / Finnhub 原始记录整列转换成统一字段，
+  结果与 earnings_calendar_fetch 里逐行的 normalize_*_rows 一致。
+  dict 列表 <-> DataFrame 的来回转换比逐行处理还慢，所以线上不用，只作为基准对照
+- group_by_time(rows)：日期整列解析成 datetime64，向量化比较分桶，只排序一次（线上默认）
+
+性能对比见 bench_calendar_columnar.py。
+"""
+import numpy as np
+import pandas as pd
+
+BUCKETS = ["yesterday", "today", "thisWeek", "thisMonth"]
+
+# 统一字段 -> 按优先级尝试的原始字段（与逐行版本的 `a or b or c` 一致）
+SPECS = {
+    "FMP": {
+        "date": ["date", "filingDate"],
+        "eps": ["eps", "epsEstimate", "estimatedEps"],
+        "revenue": ["revenue", "revenueActual"],
+        "revenueEstimate": ["revenueEstimate", "estimatedRevenue"],
+        "marketCap": ["marketCap"],
+        "price": ["price"],
+    },
+    "Finnhub": {
+        "date": ["date"],
+        "eps": ["epsEstimate"],
+        "revenue": ["revenueActual"],
+        "revenueEstimate": ["revenueEstimate"],
+        "marketCap": ["marketCapitalization"],
+        "price": ["close"],
+    },
+}
+NUMERIC = ["eps", "revenue", "revenueEstimate", "marketCap", "price"]
+COLUMNS = ["symbol", "date", "eps", "revenue", "revenueEstimate", "time", "source", "marketCap", "price", "sector"]
+
+
+def _column(df, name):
+    if name in df.columns:
+        return df[name]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _truthy(s):
+    """Python 语义的真值判断（None / NaN / 0 / "" / False 为假）"""
+    obj = s.astype(object)
+    return obj.notna() & (obj != 0) & (obj != "")
+
+
+def first_truthy(df, names):
+    """等价于逐行的 `d.get(a) or d.get(b) or d.get(c)`：都为假时取最后一列"""
+    out = _column(df, names[-1]).astype(object)
+    for name in reversed(names[:-1]):
+        s = _column(df, name).astype(object)
+        out = s.where(_truthy(s), out)
+    return out
+
+
+def to_iso(s):
+    """前 10 个字符按 YYYY-MM-DD 解析，失败为 None"""
+    parsed = pd.to_datetime(s.astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+    return parsed.dt.strftime("%Y-%m-%d").astype(object).where(parsed.notna(), None)
+
+
+def normalize(payload, source):
+    """原始记录列表 -> 统一字段的 dict 列表"""
+    if not payload:
+        return []
+    spec = SPECS[source]
+    df = pd.DataFrame.from_records(payload)
+    out = pd.DataFrame(index=df.index)
+    out["symbol"] = _column(df, "symbol").astype(object)
+    out["date"] = to_iso(first_truthy(df, spec["date"]))
+    for f in NUMERIC:
+        out[f] = pd.to_numeric(first_truthy(df, spec[f]), errors="coerce")
+    hour = first_truthy(df, ["hour", "time"])
+    out["time"] = np.where(hour == "amc", "After Close", np.where(hour == "bmo", "Before Open", "N/A"))
+    out["source"] = source
+    sector = _column(df, "sector").astype(object)
+    out["sector"] = sector.where(_truthy(sector), "N/A")
+    out = out[COLUMNS].astype(object).where(out[COLUMNS].notna(), None)
+    return out.to_dict("records")
+
+
+def bucket_codes(dates, today):
+    """
+    dates: "YYYY-MM-DD" 字符串序列；返回 (codes, days)
+    codes: 0=yesterday 1=today 2=thisWeek 3=thisMonth，-1=窗口外/无效
+    """
+    days = pd.to_datetime(pd.Series(dates, dtype=object), format="%Y-%m-%d", errors="coerce")
+    days = days.values.astype("datetime64[D]")
+    t = np.datetime64(today, "D")
+    valid = ~np.isnat(days)
+    codes = np.full(len(days), -1, dtype=np.int8)
+    codes[valid & (days == t - 1)] = 0
+    codes[valid & (days == t)] = 1
+    codes[valid & (days > t) & (days <= t + 7)] = 2
+    codes[valid & (days > t + 7) & (days <= t + 30)] = 3
+    return codes, days
+
+
+def group_by_time(rows, today=None):
+    """与 earnings_calendar_fetch.group_by_time 输出一致：{bucket: [row, ...]}，每桶按日期稳定排序"""
+    today = today or pd.Timestamp.now().date()
+    codes, days = bucket_codes([r.get("date") for r in rows], today)
+    keep = np.flatnonzero(codes >= 0)
+    # lexsort 稳定：先按桶、再按日期，同一天保持原有顺序
+    order = keep[np.lexsort((days[keep], codes[keep]))]
+    bounds = np.searchsorted(codes[order], np.arange(len(BUCKETS) + 1))
+    return {
+        name: [rows[i] for i in order[bounds[k]:bounds[k + 1]]]
+        for k, name in enumerate(BUCKETS)
+    }
@@ -0,0 +1,275 @@
+# server/tools/calendar_parquet.py
+"""
+OpenBB 财报日历的按天分区列式存储（Parquet / Arrow IPC，依赖 pyarrow，可选）
+
+openbb_calendar/
+    _manifest.json                    {"days": {"2025-11-10": {"hash", "count", "changed_at", "written_at"}}, "format": ...}
+    date=2025-11-10/part-0.parquet    当天的记录（Hive 分区，pyarrow / pandas / DuckDB 都能直接按目录读）
+
+- 列有固定类型（SCHEMA），Sector 用字典编码；压缩默认 zstd（OPENBB_PARQUET_COMPRESSION）
+- write_days() 只重写内容有变化的天（按内容 hash 比较），其余分区不动；过去的天保留下来就是历史
+- 每个分区内按 Sector、Ticker 排序，配合行组统计，按 sector 过滤时可以跳过不相关的行组
+- read_days() 用 pyarrow.dataset 读：日期条件只打开对应分区目录，sector 条件下推到文件扫描
+
+命令行：
+    python calendar_parquet.py info
+    python calendar_parquet.py read [--from 2025-11-10] [--to 2025-11-14] [--sector Technology,Energy] [--columns Ticker,Price]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+
+from cache_io import atomic_write_json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.getenv("OPENBB_PARQUET_DIR") or os.path.join(HERE, "..", "data", "openbb_calendar")
+MANIFEST = "_manifest.json"
+COMPRESSION = os.getenv("OPENBB_PARQUET_COMPRESSION", "zstd")
+FORMATS = {"parquet": "part-0.parquet", "ipc": "part-0.arrow"}
+
+# 输出列及类型；"Earnings Date" 作为分区键（目录名 date=YYYY-MM-DD），不写进文件
+COLUMNS = [
+    ("Ticker", "string"),
+    ("EPS Est", "float64"),
+    ("Revenue Est", "float64"),
+    ("Name", "string"),
+    ("Sector", "dictionary"),
+    ("MarketCap", "float64"),
+    ("Price", "float64"),
+]
+DATE_COLUMN = "Earnings Date"
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def schema():
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "float64": pa.float64(),
+        "dictionary": pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([(name, types[t]) for name, t in COLUMNS])
+
+
+def load_manifest(root=None):
+    path = os.path.join(root or DATASET_DIR, MANIFEST)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            m = json.load(f)
+    except Exception:
+        m = {}
+    m.setdefault("days", {})
+    return m
+
+
+def save_manifest(manifest, root=None):
+    atomic_write_json(os.path.join(root or DATASET_DIR, MANIFEST), manifest, ensure_ascii=False, indent=1)
+
+
+def day_dir(day, root=None):
+    return os.path.join(root or DATASET_DIR, f"date={day}")
+
+
+def _typed(df):
+    """补齐缺失列并统一类型；返回只含 COLUMNS 的新 DataFrame"""
+    import pandas as pd
+
+    out = pd.DataFrame(index=df.index)
+    for name, t in COLUMNS:
+        col = df[name] if name in df.columns else pd.Series([None] * len(df), index=df.index)
+        if t == "float64":
+            out[name] = pd.to_numeric(col, errors="coerce").astype("float64")
+        else:
+            out[name] = col.where(col.notna() & (col.astype(str) != ""), None).astype(object)
+    return out.sort_values(["Sector", "Ticker"], na_position="last", kind="stable").reset_index(drop=True)
+
+
+def day_hash(frame):
+    payload = frame.to_json(orient="values", double_precision=10)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _write_file(table, path, fmt):
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        if fmt == "ipc":
+            with ipc.new_file(tmp, table.schema,
+                              options=ipc.IpcWriteOptions(compression=COMPRESSION if COMPRESSION in ("zstd", "lz4") else None)) as w:
+                w.write_table(table)
+        else:
+            pq.write_table(table, tmp, compression=COMPRESSION, row_group_size=64 * 1024)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _read_file(path, fmt):
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+
+    if fmt == "ipc":
+        with ipc.open_file(path) as r:
+            return r.read_all()
+    return pq.read_table(path)
+
+
+def convert_format(manifest, fmt, root=None):
+    """
+    把 manifest 里所有已有分区从旧格式转成 fmt（内容不变，hash / changed_at 保留）；
+    旧文件已经不在的天从 manifest 里去掉。就地修改 manifest，返回转换的天数
+    """
+    root = root or DATASET_DIR
+    old = manifest.get("format") or "parquet"
+    converted = 0
+    for day in sorted(manifest["days"]):
+        src = os.path.join(day_dir(day, root), FORMATS[old])
+        if not os.path.exists(src):
+            manifest["days"].pop(day)
+            continue
+        _write_file(_read_file(src, old), os.path.join(day_dir(day, root), FORMATS[fmt]), fmt)
+        os.remove(src)
+        converted += 1
+    manifest["format"] = fmt
+    return converted
+
+
+def write_days(df, fmt="parquet", root=None, now=None):
+    """
+    按 "Earnings Date" 拆天写入；内容没变的天跳过。返回 {"written": [...], "unchanged": n, "rows": n}
+    换了格式（parquet <-> ipc）时先把所有历史分区转成新格式，保证整个数据集只有一种格式（read_days 按单一格式读）
+    """
+    import pyarrow as pa
+
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    root = root or DATASET_DIR
+    now = now or time.time()
+    manifest = load_manifest(root)
+    if manifest.get("format") not in (None, fmt):
+        old = manifest["format"]
+        n = convert_format(manifest, fmt, root)
+        log(f"♻️ 输出格式 {old} → {fmt}，已转换 {n} 个历史分区")
+        # 先落盘：后面写新数据中途失败时，manifest 和磁盘上的格式也是一致的
+        save_manifest(manifest, root)
+    manifest["format"] = fmt
+
+    sch = schema()
+    written, unchanged, rows = [], 0, 0
+    for day, part in df.groupby(df[DATE_COLUMN].astype(str).str[:10], sort=True):
+        frame = _typed(part)
+        h = day_hash(frame)
+        meta = manifest["days"].get(day) or {}
+        target = os.path.join(day_dir(day, root), FORMATS[fmt])
+        if meta.get("hash") == h and os.path.exists(target):
+            unchanged += 1
+            continue
+        table = pa.Table.from_pandas(frame, schema=sch, preserve_index=False)
+        # 清掉旧格式残留的文件，保证一个分区只有一份数据
+        if os.path.isdir(day_dir(day, root)):
+            for name in os.listdir(day_dir(day, root)):
+                if name != FORMATS[fmt]:
+                    os.remove(os.path.join(day_dir(day, root), name))
+        _write_file(table, target, fmt)
+        manifest["days"][day] = {"hash": h, "count": len(frame), "written_at": now,
+                                 "changed_at": now if meta.get("hash") != h else meta.get("changed_at", now)}
+        written.append(day)
+        rows += len(frame)
+    manifest["updated_at"] = now
+    save_manifest(manifest, root)
+    log(f"💾 列式输出（{fmt}）：写入 {len(written)} 天 / {rows} 行，未变化 {unchanged} 天 → {root}")
+    return {"written": written, "unchanged": unchanged, "rows": rows}
+
+
+def read_days(from_date=None, to_date=None, sectors=None, columns=None, root=None):
+    """按日期区间 / sector 读取为 pandas DataFrame；日期裁剪分区目录，sector 下推到扫描"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    root = root or DATASET_DIR
+    manifest = load_manifest(root)
+    fmt = manifest.get("format") or "parquet"
+    part = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    dataset = ds.dataset(root, format="ipc" if fmt == "ipc" else "parquet", partitioning=part,
+                         exclude_invalid_files=True, ignore_prefixes=["_", "."])
+    cond = None
+    if from_date:
+        cond = ds.field("date") >= from_date
+    if to_date:
+        c = ds.field("date") <= to_date
+        cond = c if cond is None else cond & c
+    if sectors:
+        c = ds.field("Sector").isin(list(sectors))
+        cond = c if cond is None else cond & c
+    cols = None
+    if columns:
+        cols = list(columns) + (["date"] if "date" not in columns else [])
+    table = dataset.to_table(columns=cols, filter=cond)
+    df = table.to_pandas()
+    return df.rename(columns={"date": DATE_COLUMN}).sort_values([DATE_COLUMN]).reset_index(drop=True)
+
+
+def prune(keep_from, root=None):
+    """删掉早于 keep_from 的分区（默认不调用：历史分区一直保留）"""
+    root = root or DATASET_DIR
+    manifest = load_manifest(root)
+    for day in [d for d in manifest["days"] if d < keep_from]:
+        shutil.rmtree(day_dir(day, root), ignore_errors=True)
+        manifest["days"].pop(day, None)
+    save_manifest(manifest, root)
+
+
+def parse_args(argv):
+    opts = {"from": None, "to": None, "sector": None, "columns": None}
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a in ("--from", "--to", "--sector", "--columns") and i + 1 < len(argv):
+            opts[a[2:]] = argv[i + 1]
+            i += 2
+            continue
+        i += 1
+    return opts
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if not argv:
+        print(__doc__)
+        sys.exit(1)
+    cmd, opts = argv[0], parse_args(argv[1:])
+    if cmd == "info":
+        m = load_manifest()
+        print(json.dumps({"format": m.get("format"), "updatedAt": m.get("updated_at"), "days": len(m["days"]),
+                          "rows": sum(v.get("count", 0) for v in m["days"].values()),
+                          "first": min(m["days"], default=None), "last": max(m["days"], default=None)},
+                         ensure_ascii=False))
+    elif cmd == "read":
+        df = read_days(opts["from"], opts["to"],
+                       sectors=opts["sector"].split(",") if opts["sector"] else None,
+                       columns=opts["columns"].split(",") if opts["columns"] else None)
+        print(df.to_string(index=False))
+    else:
+        print(json.dumps({"error": f"unknown command: {cmd}"}, ensure_ascii=False))
+        sys.exit(1)
@@ -0,0 +1,162 @@
+# server/tools/calendar_partitions.py
+"""
+财报日历的按天分区存储（增量刷新用）
+
+calendar_days/
+    _manifest.json        {"2025-11-10": {"fetched_at": ..., "changed_at": ..., "hash": ..., "count": ...}}
+    2025-11-10.json       当天的记录列表
+
+plan_days() 决定哪些天需要重新拉取：
+- 从未拉过的天（窗口向前滚动新进来的那天）
+- 近期（今天起 NEAR_DAYS 天内）：超过 NEAR_TTL 就重拉
+- 最近有改动的天（changed_at 在 REVISED_WINDOW 内）：超过 REVISED_TTL 就重拉
+- 其余远期：超过 FAR_TTL 才重拉
+"""
+import os
+import json
+import time
+import hashlib
+from datetime import datetime, timedelta
+
+from cache_io import atomic_write_json
+
+PART_DIR = os.getenv("CALENDAR_PART_DIR") or "calendar_days"
+MANIFEST = "_manifest.json"
+
+NEAR_DAYS = int(os.getenv("CALENDAR_NEAR_DAYS", "7"))
+NEAR_TTL = 60 * 30              # 30 分钟，与 CACHE_TTL 一致
+REVISED_WINDOW = 60 * 60 * 48   # 48 小时内有变动视为“最近修订”
+REVISED_TTL = 60 * 60 * 2       # 2 小时
+FAR_TTL = 60 * 60 * 24          # 1 天
+
+
+def day_str(d):
+    return d.strftime("%Y-%m-%d")
+
+
+def window_days(start, end):
+    d = start
+    out = []
+    while d <= end:
+        out.append(day_str(d))
+        d += timedelta(days=1)
+    return out
+
+
+def load_manifest():
+    path = os.path.join(PART_DIR, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_manifest(manifest):
+    _write_json(os.path.join(PART_DIR, MANIFEST), manifest)
+
+
+def load_day(day):
+    path = os.path.join(PART_DIR, f"{day}.json")
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return []
+
+
+def _write_json(path, data):
+    atomic_write_json(path, data, ensure_ascii=False)
+
+
+def rows_hash(rows):
+    key = sorted((r.get("symbol") or "", r.get("eps"), r.get("revenueEstimate"), r.get("time")) for r in rows)
+    return hashlib.sha1(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+
+def plan_days(days, manifest, today=None, now=None):
+    """返回需要重拉的天（升序）"""
+    today = today or datetime.now().date()
+    now = now or time.time()
+    near_end = day_str(today + timedelta(days=NEAR_DAYS))
+    need = []
+    for day in days:
+        meta = manifest.get(day)
+        if not meta:
+            need.append(day)
+            continue
+        age = now - meta.get("fetched_at", 0)
+        if day <= near_end:
+            ttl = NEAR_TTL
+        elif now - meta.get("changed_at", 0) < REVISED_WINDOW:
+            ttl = REVISED_TTL
+        else:
+            ttl = FAR_TTL
+        if age >= ttl:
+            need.append(day)
+    return need
+
+
+def contiguous_ranges(days):
+    """把若干天合并成连续区间，减少上游请求次数"""
+    ranges = []
+    for day in sorted(days):
+        d = datetime.strptime(day, "%Y-%m-%d").date()
+        if ranges and d - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = d
+        else:
+            ranges.append([d, d])
+    return [(day_str(a), day_str(b)) for a, b in ranges]
+
+
+def merge_day(old_rows, new_rows):
+    """
+    按 (symbol, date) 合并：以新数据为准（被取消/改期的记录会消失），
+    但新记录里缺失的补全字段沿用旧值，避免重复补全
+    """
+    old = {(r.get("symbol"), r.get("date")): r for r in old_rows}
+    merged = {}
+    for r in new_rows:
+        k = (r.get("symbol"), r.get("date"))
+        prev = old.get(k)
+        if prev:
+            for f in ("price", "marketCap", "sector"):
+                if r.get(f) in (None, "N/A") and prev.get(f) not in (None, "N/A"):
+                    r[f] = prev[f]
+        merged[k] = r
+    return list(merged.values())
+
+
+def store_days(fetched_days, rows_by_day, manifest, now=None):
+    """
+    写回重拉过的天，更新 manifest；返回内容有变化的天。
+    fetched_days 只能传上游确实应答了的天：传进来的天会以 rows_by_day 为准整天覆盖（没有记录即清空）
+    """
+    now = now or time.time()
+    changed = []
+    for day in fetched_days:
+        rows = merge_day(load_day(day), rows_by_day.get(day, []))
+        h = rows_hash(rows)
+        meta = manifest.get(day) or {}
+        if meta.get("hash") != h:
+            changed.append(day)
+            meta["changed_at"] = now
+        meta.update({"fetched_at": now, "hash": h, "count": len(rows)})
+        manifest[day] = meta
+        _write_json(os.path.join(PART_DIR, f"{day}.json"), rows)
+    return changed
+
+
+def prune(manifest, keep_days):
+    """窗口向前滚动后删除过期分区"""
+    keep = set(keep_days)
+    for day in list(manifest):
+        if day not in keep:
+            manifest.pop(day, None)
+            path = os.path.join(PART_DIR, f"{day}.json")
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,148 @@
+# server/tools/calendar_store.py
+"""
+财报日历的 SQLite 存储 + 查询 API
+
+和 calendar_cache.json 存同一份快照，但带索引（date / symbol / sector / marketCap），
+消费方只读需要的切片，不必解析整个文件：
+
+    by_date_range("2025-11-10", "2025-11-14", sector="Technology")
+    by_symbol("AAPL")
+    top_by_market_cap(20, from_date="2025-11-10")
+
+命令行：
+    python calendar_store.py range 2025-11-10 2025-11-14 [sector]
+    python calendar_store.py symbol AAPL
+    python calendar_store.py top 20 [from_date] [to_date]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+
+DB_FILE = os.getenv("CALENDAR_DB") or "calendar_cache.db"
+
+COLUMNS = ["symbol", "date", "eps", "revenue", "revenueEstimate", "time", "source", "marketCap", "price", "sector"]
+
+
+def connect(path=None):
+    conn = sqlite3.connect(path or DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS earnings (
+            symbol          TEXT NOT NULL,
+            date            TEXT NOT NULL,
+            eps             REAL,
+            revenue         REAL,
+            revenueEstimate REAL,
+            time            TEXT,
+            source          TEXT,
+            marketCap       REAL,
+            price           REAL,
+            sector          TEXT,
+            PRIMARY KEY (symbol, date)
+        );
+        CREATE INDEX IF NOT EXISTS idx_earnings_date ON earnings (date);
+        CREATE INDEX IF NOT EXISTS idx_earnings_sector ON earnings (sector, date);
+        CREATE INDEX IF NOT EXISTS idx_earnings_mcap ON earnings (marketCap DESC);
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """)
+    return conn
+
+
+def save_snapshot(rows, path=None):
+    """用一份完整快照替换表内容（单事务，读者看到的要么是旧快照要么是新快照）"""
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM earnings")
+            conn.executemany(
+                f"INSERT OR REPLACE INTO earnings ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [tuple(r.get(c) for c in COLUMNS) for r in rows if r.get("symbol") and r.get("date")],
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('saved_at', ?)", (str(time.time()),))
+    finally:
+        conn.close()
+
+
+def snapshot_age(path=None):
+    """距上次 save_snapshot 的秒数；没有快照返回 None"""
+    if not os.path.exists(path or DB_FILE):
+        return None
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'saved_at'").fetchone()
+        return time.time() - float(row["value"]) if row else None
+    finally:
+        conn.close()
+
+
+def _query(sql, args=(), path=None):
+    conn = connect(path)
+    try:
+        return [dict(r) for r in conn.execute(sql, args).fetchall()]
+    finally:
+        conn.close()
+
+
+def load_all(path=None):
+    return _query("SELECT * FROM earnings ORDER BY date, symbol", path=path)
+
+
+def by_date_range(from_date, to_date, sector=None, limit=None, path=None):
+    sql = "SELECT * FROM earnings WHERE date BETWEEN ? AND ?"
+    args = [from_date, to_date]
+    if sector:
+        sql += " AND sector = ?"
+        args.append(sector)
+    sql += " ORDER BY date, symbol"
+    if limit:
+        sql += " LIMIT ?"
+        args.append(int(limit))
+    return _query(sql, args, path)
+
+
+def by_symbol(symbol, path=None):
+    return _query("SELECT * FROM earnings WHERE symbol = ? ORDER BY date", (symbol.upper(),), path)
+
+
+def top_by_market_cap(n=20, from_date=None, to_date=None, sector=None, path=None):
+    sql = "SELECT * FROM earnings WHERE marketCap IS NOT NULL"
+    args = []
+    if from_date:
+        sql += " AND date >= ?"
+        args.append(from_date)
+    if to_date:
+        sql += " AND date <= ?"
+        args.append(to_date)
+    if sector:
+        sql += " AND sector = ?"
+        args.append(sector)
+    sql += " ORDER BY marketCap DESC LIMIT ?"
+    args.append(int(n))
+    return _query(sql, args, path)
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if not argv:
+        print(__doc__)
+        sys.exit(1)
+    cmd, rest = argv[0], argv[1:]
+    if cmd == "range":
+        result = by_date_range(rest[0], rest[1], sector=rest[2] if len(rest) > 2 else None)
+    elif cmd == "symbol":
+        result = by_symbol(rest[0])
+    elif cmd == "top":
+        result = top_by_market_cap(int(rest[0]) if rest else 20,
+                                   from_date=rest[1] if len(rest) > 1 else None,
+                                   to_date=rest[2] if len(rest) > 2 else None)
+    else:
+        print(json.dumps({"error": f"unknown command: {cmd}"}, ensure_ascii=False))
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False))
@@ -0,0 +1,227 @@
+# server/tools/calendar_worker.py
+"""
+常驻 Python worker：stdin/stdout JSON-lines RPC
+
+Node 只启动一次本进程，之后每个请求写一行 JSON 到 stdin：
+    {"id": 1, "method": "fetch_all", "params": {"force": false}}
+worker 对每个请求回一行 JSON 到 stdout：
+    {"id": 1, "ok": true, "result": ...}
+    {"id": 1, "ok": false, "error": "..."}
+
+启动完成（import 预热结束）后会先输出一行 {"event": "ready", ...}。
+方法：ping / health、fetch_all、fetch_fmp、fetch_finnhub、enrich_yfinance、rate_limits、
+calendar_query（kind = range / symbol / top，读 calendar_store）、yf_revenue（批量季度营收）、
+provider_rank / provider_record（provider_router 的排序与观测上报）、
+fundamentals（个股基本面快照，见 fundamentals_snapshot）、prices（本地日线 OHLCV，见 price_store）。
+yfinance / pandas 的 import 和 provider_client 的连接池在进程内常驻复用。
+"""
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 协议只走真正的 stdout；其余打印（包括第三方库的 print）一律改到 stderr
+PROTO_OUT = sys.stdout
+sys.stdout = sys.stderr
+
+import coalesce
+import earnings_calendar_fetch as ecf
+
+log = ecf.log
+ecf.BACKGROUND_MODE = "thread"   # 常驻进程内后台刷新用线程，不再起子进程
+
+MAX_WORKERS = int(os.getenv("CALENDAR_WORKER_THREADS", "4"))
+
+STARTED_AT = time.time()
+STATE = {"served": 0, "failed": 0, "inflight": 0, "ready": False}
+_state_lock = threading.Lock()
+_out_lock = threading.Lock()
+
+
+def send(obj):
+    line = json.dumps(obj, ensure_ascii=False, allow_nan=False, default=str)
+    with _out_lock:
+        PROTO_OUT.write(line + "\n")
+        PROTO_OUT.flush()
+
+
+def warmup():
+    """提前 import 重模块，首个请求不再付 import 成本"""
+    t0 = time.time()
+    try:
+        import yfinance  # noqa: F401
+        import pandas  # noqa: F401
+    except Exception as e:
+        log(f"⚠️ [worker] 预热 import 失败: {e}")
+    log(f"🔥 [worker] 预热完成，用时 {time.time() - t0:.2f}s")
+
+
+def health():
+    with _state_lock:
+        return {
+            "status": "ready" if STATE["ready"] else "starting",
+            "pid": os.getpid(),
+            "uptime": round(time.time() - STARTED_AT, 2),
+            "served": STATE["served"],
+            "failed": STATE["failed"],
+            "inflight": STATE["inflight"],
+            "coalesce": dict(coalesce.STATS),
+        }
+
+
+def m_fetch_all(params):
+    incremental = params.get("incremental", os.getenv("CALENDAR_INCREMENTAL") == "1")
+    return ecf.fetch_all(force=bool(params.get("force")), incremental=bool(incremental), mode=params.get("mode"),
+                         meta=bool(params.get("meta")))
+
+
+def m_fetch_fmp(params):
+    rows = ecf.fetch_fmp(params["from_date"], params["to_date"])
+    if rows is None:
+        raise RuntimeError("FMP request failed")
+    return rows
+
+
+def m_fetch_finnhub(params):
+    rows = ecf.fetch_finnhub(params["from_date"], params["to_date"])
+    if rows is None:
+        raise RuntimeError("Finnhub request failed")
+    return rows
+
+
+def m_enrich_yfinance(params):
+    return ecf.enrich_yfinance(params.get("rows") or [], workers=params.get("workers"))
+
+
+def m_yf_revenue(params):
+    import yf_revenue_fetch
+
+    return yf_revenue_fetch.fetch_batch(params.get("symbols") or [], workers=params.get("workers"))
+
+
+def m_provider_rank(params):
+    import provider_router
+
+    return provider_router.rank(params["kind"], params["candidates"], symbol=params.get("symbol"))
+
+
+def m_provider_record(params):
+    import provider_router
+
+    cls = provider_router.symbol_class(params.get("symbol"))
+    provider_router.record(params["kind"], params["provider"], latency=params.get("latency"),
+                           ok=bool(params.get("ok")), fill=params.get("fill"), symbol_class=cls)
+    return True
+
+
+def m_fundamentals(params):
+    import fundamentals_snapshot
+
+    return fundamentals_snapshot.serve(params["symbol"], params.get("sections"))
+
+
+def m_prices(params):
+    import price_store
+
+    symbol = str(params.get("symbol") or "").strip().upper()
+    if not price_store.valid_symbol(symbol):
+        raise ValueError(f"invalid symbol: {params.get('symbol')!r}")
+    if params.get("refresh", True):
+        price_store.update([symbol])
+    return price_store.read(symbol, params.get("from"), params.get("to")).to_records()
+
+
+def m_rate_limits(params):
+    import rate_limit
+
+    return rate_limit.metrics()
+
+
+def m_calendar_query(params):
+    import calendar_store
+
+    kind = params.get("kind")
+    if kind == "range":
+        return calendar_store.by_date_range(params["from_date"], params["to_date"],
+                                            sector=params.get("sector"), limit=params.get("limit"))
+    if kind == "symbol":
+        return calendar_store.by_symbol(params["symbol"])
+    if kind == "top":
+        return calendar_store.top_by_market_cap(params.get("n", 20), from_date=params.get("from_date"),
+                                                to_date=params.get("to_date"), sector=params.get("sector"))
+    raise ValueError(f"unknown calendar_query kind: {kind}")
+
+
+METHODS = {
+    "fetch_all": m_fetch_all,
+    "fetch_fmp": m_fetch_fmp,
+    "fetch_finnhub": m_fetch_finnhub,
+    "enrich_yfinance": m_enrich_yfinance,
+    "rate_limits": m_rate_limits,
+    "calendar_query": m_calendar_query,
+    "yf_revenue": m_yf_revenue,
+    "provider_rank": m_provider_rank,
+    "provider_record": m_provider_record,
+    "fundamentals": m_fundamentals,
+    "prices": m_prices,
+}
+
+
+def run_call(req_id, method, params):
+    with _state_lock:
+        STATE["inflight"] += 1
+    t0 = time.time()
+    try:
+        result = METHODS[method](params)
+        send({"id": req_id, "ok": True, "result": result})
+        with _state_lock:
+            STATE["served"] += 1
+    except Exception as e:
+        log(f"❌ [worker] {method} 失败: {e}")
+        send({"id": req_id, "ok": False, "error": str(e)})
+        with _state_lock:
+            STATE["failed"] += 1
+    finally:
+        with _state_lock:
+            STATE["inflight"] -= 1
+        log(f"⏱️ [worker] {method} 用时 {time.time() - t0:.2f}s")
+
+
+def main():
+    warmup()
+    with _state_lock:
+        STATE["ready"] = True
+    send({"event": "ready", "pid": os.getpid()})
+
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except Exception as e:
+            send({"id": None, "ok": False, "error": f"bad request: {e}"})
+            continue
+
+        req_id = req.get("id")
+        method = req.get("method")
+        params = req.get("params") or {}
+
+        # 健康检查直接在读线程里回答，不排队等长任务
+        if method in ("ping", "health"):
+            send({"id": req_id, "ok": True, "result": health()})
+            continue
+        if method not in METHODS:
+            send({"id": req_id, "ok": False, "error": f"unknown method: {method}"})
+            continue
+        pool.submit(run_call, req_id, method, params)
+
+    log("👋 [worker] stdin 关闭，退出")
+    pool.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# server/tools/coalesce.py
+"""
+同一 (endpoint, symbol, params) 的并发请求合并成一次上游调用
+
+- 进程内：singleflight —— 第一个调用者（leader）真正执行，其余线程等待并拿同一个结果/异常
+- 跨进程：锁文件 + 结果文件
+    COALESCE_DIR/<key>.lock   leader 持有（cache_io.FileLock，O_EXCL）
+    COALESCE_DIR/<key>.json   leader 完成后原子写入 {"at", "ok", "result" | "error"}
+  拿不到锁的进程等锁释放后读结果文件；结果在 RESULT_TTL 秒内（或晚于自己开始等待）就直接复用，
+  leader 崩溃没留下结果时自己接手执行
+- 跨进程复用的结果必须能 JSON 序列化
+
+    info = coalesce.run("yf_info", "AAPL", None, lambda: fetch(...))
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+
+from cache_io import FileLock, atomic_write_json, read_json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COALESCE_DIR = os.getenv("COALESCE_DIR") or os.path.join(HERE, "..", "data", "coalesce")
+RESULT_TTL = float(os.getenv("COALESCE_RESULT_TTL", "5"))     # 刚完成的结果在这段时间内可直接复用
+LOCK_STALE = int(os.getenv("COALESCE_LOCK_STALE", "300"))     # 超过这个秒数的锁视为 leader 已崩溃
+WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT", "120"))       # 等待其他进程的上限，超时自己执行
+PRUNE_AGE = 600
+PRUNE_EVERY = 60
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def make_key(endpoint, symbol=None, params=None):
+    raw = json.dumps([endpoint, (symbol or "").upper(), params or {}], sort_keys=True, default=str)
+    return f"{endpoint}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+
+
+# === 进程内 singleflight ===
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+STATS = {"leader": 0, "shared_thread": 0, "shared_process": 0}
+
+
+def _singleflight(key, fn):
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+        else:
+            call.waiters += 1
+    if not leader:
+        call.done.wait()
+        STATS["shared_thread"] += 1
+        if call.error is not None:
+            raise call.error
+        return call.result
+    try:
+        call.result = fn()
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+# === 跨进程：锁文件 + 结果文件 ===
+_last_prune = [0.0]
+
+
+def _paths(key):
+    return os.path.join(COALESCE_DIR, key + ".lock"), os.path.join(COALESCE_DIR, key + ".json")
+
+
+def _reuse(result_path, since):
+    data, age = read_json(result_path)
+    if not data:
+        return None
+    if data.get("at", 0) >= since or (age is not None and age <= RESULT_TTL):
+        return data
+    return None
+
+
+def _unpack(data):
+    if data.get("ok"):
+        return data.get("result")
+    raise RuntimeError(data.get("error") or "coalesced call failed")
+
+
+def prune(max_age=PRUNE_AGE):
+    """清理过期结果文件（每个进程最多每 PRUNE_EVERY 秒做一次）"""
+    now = time.time()
+    if now - _last_prune[0] < PRUNE_EVERY:
+        return
+    _last_prune[0] = now
+    try:
+        names = os.listdir(COALESCE_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(COALESCE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _cross_process(key, fn):
+    os.makedirs(COALESCE_DIR, exist_ok=True)
+    lock_path, result_path = _paths(key)
+    since = time.time()
+
+    hit = _reuse(result_path, since)
+    if hit:
+        STATS["shared_process"] += 1
+        return _unpack(hit)
+
+    lock = FileLock(lock_path, stale=LOCK_STALE, poll=0.1)
+    deadline = since + WAIT_TIMEOUT
+    while not lock.acquire(timeout=0):
+        # 别的进程正在拉同一个 key：等它释放后读结果
+        while lock.locked() and time.time() < deadline:
+            time.sleep(lock.poll)
+        hit = _reuse(result_path, since)
+        if hit:
+            STATS["shared_process"] += 1
+            return _unpack(hit)
+        if time.time() >= deadline:
+            log(f"⚠️ [coalesce] 等待 {key} 超时，自行执行")
+            break
+        # 锁已释放但没有结果（leader 崩溃或写入失败）：抢锁自己执行
+    try:
+        STATS["leader"] += 1
+        try:
+            result = fn()
+        except Exception as e:
+            atomic_write_json(result_path, {"at": time.time(), "ok": False, "error": str(e)})
+            raise
+        try:
+            atomic_write_json(result_path, {"at": time.time(), "ok": True, "result": result}, default=str)
+        except Exception as e:
+            log(f"⚠️ [coalesce] 结果无法写入 {key}: {e}")
+        return result
+    finally:
+        lock.release()
+        prune()
+
+
+def run(endpoint, symbol, params, fn, cross_process=True):
+    """合并执行 fn()：同进程的并发调用共享一次，跨进程经由锁文件/结果文件共享"""
+    key = make_key(endpoint, symbol, params)
+    if not cross_process:
+        return _singleflight(key, fn)
+    return _singleflight(key, lambda: _cross_process(key, fn))
@@ -3,9 +3,13 @@ import os
 import sys
 import json
 import time
-import requests
 from datetime import datetime, timedelta
 
+# 只 import 标准库和 cache_io：缓存命中时不加载 asyncio / provider_client / calendar_store / pandas / yfinance，
+# 这些都在真正需要的函数里再 import（每次请求都是新进程，冷启动时间直接算进响应延迟）
+from cache_io import FileLock, atomic_write_json, read_json
+
+
 def log(msg):
     """输出到 stderr（Node 不会解析这里的内容）"""
     sys.stderr.write(msg + "\n")
@@ -14,12 +18,23 @@ def log(msg):
 
 FMP_KEY  = os.getenv("FMP_API_KEY") or os.getenv("FMP_KEY") or "z1m4vMNiLtZ1oXbdGJIulSpbMxGfLqvx"
 FINN_KEY = os.getenv("FINNHUB_KEY") or os.getenv("FINNHUB_TOKEN") or "d46d1epr01qgc9es8a40d46d1epr01qgc9es8a4g"
-log(f"🔐 Keys loaded: FMP={bool(FMP_KEY)} FINN={bool(FINN_KEY)}")
 
 CACHE_FILE = "calendar_cache.json"
 CACHE_TTL = 60 * 30  # 30分钟
+CALENDAR_BACKEND = os.getenv("CALENDAR_BACKEND", "json")  # 读缓存用 json 文件还是 sqlite（calendar_store）
+
+# 同一时间只允许一个刷新进程；过期快照先返回，后台单独刷新（stale-while-revalidate）
+LOCK_FILE = CACHE_FILE + ".lock"
+LOCK_STALE = 60 * 10                 # 超过 10 分钟的锁视为残留
+REFRESH_WAIT = 60 * 5                # 前台等待其他刷新进程的上限
+SWR = os.getenv("CALENDAR_SWR", "1") == "1"
+SWR_MAX_AGE = 60 * 60 * 24           # 超过 1 天的快照不再直接返回
+BACKGROUND_MODE = "process"          # 常驻 worker 里改为 "thread"
 
-log("🚀 [fetch_all] 开始执行")
+# 多数据源模式：fallback（按顺序串行，为空再查下一个）/ first（并发，首个非空胜出）/ merge（并发，按 symbol/date 合并）
+FANOUT_MODE = os.getenv("CALENDAR_FANOUT", "fallback")
+USE_NASDAQ = os.getenv("CALENDAR_NASDAQ") == "1"   # 是否加入 OpenBB 的 nasdaq 源
+SOURCE_PRIORITY = ["FMP", "Finnhub", "Nasdaq"]      # 默认顺序；provider_router 观测足够后按实测重排
 
 
 def to_iso(d):
@@ -36,35 +51,48 @@ def safe_num(v):
         return None
 
 
-def cache_load():
-    if os.path.exists(CACHE_FILE):
-        if time.time() - os.path.getmtime(CACHE_FILE) < CACHE_TTL:
-            try:
-                return json.load(open(CACHE_FILE, "r", encoding="utf-8"))
-            except:
-                pass
+def cache_load(allow_stale=False):
+    """读缓存快照；allow_stale=True 时忽略 TTL（用于 stale-while-revalidate）"""
+    if CALENDAR_BACKEND == "sqlite":
+        import calendar_store
+
+        age = calendar_store.snapshot_age()
+        if age is not None and (allow_stale or age < CACHE_TTL):
+            return calendar_store.load_all()
+        return None
+    data, age = read_json(CACHE_FILE)
+    if data and (allow_stale or age < CACHE_TTL):
+        return data
     return None
 
 
-def cache_save(data):
-    json.dump(data, open(CACHE_FILE, "w", encoding="utf-8"), indent=2)
+def cache_age():
+    if CALENDAR_BACKEND == "sqlite":
+        import calendar_store
 
+        return calendar_store.snapshot_age()
+    if not os.path.exists(CACHE_FILE):
+        return None
+    return time.time() - os.path.getmtime(CACHE_FILE)
 
-def fetch_fmp(from_date, to_date):
-    url = f"https://financialmodelingprep.com/api/v3/earning_calendar?from={from_date}&to={to_date}&apikey={FMP_KEY}"
-    log(f"📅 Fetching FMP: {url}")
-    r = requests.get(url, timeout=15)
-    if r.status_code != 200:
-        log(f"❌ FMP Error {r.status_code}")
-        return []
+
+def cache_save(data):
+    atomic_write_json(CACHE_FILE, data, indent=2)
+    # 同一份快照写入带索引的 SQLite，供按日期 / symbol / 市值切片查询
     try:
-        data = r.json()
+        import calendar_store
+
+        calendar_store.save_snapshot(data)
     except Exception as e:
-        log(f"⚠️ JSON Decode Error (FMP): {e}")
-        return []
+        log(f"⚠️ 写入 calendar_store 失败: {e}")
 
-    if not isinstance(data, list):
-        return []
+
+def hour_label(d):
+    h = d.get("hour") or d.get("time")
+    return "After Close" if h == "amc" else ("Before Open" if h == "bmo" else "N/A")
+
+
+def normalize_fmp_rows(data):
     out = []
     for d in data:
         out.append({
@@ -73,12 +101,73 @@ def fetch_fmp(from_date, to_date):
             "eps": safe_num(d.get("eps") or d.get("epsEstimate") or d.get("estimatedEps")),
             "revenue": safe_num(d.get("revenue") or d.get("revenueActual")),
             "revenueEstimate": safe_num(d.get("revenueEstimate") or d.get("estimatedRevenue")),
-            "time": "After Close" if (d.get("hour") or d.get("time")) == "amc" else ("Before Open" if (d.get("hour") or d.get("time")) == "bmo" else "N/A"),
+            "time": hour_label(d),
             "source": "FMP",
             "marketCap": safe_num(d.get("marketCap")),
             "price": safe_num(d.get("price")),
             "sector": d.get("sector") or "N/A"
         })
+    return out
+
+
+def normalize_finnhub_rows(items):
+    out = []
+    for d in items:
+        out.append({
+            "symbol": d.get("symbol"),
+            "date": to_iso(d.get("date")),
+            "eps": safe_num(d.get("epsEstimate")),
+            "revenue": safe_num(d.get("revenueActual")),
+            "revenueEstimate": safe_num(d.get("revenueEstimate")),
+            "time": hour_label(d),
+            "source": "Finnhub",
+            "marketCap": safe_num(d.get("marketCapitalization")),
+            "price": safe_num(d.get("close")),
+            "sector": d.get("sector") or "N/A"
+        })
+    return out
+
+
+def _columnar():
+    """列式实现（依赖 numpy / pandas），不可用时返回 None 走逐行实现"""
+    try:
+        import calendar_columnar
+        return calendar_columnar
+    except ImportError:
+        return None
+
+
+def normalize_rows(payload, source):
+    # 标准化保持逐行：输入输出都是 dict 列表，建 DataFrame 再转回 records 的开销比逐行处理本身还大
+    # （见 bench_calendar_columnar.py）；列式实现只用在 group_by_time
+    return normalize_fmp_rows(payload) if source == "FMP" else normalize_finnhub_rows(payload)
+
+
+def fetch_fmp(from_date, to_date):
+    import provider_client as pc
+
+    return pc.run(afetch_fmp(from_date, to_date))
+
+
+async def afetch_fmp(from_date, to_date):
+    """返回统一记录列表；请求失败 / 限流 / 返回格式不对时返回 None（与“该区间确实没有财报”的 [] 区分）"""
+    url = f"https://financialmodelingprep.com/api/v3/earning_calendar?from={from_date}&to={to_date}&apikey={FMP_KEY}"
+    import provider_client as pc
+
+    log(f"📅 Fetching FMP: {url}")
+    r = await pc.client().get("fmp", url, timeout=15)
+    if r.status != 200:
+        log(f"❌ FMP Error {r.status or r.error}")
+        return None
+    if r.error:
+        log(f"⚠️ JSON Decode Error (FMP): {r.error}")
+        return None
+    data = r.data
+
+    if not isinstance(data, list):
+        log(f"❌ FMP 返回格式异常: {str(data)[:200]}")
+        return None
+    out = normalize_rows(data, "FMP")
 
     log(f"✅ FMP 返回 {len(out)} 条记录")
     log(f"🧾 FMP 原始数据预览:")
@@ -88,17 +177,25 @@ def fetch_fmp(from_date, to_date):
 
 
 def fetch_finnhub(from_date, to_date):
+    import provider_client as pc
+
+    return pc.run(afetch_finnhub(from_date, to_date))
+
+
+async def afetch_finnhub(from_date, to_date):
+    """同 afetch_fmp：失败返回 None，确实没有记录返回 []"""
     url = f"https://finnhub.io/api/v1/calendar/earnings?from={from_date}&to={to_date}&token={FINN_KEY}"
+    import provider_client as pc
+
     log(f"📅 Fetching Finnhub: {url}")
-    r = requests.get(url, timeout=15)
-    if r.status_code != 200:
-        log(f"❌ Finnhub Error {r.status_code}")
-        return []
-    try:
-        data = r.json()
-    except Exception as e:
-        log(f"⚠️ JSON Decode Error (Finnhub): {e}")
-        return []
+    r = await pc.client().get("finnhub", url, timeout=15)
+    if r.status != 200:
+        log(f"❌ Finnhub Error {r.status or r.error}")
+        return None
+    if r.error:
+        log(f"⚠️ JSON Decode Error (Finnhub): {r.error}")
+        return None
+    data = r.data
 
     try:
         items = data.get("earningsCalendar", [])
@@ -107,47 +204,233 @@ def fetch_finnhub(from_date, to_date):
         for i, d in enumerate(items[:20]):
             log(f"{i+1}. {json.dumps(d, ensure_ascii=False)}")
 
+        return normalize_rows(items, "Finnhub")
+    except Exception as e:
+        log("❌ Finnhub Parse Error:" + str(e))
+        return None
+
+# 
+
+
+def fetch_quote(symbol):
+    import provider_client as pc
+
+    return pc.run(afetch_quote(symbol))
+
+
+async def afetch_quote(symbol):
+    import provider_client as pc
+
+    url = f"https://financialmodelingprep.com/api/v3/profile/{symbol}?apikey={FMP_KEY}"
+    r = await pc.client().get("fmp", url, timeout=10)
+    j = r.data if r.ok else None
+    if isinstance(j, list) and len(j) > 0:
+        return {
+            "price": safe_num(j[0].get("price")),
+            "marketCap": safe_num(j[0].get("mktCap")),
+            "sector": j[0].get("sector")
+        }
+    return {}
+
+async def afetch_nasdaq(from_date, to_date):
+    """OpenBB nasdaq 免费源（可选依赖，未安装或出错时返回 None）"""
+    def run():
+        try:
+            from openbb import obb
+        except ImportError:
+            log("⚠️ 未安装 openbb，跳过 Nasdaq 源")
+            return None
+        log(f"📅 Fetching Nasdaq (OpenBB): {from_date} → {to_date}")
+        df = obb.equity.calendar.earnings(start_date=from_date, end_date=to_date, provider="nasdaq").to_df()
         out = []
-        for d in items:
+        for d in df.reset_index(drop=True).to_dict("records"):
             out.append({
                 "symbol": d.get("symbol"),
-                "date": to_iso(d.get("date")),
-                "eps": safe_num(d.get("epsEstimate")),
-                "revenue": safe_num(d.get("revenueActual")),
+                "date": to_iso(d.get("date") or d.get("report_date")),
+                "eps": safe_num(d.get("epsEstimate") or d.get("eps_consensus")),
+                "revenue": None,
                 "revenueEstimate": safe_num(d.get("revenueEstimate")),
-                "time": "After Close" if (d.get("hour") or d.get("time")) == "amc" else ("Before Open" if (d.get("hour") or d.get("time")) == "bmo" else "N/A"),
-                "source": "Finnhub",
-                "marketCap": safe_num(d.get("marketCapitalization")),
-                "price": safe_num(d.get("close")),
-                "sector": d.get("sector") or "N/A"
+                "time": "N/A",
+                "source": "Nasdaq",
+                "marketCap": safe_num(d.get("market_cap")),
+                "price": None,
+                "sector": "N/A"
             })
+        log(f"✅ Nasdaq 返回 {len(out)} 条记录")
         return out
+
+    import asyncio
+
+    try:
+        return await asyncio.to_thread(run)
     except Exception as e:
-        log("❌ Finnhub Parse Error:" + str(e))
-        return []
+        log(f"❌ Nasdaq Error: {e}")
+        return None
 
-# 
 
+CALENDAR_FIELDS = ("eps", "revenueEstimate", "time")   # 衡量日历源完整度的字段
 
-def fetch_quote(symbol):
-    url = f"https://financialmodelingprep.com/api/v3/profile/{symbol}?apikey={FMP_KEY}"
+
+def fill_rate(rows, fields=CALENDAR_FIELDS):
+    if not rows:
+        return 0.0
+    hit = sum(1 for r in rows for f in fields if not _missing(r.get(f)))
+    return hit / (len(rows) * len(fields))
+
+
+def _observed(name, fn):
+    """
+    包一层：把每次调用的耗时 / 是否成功 / 填充率记到 provider_router。
+    ok 只看调用本身（抛异常或返回 None 才算失败）；正常返回但为空记 ok、fill=0
+    """
+    async def run(from_date, to_date):
+        import asyncio
+        import provider_router
+
+        t0 = time.perf_counter()
+        rows = None
+        try:
+            rows = await fn(from_date, to_date)
+        except asyncio.CancelledError:
+            raise   # first 模式下被取消的源不计入统计
+        except Exception as e:
+            log(f"⚠️ {name} 失败: {e}")
+        try:
+            provider_router.record("calendar", name, latency=time.perf_counter() - t0,
+                                   ok=rows is not None, fill=fill_rate(rows) if rows is not None else None)
+        except Exception as e:
+            log(f"⚠️ provider_router 记录失败: {e}")
+        return rows
+    return run
+
+
+def _sources():
+    """按实测表现排序后的数据源（见 provider_router）；观测不足时沿用 SOURCE_PRIORITY"""
+    sources = {"FMP": afetch_fmp, "Finnhub": afetch_finnhub}
+    if USE_NASDAQ:
+        sources["Nasdaq"] = afetch_nasdaq
+    order = [s for s in SOURCE_PRIORITY if s in sources]
     try:
-        r = requests.get(url, timeout=10)
-        if r.status_code == 200:
-            j = r.json()
-            if isinstance(j, list) and len(j) > 0:
-                return {
-                    "price": safe_num(j[0].get("price")),
-                    "marketCap": safe_num(j[0].get("mktCap")),
-                    "sector": j[0].get("sector")
-                }
-    except:
-        pass
-    return {}
+        import provider_router
 
-def group_by_time(data):
-    log("🧩 进入 group_by_time()，共收到 %d 条记录" % len(data))
-    today = datetime.now().date()
+        order = provider_router.rank("calendar", order)
+    except Exception as e:
+        log(f"⚠️ provider_router 排序失败，使用默认顺序: {e}")
+    return {name: _observed(name, sources[name]) for name in order}
+
+
+async def afetch_first(from_date, to_date):
+    """并发请求所有源，第一个返回非空的胜出，其余取消；全部失败返回 None，有源正常返回但都为空返回 []"""
+    import asyncio
+
+    tasks = {asyncio.create_task(fn(from_date, to_date)): name for name, fn in _sources().items()}
+    pending = set(tasks)
+    answered = False
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                rows = None if t.exception() else t.result()
+                answered = answered or rows is not None
+                if rows:
+                    log(f"🏁 {tasks[t]} 首个返回非空（{len(rows)} 条），取消其余 {len(pending)} 个源")
+                    return rows
+        return [] if answered else None
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+async def afetch_merged(from_date, to_date):
+    """并发请求所有源，按 symbol/date 合并（排在前面的源优先）；失败的源不参与，全部失败返回 None"""
+    import asyncio
+
+    sources = _sources()
+    results = await asyncio.gather(*(fn(from_date, to_date) for fn in sources.values()), return_exceptions=True)
+    by_source = {}
+    for name, rows in zip(sources, results):
+        if isinstance(rows, Exception):
+            log(f"⚠️ {name} 失败: {rows}")
+            rows = None
+        if rows is not None:
+            by_source[name] = rows
+    if not by_source:
+        return None
+    return merge_sources(by_source, priority=list(sources))
+
+
+def _missing(v):
+    return v is None or v == "N/A"
+
+
+def merge_sources(by_source, priority=None):
+    """
+    合并多个源：同一 symbol 以优先级最高、且有该 symbol 的源的日期为准（避免改期造成重复），
+    其余源在同一 (symbol, date) 上补齐缺失字段
+    """
+    priority = priority or SOURCE_PRIORITY
+    order = [s for s in priority if s in by_source] + [s for s in by_source if s not in priority]
+    merged = {}
+    primary = {}   # symbol -> 决定日期的源
+    dropped = 0
+    for name in order:
+        for r in by_source[name]:
+            sym, day = r.get("symbol"), r.get("date")
+            if not sym:
+                continue
+            owner = primary.setdefault(sym, name)
+            key = (sym, day)
+            if key in merged:
+                base = merged[key]
+                filled = False
+                for f, v in r.items():
+                    if f != "source" and _missing(base.get(f)) and not _missing(v):
+                        base[f] = v
+                        filled = True
+                if filled and name not in base["source"]:
+                    base["source"] += f"+{name}"
+            elif owner == name:
+                merged[key] = dict(r)
+            else:
+                dropped += 1
+    log(f"🔀 合并 {', '.join(f'{k}={len(v)}' for k, v in by_source.items())} → {len(merged)} 条（日期冲突丢弃 {dropped} 条）")
+    return list(merged.values())
+
+
+async def afetch_sources(from_date, to_date, mode=None):
+    mode = mode or FANOUT_MODE
+    if mode == "first":
+        return await afetch_first(from_date, to_date)
+    if mode == "merge":
+        return await afetch_merged(from_date, to_date)
+
+    # fallback：按 provider_router 排好的顺序串行，前一个为空 / 失败再查下一个（默认 FMP → Finnhub）；
+    # 全部失败返回 None，至少一个源正常应答（哪怕为空）返回 []
+    result = None
+    for name, fn in _sources().items():
+        if name == "Nasdaq":
+            continue
+        data = await fn(from_date, to_date)
+        if data is None:
+            log(f"📊 {name} 请求失败")
+            continue
+        log(f"📊 从 {name} 拿到 {len(data)} 条记录")
+        result = data
+        if data:
+            break
+    return result
+
+
+def fetch_sources(from_date, to_date, mode=None):
+    """统一记录列表；所有源都失败时返回 None"""
+    import provider_client as pc
+
+    return pc.run(afetch_sources(from_date, to_date, mode))
+
+
+def group_by_time_rows(data, today=None):
+    """逐行实现（无 numpy / pandas 时的兜底，也作为基准对照）"""
+    today = today or datetime.now().date()
     yesterday = today - timedelta(days=1)
     week_ahead = today + timedelta(days=7)
     month_ahead = today + timedelta(days=30)
@@ -176,120 +459,395 @@ def group_by_time(data):
         elif week_ahead < dt <= month_ahead:
             groups["thisMonth"].append(d)
 
-    log(f"✅ group_by_time() 完成，有效记录 {len(data)-invalid_count} 条，丢弃 {invalid_count} 条")
+    if invalid_count:
+        log(f"⚠️ 丢弃 {invalid_count} 条无效日期记录")
     for k in groups:
-        log(f"  └─ {k}: {len(groups[k])} 条")
         groups[k] = sorted(groups[k], key=lambda x: x["date"])
     return groups
 
 
-def fetch_all():
-    log("🚀 开始 fetch_all() 流程")
+def group_by_time(data):
+    log("🧩 进入 group_by_time()，共收到 %d 条记录" % len(data))
+    cc = _columnar()
+    groups = cc.group_by_time(data) if cc is not None else group_by_time_rows(data)
+    kept = sum(len(v) for v in groups.values())
+    log(f"✅ group_by_time() 完成，保留 {kept} 条，窗口外或无效 {len(data) - kept} 条")
+    for k in groups:
+        log(f"  └─ {k}: {len(groups[k])} 条")
+    return groups
+
+
+def enrich_yfinance(data, workers=None, on_result=None):
+    """用 yfinance 并发补全 price / marketCap / sector（原地更新并返回 data）"""
+    import negative_cache
+    import profile_store
+    from yf_enrich import enrich_symbols
+
+    symbols = list({d["symbol"] for d in data if d.get("symbol")})
+    log(f"🔍 使用 yfinance 并发补全市场信息，共 {len(data)} 条; symbols={len(symbols)}")
+
+    # 先用本地 profile 缓存，只有存在过期字段的 symbol 才去 yfinance
+    yf_data = profile_store.get_many(symbols)
+    stale = profile_store.stale_fields(symbols)
+    log(f"📁 profile 缓存命中 {len(symbols) - len(stale)}/{len(symbols)}，需刷新 {len(stale)} 支")
+    skipped = negative_cache.blocked("yf_info", stale)
+    if skipped:
+        stale = {s: f for s, f in stale.items() if s.upper() not in skipped}
+        log(f"🚫 {len(skipped)} 支近期无数据，未到重查时间，跳过")
+
+    done = [0]
+
+    def progress(sym, info):
+        done[0] += 1
+        if on_result:
+            on_result(sym, info)
+        if done[0] % 50 == 0:
+            log(f"⏳ yfinance 已完成 {done[0]}/{len(symbols)}")
+
+    fetched, report = enrich_symbols(list(stale), workers=workers, on_result=progress)
+    profile_store.put_many(fetched, source="yfinance")
+    for sym, info in fetched.items():
+        yf_data.setdefault(sym, {}).update({k: v for k, v in info.items() if v is not None and k in profile_store.FIELDS})
+    log(f"✅ yfinance 全部完成，共返回 {len(fetched)} 条公司信息; 报告: {json.dumps(report)}")
+
+    # === 合并补全数据 ===
+    filled = 0
+    for d in data:
+        sym = d.get("symbol")
+        if sym in yf_data:
+            d.update(yf_data[sym])
+            filled += 1
+    log(f"✅ yfinance 补全结束，共更新 {filled} 条/总 {len(data)} 条")
+    return data
+
+
+def fetch_incremental():
+    """
+    增量刷新：只重拉近期 / 最近修订 / 新滚入窗口的天，按 (symbol, date) 合并进按天分区，
+    其余天直接复用分区数据。没有任何分区时返回 None，由调用方走全量流程。
+    """
+    import calendar_partitions as parts
+
+    today = datetime.now().date()
+    days = parts.window_days(today - timedelta(days=1), today + timedelta(days=30))
+    manifest = parts.load_manifest()
+    if not manifest:
+        log("📂 尚无分区数据，增量模式回退为全量拉取")
+        return None
+
+    parts.prune(manifest, days)
+    need = parts.plan_days(days, manifest, today=today)
+    log(f"🧩 增量刷新：窗口 {len(days)} 天，需重拉 {len(need)} 天 {need}")
 
-    cache = cache_load()
-    if cache:
-        log("📁 使用缓存数据")
-        return cache
+    rows_by_day = {}
+    answered = []   # 上游确实应答了的天；请求失败的区间保留原分区，fetched_at 不更新，下次照常重拉
+    for from_date, to_date in parts.contiguous_ranges(need):
+        rows = fetch_sources(from_date, to_date)
+        if rows is None:
+            log(f"⚠️ {from_date} → {to_date} 所有数据源都失败，保留原分区")
+            continue
+        answered += [d for d in need if from_date <= d <= to_date]
+        for d in rows:
+            if d.get("date"):
+                rows_by_day.setdefault(d["date"], []).append(d)
+
+    fetched = [r for day in answered for r in rows_by_day.get(day, [])]
+    if fetched:
+        enrich_yfinance(fetched)
+    changed = parts.store_days(answered, rows_by_day, manifest)
+    parts.save_manifest(manifest)
+    log(f"✅ 增量刷新完成：重拉 {len(answered)}/{len(need)} 天，内容变化 {len(changed)} 天，新增/更新 {len(fetched)} 条")
+
+    data = [r for day in days for r in parts.load_day(day)]
+    grouped = group_by_time(data)
+    merged = []
+    for k in grouped:
+        merged.extend(grouped[k])
+    cache_save(merged)
+    log(f"🏁 fetch_incremental() 结束，最终返回 {len(merged)} 条统一记录")
+    return merged
+
+
+def seed_partitions(rows):
+    """全量拉取后顺便写入按天分区，供后续增量刷新"""
+    import calendar_partitions as parts
 
+    today = datetime.now().date()
+    days = parts.window_days(today - timedelta(days=1), today + timedelta(days=30))
+    rows_by_day = {}
+    for d in rows:
+        if d.get("date"):
+            rows_by_day.setdefault(d["date"], []).append(d)
+    manifest = parts.load_manifest()
+    parts.prune(manifest, days)
+    parts.store_days(days, rows_by_day, manifest)
+    parts.save_manifest(manifest)
+
+
+def refresh_in_background(incremental=False, mode=None):
+    """触发一次后台刷新；已有刷新在跑则什么也不做"""
+    if FileLock(LOCK_FILE, stale=LOCK_STALE).locked():
+        log("⏳ 已有刷新任务在运行，跳过后台刷新")
+        return
+    if BACKGROUND_MODE == "thread":
+        import threading
+
+        threading.Thread(target=refresh, kwargs={"incremental": incremental, "mode": mode, "wait": False},
+                         daemon=True).start()
+    else:
+        import subprocess
+
+        args = [sys.executable, os.path.abspath(__file__), "--refresh"]
+        if incremental:
+            args.append("--incremental")
+        if mode:
+            args += ["--mode", mode]
+        kwargs = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True
+        subprocess.Popen(args, **kwargs)
+    log("🔄 已触发后台刷新")
+
+
+def refresh(incremental=False, mode=None, full=False, wait=True):
+    """
+    持锁刷新：拿不到锁说明别的进程在刷新 —— wait=True 时等它结束后直接用它的结果，
+    wait=False 时直接放弃（返回 None）
+    """
+    lock = FileLock(LOCK_FILE, stale=LOCK_STALE)
+    if not lock.acquire(timeout=0):
+        if not wait:
+            return None
+        log("⏳ 其他进程正在刷新，等待其完成...")
+        if not lock.acquire(timeout=REFRESH_WAIT):
+            log("⚠️ 等待刷新超时，返回旧快照")
+            return cache_load(allow_stale=True)
+        cache = cache_load()
+        if cache:
+            lock.release()
+            log("📁 使用其他进程刚刷新的缓存")
+            return cache
+    try:
+        if incremental and not full:
+            merged = fetch_incremental()
+            if merged is not None:
+                return merged
+        return fetch_full(mode)
+    finally:
+        lock.release()
+
+
+def fetch_all(force=False, incremental=False, mode=None, meta=False):
+    """
+    返回日历行；meta=True 时返回 {"rows", "stale"}：stale 表示返回的是过期快照（后台刷新中 /
+    等待其他刷新进程超时），调用方不应把它当成当天的结果长期缓存
+    """
+    log("🚀 开始 fetch_all() 流程")
+    rows, stale = _fetch_all(force, incremental, mode)
+    return {"rows": rows, "stale": stale} if meta else rows
+
+
+def _fetch_all(force, incremental, mode):
+    if not force:
+        cache = cache_load()
+        if cache:
+            log("📁 使用缓存数据")
+            return cache, False
+
+        # stale-while-revalidate：先返回旧快照，后台单独刷新
+        age = cache_age()
+        if SWR and age is not None and age < SWR_MAX_AGE:
+            stale = cache_load(allow_stale=True)
+            if stale:
+                log(f"📁 缓存已过期 {int(age)}s，先返回旧快照并后台刷新")
+                refresh_in_background(incremental, mode)
+                return stale, True
+
+    rows = refresh(incremental=incremental, mode=mode, full=force)
+    # refresh 等其他进程超时会退回旧快照：按快照年龄判断
+    age = cache_age()
+    return rows, age is None or age >= CACHE_TTL
+
+
+def mock_rows(today):
+    """所有数据源都没有数据时的兜底，保证前端可视"""
+    return [
+        {"symbol": "AAPL", "date": today.strftime("%Y-%m-%d"), "eps": 1.2, "revenue": 9e10, "revenueEstimate": 9.2e10, "time": "After Close", "source": "Mock"},
+        {"symbol": "MSFT", "date": today.strftime("%Y-%m-%d"), "eps": 2.4, "revenue": 7.8e10, "revenueEstimate": 8.0e10, "time": "Before Open", "source": "Mock"},
+        {"symbol": "NVDA", "date": (today + timedelta(days=5)).strftime("%Y-%m-%d"), "eps": 1.05, "revenue": 4.6e10, "revenueEstimate": 4.8e10, "time": "After Close", "source": "Mock"},
+    ]
+
+
+def fetch_full(mode=None):
     today = datetime.now().date()
     yesterday = today - timedelta(days=1)
     month_ahead = today + timedelta(days=30)
     from_date = yesterday.strftime("%Y-%m-%d")
     to_date = month_ahead.strftime("%Y-%m-%d")
+    log(f"🔐 Keys loaded: FMP={bool(FMP_KEY)} FINN={bool(FINN_KEY)}")
     log(f"📅 日期范围: {from_date} → {to_date}")
 
-    # === 尝试从 FMP 拉取 ===
-    data = fetch_fmp(from_date, to_date)
-    log(f"📊 从 FMP 拿到 {len(data)} 条记录")
-
-    # === 若 FMP 为空，再从 Finnhub 拉取 ===
-    if not data:
-        data = fetch_finnhub(from_date, to_date)
-        log(f"📊 从 Finnhub 拿到 {len(data)} 条记录")
-
-        # ✅ 打印前20条记录预览
-        try:
-            log("🧾 Finnhub 数据前 20 条内容：")
-            for i, d in enumerate(data[:20]):
-                log(f"{i+1}. {json.dumps(d, ensure_ascii=False)}")
-        except Exception as e:
-            log(f"⚠️ 打印预览时出错: {e}")
+    # === 拉取日历（fallback / first / merge，见 CALENDAR_FANOUT） ===
+    t0 = time.time()
+    data = fetch_sources(from_date, to_date, mode)
+    answered = data is not None
+    data = data or []
+    log(f"📊 数据源模式 {mode or FANOUT_MODE}：拿到 {len(data)} 条记录，用时 {time.time() - t0:.2f}s")
 
     # === 若两者都为空 ===
     if not data:
-        log("⚠️ 两个数据源都无数据，使用 mock 数据")
-        data = [
-            {"symbol": "AAPL", "date": today.strftime("%Y-%m-%d"), "eps": 1.2, "revenue": 9e10, "revenueEstimate": 9.2e10, "time": "After Close", "source": "Mock"},
-            {"symbol": "MSFT", "date": today.strftime("%Y-%m-%d"), "eps": 2.4, "revenue": 7.8e10, "revenueEstimate": 8.0e10, "time": "Before Open", "source": "Mock"},
-            {"symbol": "NVDA", "date": (today + timedelta(days=5)).strftime("%Y-%m-%d"), "eps": 1.05, "revenue": 4.6e10, "revenueEstimate": 4.8e10, "time": "After Close", "source": "Mock"},
-        ]
+        log("⚠️ 所有数据源都无数据，使用 mock 数据")
+        data = mock_rows(today)
 
 
 
     # === 改进版 yfinance 批量补全 ===
-    import yfinance as yf
-    from math import ceil
+    enrich_yfinance(data)
 
-    log(f"🔍 使用 yfinance 批量补全市场信息，共 {len(data)} 条")
-    symbols = list({d["symbol"] for d in data if d.get("symbol")})
-    batch_size = 50  # ⬅️ 首次抓取更稳一些
-    yf_data = {}
 
-    total_batches = ceil(len(symbols) / batch_size)
-    log(f"📦 yfinance 批次数: {total_batches}（每批 {batch_size} 支）; symbols={len(symbols)}")
 
+    log(f"🧮 进入分组前数据量: {len(data)}")
+    grouped = group_by_time(data)
+    log("💾 准备写入缓存文件 calendar_cache.json")
 
-    for i in range(0, len(symbols), batch_size):
-        batch = symbols[i:i + batch_size]
-        batch_no = (i // batch_size) + 1
-        log(f"⏳ yfinance 批 {batch_no}/{total_batches}：{batch[0]} ~ {batch[-1]}")
 
-        try:
-            tickers = yf.Tickers(" ".join(batch))
-            for sym, obj in tickers.tickers.items():
-                info = getattr(obj, "info", {})
-                yf_data[sym] = {
-                    "price": safe_num(info.get("currentPrice")),
-                    "marketCap": safe_num(info.get("marketCap")),
-                    "sector": info.get("sector") or "N/A",
-                }
-            log(f"✅ 第 {batch_no} 批完成，累计获取 {len(yf_data)} 条")
-        except Exception as e:
-            log(f"⚠️ 第 {batch_no} 批失败: {e}")
-            continue
-        log(f"✅ 批 {batch_no} 完成，当前累计 {len(yf_data)} 条（本批 {len(batch)}）")
-    log(f"✅ yfinance 全部完成，共返回 {len(yf_data)} 条公司信息")
+    # ✅ 转换成单一数组结构（适配前端）
+    merged = []
+    for k in grouped:
+        merged.extend(grouped[k])
 
-    # === 合并补全数据 ===
-    filled = 0
-    for d in data:
-        sym = d.get("symbol")
-        if sym in yf_data:
-            d.update(yf_data[sym])
-            filled += 1
-    log(f"✅ yfinance 补全结束，共更新 {filled} 条/总 {len(data)} 条")
+    cache_save(merged)
+    if answered and not any(d.get("source") == "Mock" for d in merged):
+        seed_partitions(merged)
+    log(f"🏁 fetch_full() 结束，最终返回 {len(merged)} 条统一记录")
+    return merged
 
 
+# === 流式输出（--stream）：NDJSON，一行一条记录 ===
+# {"type": "row", "stage": "calendar" | "enriched" | "cache", "row": {...}}
+#   同一 (symbol, date) 可能先以 calendar 出现、补全后再以 enriched 出现，后到的覆盖先到的
+# {"type": "summary", "count": N, "buckets": {...}, "cached": bool, "elapsed": 秒}
+STREAM_BATCH = int(os.getenv("CALENDAR_STREAM_BATCH", "200"))   # 每批补全的 symbol 数
+
+
+def ndjson_writer(fp=None):
+    fp = fp or sys.stdout
+
+    def emit(record):
+        fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        fp.flush()
+    return emit
+
+
+def _emit_summary(emit, merged, t0, cached):
+    grouped = group_by_time(merged)
+    emit({
+        "type": "summary",
+        "count": len(merged),
+        "buckets": {k: len(v) for k, v in grouped.items()},
+        "cached": cached,
+        "elapsed": round(time.time() - t0, 2),
+    })
+
+
+def enrich_batches(grouped):
+    """补全顺序：今天 → 昨天 → 本周 → 本月，大桶再按 STREAM_BATCH 个 symbol 切批"""
+    for k in ("today", "yesterday", "thisWeek", "thisMonth"):
+        rows = grouped.get(k) or []
+        batch, syms = [], set()
+        for r in rows:
+            if r.get("symbol") not in syms and len(syms) >= STREAM_BATCH:
+                yield k, batch
+                batch, syms = [], set()
+            batch.append(r)
+            syms.add(r.get("symbol"))
+        if batch:
+            yield k, batch
+
+
+def stream_full(emit, mode=None):
+    """全量刷新，但日历一到就先输出，补全按日期由近到远分批输出"""
+    t0 = time.time()
+    today = datetime.now().date()
+    from_date = (today - timedelta(days=1)).strftime("%Y-%m-%d")
+    to_date = (today + timedelta(days=30)).strftime("%Y-%m-%d")
+
+    data = fetch_sources(from_date, to_date, mode)
+    answered = data is not None
+    data = data or []
+    log(f"📊 [stream] 日历 {len(data)} 条，用时 {time.time() - t0:.2f}s")
+    mock = not data
+    if mock:
+        # 与 fetch_full 相同的 mock 兜底；不再重新请求上游
+        log("⚠️ 所有数据源都无数据，使用 mock 数据")
+        data = mock_rows(today)
 
-    log(f"🧮 进入分组前数据量: {len(data)}")
     grouped = group_by_time(data)
-    log("💾 准备写入缓存文件 calendar_cache.json")
+    for k in grouped:
+        for r in grouped[k]:
+            emit({"type": "row", "stage": "calendar", "row": r})
 
+    for k, batch in enrich_batches(grouped):
+        enrich_yfinance(batch)
+        for r in batch:
+            emit({"type": "row", "stage": "enriched", "row": r})
+        log(f"📤 [stream] {k} 补全 {len(batch)} 条已输出")
 
-    # ✅ 转换成单一数组结构（适配前端）
     merged = []
     for k in grouped:
         merged.extend(grouped[k])
-
     cache_save(merged)
-    log(f"🏁 fetch_all() 结束，最终返回 {len(merged)} 条统一记录")
+    if answered and not mock:
+        seed_partitions(merged)
+    return merged
+
+
+def stream_all(emit, force=False, mode=None):
+    """流式版 fetch_all：有效缓存直接整批输出；否则持锁流式刷新，锁被占用就等对方结果"""
+    t0 = time.time()
+    if not force:
+        cache = cache_load()
+        if cache:
+            for r in cache:
+                emit({"type": "row", "stage": "cache", "row": r})
+            _emit_summary(emit, cache, t0, cached=True)
+            return cache
+
+    lock = FileLock(LOCK_FILE, stale=LOCK_STALE)
+    if not lock.acquire(timeout=0):
+        merged = refresh(mode=mode) or []
+        for r in merged:
+            emit({"type": "row", "stage": "cache", "row": r})
+        _emit_summary(emit, merged, t0, cached=True)
+        return merged
+    try:
+        merged = stream_full(emit, mode)
+    finally:
+        lock.release()
+    _emit_summary(emit, merged, t0, cached=False)
     return merged
 
 
 if __name__ == "__main__":
+    if "--stream" in sys.argv[1:]:
+        try:
+            stream_all(ndjson_writer(), force="--force" in sys.argv[1:])
+        except Exception as e:
+            print(json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False), flush=True)
+        sys.exit(0)
+
     try:
         print("✅ Python 脚本开始执行", file=sys.stderr)
-        merged = fetch_all()
+        argv = sys.argv[1:]
+        incremental = "--incremental" in argv or os.getenv("CALENDAR_INCREMENTAL") == "1"
+        mode = argv[argv.index("--mode") + 1] if "--mode" in argv[:-1] else None
+        if "--refresh" in argv:
+            # 后台刷新进程：不读缓存，持锁刷新；已有别的刷新在跑就直接退出
+            merged = refresh(incremental=incremental, mode=mode, wait=False) or []
+        else:
+            merged = fetch_all(force="--force" in argv, incremental=incremental, mode=mode)
         print("✅ fetch_all 完成", file=sys.stderr)
         print(json.dumps(merged, ensure_ascii=False))
     except Exception as e:
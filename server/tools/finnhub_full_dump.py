@@ -1,48 +1,268 @@
-import requests
+# server/tools/finnhub_full_dump.py
+"""
+Finnhub 财报日历批量归档
+
+把一段很长的日期区间（可以是好几年）切成按天 / 按周的分片，在 rate_limit 限速下并发拉取，
+失败的分片自动重试，结果按天写成 gzip 压缩的 NDJSON，之后的分析直接读本地归档，不再访问网络。
+
+finnhub_archive/
+    _manifest.json              {"shards": {"2024-01-01..2024-01-07": {...}}, "days": {"2024-01-01": 123}}
+    2024/2024-01-01.ndjson.gz   当天的原始记录，一行一条
+
+用法：
+    python finnhub_full_dump.py                                    # 默认窗口（前 2 天 ~ 后 30 天）
+    python finnhub_full_dump.py --from 2022-01-01 --to 2024-12-31 [--shard week|day] [--refetch]
+    python finnhub_full_dump.py --inspect [--from ... --to ...]    # 只读归档，打印字段画像
+
+已归档且区间早于今天的分片默认跳过（断点续拉）；包含今天或未来日期的分片每次都会重拉。
+单次返回条数达到 SPLIT_THRESHOLD 的周分片会自动拆成按天重拉，避免上游截断。
+"""
+import os
+import sys
+import gzip
 import json
+import time
+import asyncio
 from datetime import datetime, timedelta
 
-FINN_KEY = "d46d1epr01qgc9es8a40d46d1epr01qgc9es8a4g"
+import provider_client as pc
+from cache_io import atomic_write_json
+
+FINN_KEY = os.getenv("FINNHUB_KEY") or os.getenv("FINNHUB_TOKEN") or "d46d1epr01qgc9es8a40d46d1epr01qgc9es8a4g"
+BASE_URL = "https://finnhub.io/api/v1/calendar/earnings"
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.getenv("FINNHUB_ARCHIVE_DIR") or os.path.join(HERE, "..", "data", "finnhub_archive")
+MANIFEST = "_manifest.json"
+
+CONCURRENCY = int(os.getenv("FINNHUB_DUMP_CONCURRENCY", "8"))
+SHARD_RETRIES = int(os.getenv("FINNHUB_DUMP_RETRIES", "3"))
+SPLIT_THRESHOLD = int(os.getenv("FINNHUB_DUMP_SPLIT", "1500"))
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def day_str(d):
+    return d.strftime("%Y-%m-%d")
+
+
+def parse_day(s):
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+
+def make_shards(start, end, unit="week"):
+    """[start, end] 切成 (from, to) 分片；week 分片按 7 天切"""
+    step = 1 if unit == "day" else 7
+    shards = []
+    d = start
+    while d <= end:
+        e = min(end, d + timedelta(days=step - 1))
+        shards.append((day_str(d), day_str(e)))
+        d = e + timedelta(days=1)
+    return shards
+
+
+def shard_key(shard):
+    return f"{shard[0]}..{shard[1]}"
+
+
+# === 归档读写 ===
+def day_path(day, root=None):
+    return os.path.join(root or ARCHIVE_DIR, day[:4], f"{day}.ndjson.gz")
+
+
+def write_day(day, rows, root=None):
+    """原子写入当天分区（先写临时文件再 os.replace）"""
+    path = day_path(day, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_day(day, root=None):
+    path = day_path(day, root)
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
 
-def main():
-    today = datetime.now().date()
-    from_date = (today - timedelta(days=2)).strftime("%Y-%m-%d")
-    to_date = (today + timedelta(days=30)).strftime("%Y-%m-%d")
 
-    url = f"https://finnhub.io/api/v1/calendar/earnings?from={from_date}&to={to_date}&token={FINN_KEY}"
-    print(f"📅 Fetching: {url}")
+def iter_archive(from_date=None, to_date=None, root=None):
+    """按日期顺序逐条读出归档记录（流式，不整体载入内存）"""
+    manifest = load_manifest(root)
+    for day in sorted(manifest["days"]):
+        if (from_date and day < from_date) or (to_date and day > to_date):
+            continue
+        path = day_path(day, root)
+        if not os.path.exists(path):
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
 
+
+def load_manifest(root=None):
+    path = os.path.join(root or ARCHIVE_DIR, MANIFEST)
     try:
-        r = requests.get(url, timeout=20)
-        print(f"🔗 HTTP 状态码: {r.status_code}")
-        if r.status_code != 200:
-            print("❌ 请求失败:", r.text[:300])
-            return
-
-        data = r.json()
-        if "earningsCalendar" not in data:
-            print("⚠️ 无 earningsCalendar 字段, 实际返回:")
-            print(json.dumps(data, indent=2, ensure_ascii=False))
-            return
-
-        items = data["earningsCalendar"]
-        print(f"✅ 拿到 {len(items)} 条记录")
-        print("\n🧾 前 10 条原始数据结构:")
-        for i, d in enumerate(items[:10]):
-            print(f"\n{i+1}. {json.dumps(d, indent=2, ensure_ascii=False)}")
-
-        # === 检查所有键出现频率 ===
-        key_count = {}
-        for d in items:
-            for k in d.keys():
-                key_count[k] = key_count.get(k, 0) + 1
-
-        print("\n📊 字段出现频率统计:")
-        for k, v in sorted(key_count.items(), key=lambda x: -x[1]):
-            print(f"{k:<25} {v} 次")
-
-    except Exception as e:
-        print("❌ 出错:", e)
+        with open(path, "r", encoding="utf-8") as f:
+            m = json.load(f)
+    except Exception:
+        m = {}
+    m.setdefault("shards", {})
+    m.setdefault("days", {})
+    return m
+
+
+def save_manifest(manifest, root=None):
+    atomic_write_json(os.path.join(root or ARCHIVE_DIR, MANIFEST), manifest, ensure_ascii=False, indent=1)
+
+
+# === 拉取 ===
+async def fetch_shard(shard):
+    """返回记录列表；失败抛异常（由调用方重试）"""
+    url = f"{BASE_URL}?from={shard[0]}&to={shard[1]}&token={FINN_KEY}"
+    resp = await pc.client().get("finnhub", url, timeout=30)
+    if not resp.ok:
+        raise RuntimeError(resp.error or f"HTTP {resp.status}")
+    if not isinstance(resp.data, dict) or "earningsCalendar" not in resp.data:
+        raise RuntimeError(f"unexpected payload: {str(resp.data)[:200]}")
+    return resp.data["earningsCalendar"] or []
+
+
+async def fetch_with_retry(shard, sem):
+    async with sem:
+        for attempt in range(SHARD_RETRIES + 1):
+            try:
+                return await fetch_shard(shard)
+            except Exception as e:
+                if attempt >= SHARD_RETRIES:
+                    raise
+                wait = 2 ** attempt
+                log(f"⚠️ 分片 {shard_key(shard)} 失败（{e}），{wait}s 后重试 {attempt + 1}/{SHARD_RETRIES}")
+                await asyncio.sleep(wait)
+
+
+def store_shard(shard, rows, manifest, root=None):
+    """按天拆开写入；分片内没有记录的天写成 0 条"""
+    by_day = {}
+    for r in rows:
+        if r.get("date"):
+            by_day.setdefault(r["date"][:10], []).append(r)
+    d, end = parse_day(shard[0]), parse_day(shard[1])
+    while d <= end:
+        day = day_str(d)
+        day_rows = by_day.get(day, [])
+        if day_rows:
+            write_day(day, day_rows, root)
+        elif os.path.exists(day_path(day, root)):
+            os.remove(day_path(day, root))
+        manifest["days"][day] = len(day_rows)
+        d += timedelta(days=1)
+
+
+async def archive(start, end, unit="week", refetch=False, root=None):
+    """拉取 [start, end] 并写入归档；返回统计信息"""
+    manifest = load_manifest(root)
+    today = day_str(datetime.now().date())
+
+    def pending(s):
+        return refetch or s[1] >= today or manifest["shards"].get(shard_key(s), {}).get("status") != "ok"
+
+    shards = []
+    for s in make_shards(start, end, unit):
+        if manifest["shards"].get(shard_key(s), {}).get("status") == "split" and not refetch:
+            # 之前已拆成按天拉取的分片：只补没完成的天
+            shards.extend(d for d in make_shards(parse_day(s[0]), parse_day(s[1]), "day") if pending(d))
+        elif pending(s):
+            shards.append(s)
+    log(f"📦 {day_str(start)} → {day_str(end)}：{unit} 分片，待拉取 {len(shards)} 个")
+
+    sem = asyncio.Semaphore(CONCURRENCY)
+    stats = {"shards": 0, "rows": 0, "failed": [], "split": 0}
+    t0 = time.time()
+    queue = list(shards)
+
+    while queue:
+        batch, queue = queue, []
+        results = await asyncio.gather(*(fetch_with_retry(s, sem) for s in batch), return_exceptions=True)
+        for shard, rows in zip(batch, results):
+            key = shard_key(shard)
+            if isinstance(rows, Exception):
+                log(f"❌ 分片 {key} 最终失败: {rows}")
+                manifest["shards"][key] = {"status": "failed", "error": str(rows), "at": time.time()}
+                stats["failed"].append(key)
+                continue
+            if len(rows) >= SPLIT_THRESHOLD and shard[0] != shard[1]:
+                # 可能被上游截断：拆成按天重拉
+                log(f"✂️ 分片 {key} 返回 {len(rows)} 条，拆成按天重拉")
+                queue.extend(make_shards(parse_day(shard[0]), parse_day(shard[1]), "day"))
+                manifest["shards"][key] = {"status": "split", "count": len(rows), "at": time.time()}
+                stats["split"] += 1
+                continue
+            store_shard(shard, rows, manifest, root)
+            manifest["shards"][key] = {"status": "ok", "count": len(rows), "at": time.time()}
+            stats["shards"] += 1
+            stats["rows"] += len(rows)
+        save_manifest(manifest, root)
+        if stats["shards"]:
+            log(f"⏳ 已完成 {stats['shards']} 个分片，{stats['rows']} 条，用时 {time.time() - t0:.1f}s")
+
+    stats["elapsed"] = round(time.time() - t0, 2)
+    return stats
+
+
+def inspect(from_date=None, to_date=None, root=None):
+    """只读归档：各字段出现率 / 空值率 / 类型 / 取值范围（见 schema_profile）"""
+    import schema_profile
+
+    profile = schema_profile.Profile()
+    for d in iter_archive(from_date, to_date, root):
+        profile.add("finnhub", d)
+    schema_profile.print_table(profile.report())
+
+
+def parse_args(argv):
+    opts = {"from": None, "to": None, "shard": "week", "refetch": False, "inspect": False}
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a in ("--from", "--to", "--shard"):
+            opts[a[2:]] = argv[i + 1]
+            i += 2
+            continue
+        if a == "--refetch":
+            opts["refetch"] = True
+        elif a == "--inspect":
+            opts["inspect"] = True
+        i += 1
+    return opts
+
+
+def main():
+    opts = parse_args(sys.argv[1:])
+    if opts["inspect"]:
+        inspect(opts["from"], opts["to"])
+        return
+
+    today = datetime.now().date()
+    start = parse_day(opts["from"]) if opts["from"] else today - timedelta(days=2)
+    end = parse_day(opts["to"]) if opts["to"] else today + timedelta(days=30)
+    stats = pc.run(archive(start, end, unit=opts["shard"], refetch=opts["refetch"]))
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    if stats["failed"]:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,413 @@
+# server/tools/fundamentals_snapshot.py
+"""
+个股基本面快照：把 test_yfinance_all_aapl.py 里逐个打印的 yfinance 数据块并发拉取并落地，详情页直接读本地
+
+fundamentals/
+    AAPL.zip
+        _index.json          {"info": {"fetched_at", "checked_at", "error", "bytes"}, ...}
+        info.json            每个数据块一个成员（DataFrame 存成 {"type": "frame", "columns", "index", "data"}）
+        history_1y.json
+        ...
+
+- 每个数据块有自己的刷新周期（SECTIONS 里的 ttl），build() 只拉到期的块；失败的块保留旧数据，
+  ERROR_RETRY 秒后再试；空结果也落地（null），到期前不重复请求
+- 多个 symbol × 多个数据块一起进线程池（SNAPSHOT_WORKERS），共享 yf_enrich 的 Yahoo host 并发上限；
+  同一 symbol 的块全部完成后一次性写回 bundle（原子替换，FileLock 防多进程同时写）
+- 读取按需：Bundle 打开时只读 _index.json，section() 用到哪个块才解压哪个成员
+
+命令行：
+    python fundamentals_snapshot.py build AAPL MSFT [--sections info,news] [--force]
+    python fundamentals_snapshot.py status AAPL MSFT
+    python fundamentals_snapshot.py show AAPL [section]
+"""
+import os
+import re
+import sys
+import json
+import time
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_io import FileLock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.getenv("FUNDAMENTALS_DIR") or os.path.join(HERE, "..", "data", "fundamentals")
+WORKERS = int(os.getenv("SNAPSHOT_WORKERS", "16"))
+ERROR_RETRY = int(os.getenv("SNAPSHOT_ERROR_RETRY", str(60 * 60)))   # 失败的块 1 小时后再试
+INDEX = "_index.json"
+# symbol 直接拼进 bundle 文件名，只接受这些字符（防路径穿越）
+SYMBOL_RE = re.compile(r"^[A-Z0-9.\-^=]{1,15}$")
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+# === 数据块：名称 -> (取数函数, 刷新周期) ===
+def _options_chain(tk):
+    expiries = list(tk.options or [])
+    if not expiries:
+        return None
+    chain = tk.option_chain(expiries[0])
+    return {"expiration": expiries[0], "calls": to_jsonable(chain.calls), "puts": to_jsonable(chain.puts)}
+
+
+def _history_1y(tk):
+    # 读本地行情库；增量更新由 build() 在进线程池之前对所有 symbol 批量做一次（price_store.update）。
+    # 注意和原来的 tk.history(period="1y") 不同：这里是未复权的 Open/High/Low/Close/Volume，
+    # 没有 Dividends / Stock Splits 列（分红、拆股见 dividends / splits 两个块）
+    import price_store
+
+    return price_store.history(tk.ticker, days=365, refresh=False)
+
+
+SECTIONS = {
+    "info": (lambda tk: tk.info, DAY),
+    "history_1y": (_history_1y, 6 * HOUR),
+    "dividends": (lambda tk: tk.dividends, 7 * DAY),
+    "splits": (lambda tk: tk.splits, 7 * DAY),
+    "financials": (lambda tk: tk.financials, 7 * DAY),
+    "quarterly_financials": (lambda tk: tk.quarterly_financials, DAY),
+    "balance_sheet": (lambda tk: tk.balance_sheet, 7 * DAY),
+    "quarterly_balance_sheet": (lambda tk: tk.quarterly_balance_sheet, DAY),
+    "cashflow": (lambda tk: tk.cashflow, 7 * DAY),
+    "quarterly_cashflow": (lambda tk: tk.quarterly_cashflow, DAY),
+    "earnings_dates": (lambda tk: tk.earnings_dates, DAY),
+    "major_holders": (lambda tk: tk.major_holders, 7 * DAY),
+    "institutional_holders": (lambda tk: tk.institutional_holders, 7 * DAY),
+    "mutualfund_holders": (lambda tk: tk.mutualfund_holders, 7 * DAY),
+    "recommendations": (lambda tk: tk.recommendations, DAY),
+    "upgrades_downgrades": (lambda tk: tk.upgrades_downgrades, DAY),
+    "earnings_forecasts": (lambda tk: getattr(tk, "earnings_estimate", None), DAY),
+    "revenue_forecasts": (lambda tk: getattr(tk, "revenue_estimate", None), DAY),
+    "calendar": (lambda tk: tk.calendar, 12 * HOUR),
+    "isin": (lambda tk: tk.isin, 30 * DAY),
+    "news": (lambda tk: tk.news, HOUR),
+    "options": (lambda tk: list(tk.options or []), 6 * HOUR),
+    "option_chain": (_options_chain, HOUR),
+}
+
+
+def to_jsonable(obj):
+    """DataFrame / Series / numpy 标量 / 时间戳 -> 可 JSON 序列化的结构（NaN 变 null）"""
+    if obj is None or isinstance(obj, (str, bool, int)):
+        return obj
+    if isinstance(obj, float):
+        return None if obj != obj or obj in (float("inf"), float("-inf")) else obj
+    to_json = getattr(obj, "to_json", None)
+    if to_json is not None and hasattr(obj, "index"):
+        data = json.loads(to_json(orient="split", date_format="iso", default_handler=str))
+        data["type"] = "frame" if hasattr(obj, "columns") else "series"
+        return data
+    if isinstance(obj, dict):
+        return {str(k): to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set)):
+        return [to_jsonable(v) for v in obj]
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if hasattr(obj, "item"):   # numpy 标量
+        return to_jsonable(obj.item())
+    return str(obj)
+
+
+def is_empty(v):
+    return v is None or v == [] or v == {} or (isinstance(v, dict) and v.get("type") in ("frame", "series")
+                                               and not v.get("data"))
+
+
+def as_frame(section):
+    """把 {"type": "frame", ...} 还原成 pandas DataFrame（需要时才 import pandas）"""
+    import pandas as pd
+
+    if not isinstance(section, dict) or section.get("type") not in ("frame", "series"):
+        return section
+    if section["type"] == "series":
+        return pd.Series(section.get("data"), index=section.get("index"), name=section.get("name"))
+    return pd.DataFrame(section.get("data"), index=section.get("index"), columns=section.get("columns"))
+
+
+# === bundle 读写 ===
+def bundle_path(symbol, root=None):
+    sym = str(symbol).strip().upper()
+    if not SYMBOL_RE.match(sym):
+        raise ValueError(f"invalid symbol: {symbol!r}")
+    return os.path.join(root or SNAPSHOT_DIR, f"{sym}.zip")
+
+
+class Bundle:
+    """按需读取：打开时只读索引，section() 时才解压对应成员"""
+
+    def __init__(self, symbol, root=None):
+        self.symbol = symbol.upper()
+        self.path = bundle_path(self.symbol, root)
+        self.index = {}
+        self._cache = {}
+        if os.path.exists(self.path):
+            try:
+                with zipfile.ZipFile(self.path) as z:
+                    self.index = json.loads(z.read(INDEX))
+            except (zipfile.BadZipFile, KeyError, ValueError) as e:
+                log(f"⚠️ [snapshot] {self.symbol} bundle 损坏，忽略: {e}")
+
+    def sections(self):
+        return sorted(k for k, v in self.index.items() if "fetched_at" in v)
+
+    def age(self, name, now=None):
+        meta = self.index.get(name) or {}
+        if "fetched_at" not in meta:
+            return None
+        return (now or time.time()) - meta["fetched_at"]
+
+    def due(self, name, now=None):
+        now = now or time.time()
+        meta = self.index.get(name) or {}
+        if meta.get("error") and now - meta.get("checked_at", 0) < ERROR_RETRY:
+            return False
+        age = self.age(name, now)
+        return age is None or age >= SECTIONS[name][1]
+
+    def section(self, name):
+        if name in self._cache:
+            return self._cache[name]
+        if name not in self.index or "fetched_at" not in self.index[name]:
+            return None
+        with zipfile.ZipFile(self.path) as z:
+            value = json.loads(z.read(f"{name}.json"))
+        self._cache[name] = value
+        return value
+
+    def status(self, now=None):
+        now = now or time.time()
+        out = {}
+        for name in SECTIONS:
+            meta = self.index.get(name) or {}
+            out[name] = {"age": None if self.age(name, now) is None else round(self.age(name, now)),
+                         "due": self.due(name, now), "error": meta.get("error"), "bytes": meta.get("bytes")}
+        return out
+
+
+def save(symbol, updates, root=None, now=None):
+    """
+    updates: {section: ("ok", value) | ("error", message)}
+    与现有 bundle 合并后原子写回；返回新的索引
+    """
+    now = now or time.time()
+    path = bundle_path(symbol, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with FileLock(path + ".lock", stale=120, poll=0.05):
+        old = Bundle(symbol, root)
+        index = dict(old.index)
+        members = {}
+        for name, (status, value) in updates.items():
+            meta = dict(index.get(name) or {})
+            meta["checked_at"] = now
+            if status == "ok":
+                members[name] = json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+                meta.update({"fetched_at": now, "error": None, "bytes": len(members[name]), "empty": is_empty(value)})
+            else:
+                meta["error"] = value
+            index[name] = meta
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        keep = [n for n, meta in index.items() if n not in members and "fetched_at" in meta]
+        try:
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as z:
+                z.writestr(INDEX, json.dumps(index, ensure_ascii=False))
+                for name, data in members.items():
+                    z.writestr(f"{name}.json", data)
+                if keep:
+                    # 没更新的块原样拷贝（不解析 JSON）
+                    with zipfile.ZipFile(old.path) as src:
+                        for name in keep:
+                            z.writestr(f"{name}.json", src.read(f"{name}.json"))
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return index
+
+
+# === 并发构建 ===
+def plan(symbols, sections=None, force=False, root=None, now=None):
+    """返回 [(symbol, [到期的块])]；negative_cache 里记为无效的 symbol 跳过"""
+    import negative_cache
+
+    names = [s for s in (sections or SECTIONS) if s in SECTIONS]
+    symbols = [s.strip().upper() for s in symbols if s and s.strip()]
+    bad = [s for s in symbols if not SYMBOL_RE.match(s)]
+    if bad:
+        log(f"⚠️ [snapshot] 非法 symbol，跳过: {', '.join(bad)}")
+        symbols = [s for s in symbols if s not in bad]
+    skipped = negative_cache.blocked("yf_snapshot", symbols)
+    if skipped:
+        log(f"🚫 [snapshot] {len(skipped)} 支 symbol 已记为无效，跳过: {', '.join(sorted(skipped))}")
+    out = []
+    for sym in dict.fromkeys(symbols):
+        if sym in skipped:
+            continue
+        b = Bundle(sym, root)
+        due = names if force else [n for n in names if b.due(n, now)]
+        if due:
+            out.append((sym, due))
+    return out
+
+
+def build(symbols, sections=None, force=False, workers=None, root=None, on_symbol=None):
+    """
+    并发拉取各 symbol 到期的数据块并写回 bundle。
+    on_symbol(symbol, index): 某个 symbol 的块全部完成、写盘之后回调
+    返回 {"symbols", "sections", "failed", "elapsed"}
+    """
+    import yfinance as yf
+    import negative_cache
+    from yf_enrich import host_slot, YAHOO_HOST
+
+    jobs = plan(symbols, sections, force, root)
+    total = sum(len(due) for _, due in jobs)
+    log(f"📦 [snapshot] {len(jobs)} 支 symbol，{total} 个数据块到期")
+    if not jobs:
+        return {"symbols": 0, "sections": 0, "failed": 0, "elapsed": 0.0}
+
+    slot = host_slot(YAHOO_HOST)
+    # history_1y 读本地行情库：先把所有要用的 symbol 合并成一次批量 yf.download 增量更新，
+    # 避免线程池里每个 symbol 各自下载
+    history_syms = [sym for sym, due in jobs if "history_1y" in due]
+    if history_syms:
+        import price_store
+
+        try:
+            with slot:
+                price_store.update(history_syms)
+        except Exception as e:
+            log(f"⚠️ [snapshot] 行情批量更新失败，history_1y 使用本地已有数据: {e}")
+    lock = threading.Lock()
+    tickers = {sym: yf.Ticker(sym) for sym, _ in jobs}
+    pending = {sym: len(due) for sym, due in jobs}
+    results = {sym: {} for sym, _ in jobs}
+    stats = {"failed": 0}
+    t0 = time.time()
+
+    def task(sym, name):
+        try:
+            with slot:
+                value = to_jsonable(SECTIONS[name][0](tickers[sym]))
+            outcome = ("ok", value)
+        except Exception as e:
+            outcome = ("error", str(e)[:300])
+        with lock:
+            results[sym][name] = outcome
+            if outcome[0] == "error":
+                stats["failed"] += 1
+            pending[sym] -= 1
+            finished = pending[sym] == 0
+        if finished:
+            _finish(sym)
+
+    def _finish(sym):
+        updates = results.pop(sym)
+        try:
+            index = save(sym, updates, root)
+        except Exception as e:
+            log(f"❌ [snapshot] {sym} 写入失败: {e}")
+            return
+        status, value = updates.get("info", (None, None))
+        kind = negative_cache.error_kind(value) if status == "error" else None
+        if kind:
+            negative_cache.mark("yf_snapshot", sym, kind, value[:200])
+        if on_symbol:
+            on_symbol(sym, index)
+
+    with ThreadPoolExecutor(max_workers=workers or WORKERS) as pool:
+        # 按数据块交错提交：先提交所有 symbol 的第 1 块（info），再第 2 块……慢块（option_chain 等）排在后面
+        for i in range(max(len(due) for _, due in jobs)):
+            for sym, due in jobs:
+                if i < len(due):
+                    pool.submit(task, sym, due[i])
+
+    elapsed = round(time.time() - t0, 2)
+    log(f"✅ [snapshot] 完成 {len(jobs)} 支 / {total} 块，失败 {stats['failed']}，用时 {elapsed}s")
+    return {"symbols": len(jobs), "sections": total, "failed": stats["failed"], "elapsed": elapsed}
+
+
+def load(symbol, sections=None, root=None):
+    """详情页读取：{"symbol", "sections": {name: value}, "status": {...}}；只解压请求的块"""
+    b = Bundle(symbol, root)
+    names = sections or b.sections()
+    return {"symbol": b.symbol, "sections": {n: b.section(n) for n in names if n in SECTIONS},
+            "status": {n: v for n, v in b.status().items() if n in names}}
+
+
+# 后台刷新中的 (symbol, 块)：详情页连续请求时不重复起刷新线程
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh(symbol, names):
+    try:
+        build([symbol], names)
+    except Exception as e:
+        log(f"⚠️ [snapshot] {symbol} 后台刷新失败: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.difference_update((symbol, n) for n in names)
+
+
+def serve(symbol, sections=None):
+    """
+    详情页入口（常驻 worker 里调用）：从没拉过的块同步拉取；已有但过期的块先返回旧数据，后台线程刷新
+    （同一 symbol 的同一块已经在后台刷新时不再重复提交）
+    """
+    names = [n for n in (sections or SECTIONS) if n in SECTIONS]
+    b = Bundle(symbol)
+    missing = [n for n in names if b.age(n) is None and b.due(n)]
+    if missing:
+        build([symbol], missing)
+        b = Bundle(symbol)
+    stale = [n for n in names if n not in missing and b.due(n)]
+    with _refreshing_lock:
+        stale = [n for n in stale if (b.symbol, n) not in _refreshing]
+        _refreshing.update((b.symbol, n) for n in stale)
+    if stale:
+        threading.Thread(target=_refresh, args=(b.symbol, stale), daemon=True).start()
+    return load(symbol, names)
+
+
+def parse_args(argv):
+    opts = {"symbols": [], "sections": None, "force": False}
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a == "--sections" and i + 1 < len(argv):
+            opts["sections"] = argv[i + 1].split(",")
+            i += 2
+            continue
+        if a == "--force":
+            opts["force"] = True
+        else:
+            opts["symbols"].append(a)
+        i += 1
+    return opts
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if len(argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    cmd, opts = argv[0], parse_args(argv[1:])
+    if cmd == "build":
+        result = build(opts["symbols"], opts["sections"], force=opts["force"])
+    elif cmd == "status":
+        result = {s.upper(): Bundle(s).status() for s in opts["symbols"]}
+    elif cmd == "show":
+        sym, rest = opts["symbols"][0], opts["symbols"][1:]
+        result = load(sym, rest or None)
+    else:
+        print(json.dumps({"error": f"unknown command: {cmd}"}, ensure_ascii=False))
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
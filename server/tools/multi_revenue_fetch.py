@@ -3,9 +3,12 @@ import os
 import sys
 import json
 import time
-import requests
 from datetime import datetime, timedelta
 
+import negative_cache
+import profile_store
+from cache_io import atomic_write_json, read_json
+
 # ✅ Key 读取（保留你的默认值）
 FMP_KEY = os.getenv("FMP_API_KEY", "z1m4vMNiLtZ1oXbdGJIulSpbMxGfLqvx")
 FINN_KEY = os.getenv("FINNHUB_KEY", "d46d1epr01qgc9es8a40d46d1epr01qgc9es8a4g")
@@ -14,6 +17,11 @@ FINN_KEY = os.getenv("FINNHUB_KEY", "d46d1epr01qgc9es8a40d46d1epr01qgc9es8a4g")
 CACHE_FILE = "calendar_cache.json"
 CACHE_TTL = 60 * 30  # 30分钟
 
+# 二次补齐的字段；FMP 多 symbol 接口每批最多 FMP_BATCH_SIZE 个代码
+PROFILE_FIELDS = ("price", "marketCap", "sector")
+QUOTE_FIELDS = {"price", "marketCap"}   # 只缺这些时用更轻的 /quote，缺 sector 才用 /profile
+BATCH_SIZE = int(os.getenv("FMP_BATCH_SIZE", "50"))
+
 def log(msg):
     sys.stderr.write(msg + "\n")
     sys.stderr.flush()
@@ -31,27 +39,33 @@ def safe_num(v):
         return None
 
 def cache_load():
-    if os.path.exists(CACHE_FILE):
-        if time.time() - os.path.getmtime(CACHE_FILE) < CACHE_TTL:
-            try:
-                return json.load(open(CACHE_FILE, "r", encoding="utf-8"))
-            except:
-                pass
+    data, age = read_json(CACHE_FILE)
+    if data and age < CACHE_TTL:
+        return data
     return None
 
 def cache_save(data):
-    json.dump(data, open(CACHE_FILE, "w", encoding="utf-8"), indent=2, ensure_ascii=False)
+    atomic_write_json(CACHE_FILE, data, indent=2, ensure_ascii=False)
 
 # === 上游数据 ===
 def fetch_fmp(from_date, to_date):
+    import provider_client as pc
+
+    return pc.run(afetch_fmp(from_date, to_date))
+
+async def afetch_fmp(from_date, to_date):
+    import provider_client as pc
+
     url = f"https://financialmodelingprep.com/api/v3/earning_calendar?from={from_date}&to={to_date}&apikey={FMP_KEY}"
     log(f"📅 Fetching FMP: {url}")
-    r = requests.get(url, timeout=15)
-    if r.status_code != 200:
-        log(f"❌ FMP Error {r.status_code}")
+    r = await pc.client().get("fmp", url, timeout=15)
+    if r.status != 200:
+        log(f"❌ FMP Error {r.status or r.error}")
         return []
     try:
-        data = r.json()
+        if r.error:
+            raise ValueError(r.error)
+        data = r.data
         if not isinstance(data, list):
             return []
         out = []
@@ -75,14 +89,23 @@ def fetch_fmp(from_date, to_date):
         return []
 
 def fetch_finnhub(from_date, to_date):
+    import provider_client as pc
+
+    return pc.run(afetch_finnhub(from_date, to_date))
+
+async def afetch_finnhub(from_date, to_date):
+    import provider_client as pc
+
     url = f"https://finnhub.io/api/v1/calendar/earnings?from={from_date}&to={to_date}&token={FINN_KEY}"
     log(f"📅 Fetching Finnhub: {url}")
-    r = requests.get(url, timeout=15)
-    if r.status_code != 200:
-        log(f"❌ Finnhub Error {r.status_code}")
+    r = await pc.client().get("finnhub", url, timeout=15)
+    if r.status != 200:
+        log(f"❌ Finnhub Error {r.status or r.error}")
         return []
     try:
-        data = r.json()
+        if r.error:
+            raise ValueError(r.error)
+        data = r.data
         items = data.get("earningsCalendar", [])
         out = []
         for d in items:
@@ -105,23 +128,83 @@ def fetch_finnhub(from_date, to_date):
         return []
 
 # === 二次补齐：公司概况 ===
-def fetch_profile(symbol):
-    # FMP profile（含 sector / price / mktCap）
-    url = f"https://financialmodelingprep.com/api/v3/profile/{symbol}?apikey={FMP_KEY}"
-    try:
-        r = requests.get(url, timeout=10)
-        if r.status_code == 200:
-            j = r.json()
-            if isinstance(j, list) and len(j) > 0:
-                p = j[0]
-                return {
-                    "price": safe_num(p.get("price")),
-                    "marketCap": safe_num(p.get("mktCap")),
-                    "sector": p.get("sector") or None,
-                }
-    except Exception as e:
-        log(f"⚠️ profile fetch fail {symbol}: {e}")
-    return {}
+def _missing(v):
+    return v is None or v == "" or v == "N/A"
+
+def plan_gaps(rows, cache):
+    """
+    补齐计划：{symbol: {字段}}，只包含日历行里缺、profile_store 里也没有新鲜值的 (symbol, 字段)。
+    上游日历已经带了的字段、profile_store 里记为已知为空的字段（cache 里值为 None）都不再去查。
+    """
+    gaps = {}
+    for r in rows:
+        sym = r.get("symbol")
+        if not sym:
+            continue
+        have = cache.get(sym, {})
+        need = [f for f in PROFILE_FIELDS if _missing(r.get(f)) and f not in have]
+        if need:
+            gaps.setdefault(sym, set()).update(need)
+    return gaps
+
+def plan_batches(gaps):
+    """按缺的字段选接口并切批：[(endpoint, [symbols])]；negative_cache 里未到重查时间的跳过"""
+    by_endpoint = {"profile": [], "quote": []}
+    for sym, fields in sorted(gaps.items()):
+        by_endpoint["quote" if fields <= QUOTE_FIELDS else "profile"].append(sym)
+    batches = []
+    for endpoint, syms in by_endpoint.items():
+        skipped = negative_cache.blocked(f"fmp_{endpoint}", syms)
+        if skipped:
+            log(f"🚫 fmp_{endpoint}: {len(skipped)} 支近期无数据，未到重查时间，跳过")
+        syms = [s for s in syms if s.upper() not in skipped]
+        batches += [(endpoint, syms[i:i + BATCH_SIZE]) for i in range(0, len(syms), BATCH_SIZE)]
+    return batches
+
+async def afetch_batch(endpoint, symbols):
+    """FMP 多 symbol 接口（/profile/A,B,C 或 /quote/A,B,C）；请求失败返回 None"""
+    import provider_client as pc
+
+    url = f"https://financialmodelingprep.com/api/v3/{endpoint}/{','.join(symbols)}?apikey={FMP_KEY}"
+    r = await pc.client().get("fmp", url, timeout=15)
+    if not r.ok or not isinstance(r.data, list):
+        log(f"⚠️ FMP {endpoint} 批量失败（{len(symbols)} 支）: {r.error or r.status}")
+        return None
+    out = {}
+    for p in r.data:
+        sym = p.get("symbol")
+        if not sym:
+            continue
+        prof = {
+            "price": safe_num(p.get("price")),
+            "marketCap": safe_num(p.get("mktCap") if endpoint == "profile" else p.get("marketCap")),
+        }
+        if endpoint == "profile":
+            prof["sector"] = p.get("sector") or None
+        out[sym.upper()] = prof
+    return out
+
+async def afetch_gaps(gaps):
+    """并发执行全部批次，返回 {symbol: {字段: 值}}"""
+    import asyncio
+
+    batches = plan_batches(gaps)
+    if not batches:
+        return {}
+    t0 = time.time()
+    results = await asyncio.gather(*(afetch_batch(ep, syms) for ep, syms in batches))
+    fetched = {}
+    for (endpoint, syms), out in zip(batches, results):
+        if out is None:
+            continue  # 请求失败不记 negative_cache，下次照常重试
+        for sym in syms:
+            prof = out.get(sym.upper())
+            has_data = bool(prof) and any(v is not None for v in prof.values())
+            negative_cache.observe(f"fmp_{endpoint}", sym, has_data, reason=None if prof else "not in batch")
+            if prof:
+                fetched[sym] = prof
+    log(f"✅ FMP 批量补齐：{len(batches)} 批，{len(fetched)} 支有数据，用时 {time.time() - t0:.2f}s")
+    return fetched
 
 def group_by_time(rows):
     today = datetime.now().date()
@@ -153,6 +236,9 @@ def fetch_all():
         log("📁 Using cached result.")
         return cached
 
+    # 缓存未命中才加载 HTTP 客户端（asyncio / httpx），命中路径只用标准库
+    import provider_client as pc
+
     # 1) 主列表
     today = datetime.now().date()
     from_date = (today - timedelta(days=1)).strftime("%Y-%m-%d")
@@ -170,11 +256,16 @@ def fetch_all():
             {"symbol": "NVDA", "date": (today + timedelta(days=5)).strftime("%Y-%m-%d"), "eps": 1.05, "revenue": 4.6e10, "time": "After Close", "source": "Mock"},
         ]
 
-    # 2) 二次补齐：仅对缺失字段调用 profile，控制请求量
+    # 2) 二次补齐：只查日历和 profile_store 都没有的 (symbol, 字段)，按接口分批并发拉取
     symbols = sorted({r["symbol"] for r in rows if r.get("symbol")})
-    profile_cache = {}
-    for sym in symbols:
-        profile_cache[sym] = fetch_profile(sym)
+    profile_cache = profile_store.get_many(symbols, include_empty=True)   # 已知为空的字段也不再查
+    gaps = plan_gaps(rows, profile_cache)
+    pairs = sum(len(f) for f in gaps.values())
+    log(f"📁 缺失字段 {pairs} 个，涉及 {len(gaps)}/{len(symbols)} 支，其余由日历或 profile 缓存提供")
+    fetched = pc.run(afetch_gaps(gaps))
+    profile_store.put_many(fetched, source="fmp")
+    for sym, prof in fetched.items():
+        profile_cache.setdefault(sym, {}).update({k: v for k, v in prof.items() if v is not None})
 
     for r in rows:
         prof = profile_cache.get(r["symbol"], {})
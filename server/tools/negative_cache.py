@@ -0,0 +1,202 @@
+# server/tools/negative_cache.py
+"""
+空结果缓存：上游查不到数据的 symbol 按指数退避间隔再查，不再每次刷新都走完整条慢路径
+
+两类记录：
+- nodata：某个 scope（数据源 / 接口，如 "yf_info"、"yf_revenue"、"fmp_profile"）对这个 symbol 返回空，
+  只影响这个 scope，其他源照常查
+- invalid：symbol 本身无效（上游明确说退市 / 代码无效），记在 scope "*" 下，所有 scope 都跳过；
+  单纯的 404 / "not found" 也可能是 Yahoo 临时故障（crumb 失效等），只按 nodata 记在当前 scope
+
+第 n 次连续为空后，下次重查时间 = 基础间隔 × 2^(n-1)，上限 NEGCACHE_MAX_DAYS：
+    nodata  基础 NEGCACHE_NODATA_HOURS（默认 6 小时）→ 6h, 12h, 1d, 2d ...
+    invalid 基础 NEGCACHE_INVALID_HOURS（默认 24 小时）→ 1d, 2d, 4d ...
+只记录"上游正常返回但没有数据"；超时、限流、网络错误不记，避免一次故障把好 symbol 拉黑。
+任何一次查到数据就清掉该 symbol 在这个 scope（以及 "*"）下的记录。
+
+- 底层 SQLite（WAL），多进程共享；NEGCACHE=0 关闭（blocked 永远为空，mark 不写）
+
+命令行：
+    python negative_cache.py list [scope]
+    python negative_cache.py check yf_info MGRM VENU
+    python negative_cache.py clear MGRM [scope]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv("NEGCACHE_DB") or os.path.join(HERE, "..", "data", "negative_cache.db")
+
+ENABLED = os.getenv("NEGCACHE", "1") == "1"
+BASE = {
+    "nodata": float(os.getenv("NEGCACHE_NODATA_HOURS", "6")) * 3600,
+    "invalid": float(os.getenv("NEGCACHE_INVALID_HOURS", "24")) * 3600,
+}
+MAX_INTERVAL = float(os.getenv("NEGCACHE_MAX_DAYS", "30")) * 86400
+ANY = "*"
+
+# 上游报错信息里出现这些字样时视为 symbol 无效（而不是临时故障）
+INVALID_HINTS = ("delisted", "invalid symbol", "no such ticker")
+# 这些只说明这个接口这次没查到，可能是临时故障：只记本 scope 的 nodata
+NODATA_HINTS = ("404", "not found", "no data found")
+
+_local = threading.local()
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS negative (
+                scope    TEXT NOT NULL,
+                symbol   TEXT NOT NULL,
+                kind     TEXT NOT NULL,
+                failures INTEGER NOT NULL,
+                first_at REAL NOT NULL,
+                last_at  REAL NOT NULL,
+                next_at  REAL NOT NULL,
+                reason   TEXT,
+                PRIMARY KEY (scope, symbol)
+            )
+        """)
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def interval(kind, failures):
+    """第 failures 次连续为空之后的重查间隔（秒）"""
+    return min(BASE.get(kind, BASE["nodata"]) * 2 ** max(failures - 1, 0), MAX_INTERVAL)
+
+
+def is_invalid_error(err):
+    msg = str(err).lower()
+    return any(h in msg for h in INVALID_HINTS)
+
+
+def error_kind(err):
+    """上游报错 -> "invalid" / "nodata" / None（None 表示临时故障，不记）"""
+    if is_invalid_error(err):
+        return "invalid"
+    msg = str(err).lower()
+    return "nodata" if any(h in msg for h in NODATA_HINTS) else None
+
+
+def blocked(scope, symbols, now=None):
+    """返回 symbols 中当前应跳过的集合（本 scope 的 nodata 或任意 scope 的 invalid 尚未到重查时间）"""
+    symbols = [s.upper() for s in symbols if s]
+    if not ENABLED or not symbols:
+        return set()
+    now = time.time() if now is None else now
+    out = set()
+    conn = connect()
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT symbol FROM negative WHERE scope IN (?, ?) AND next_at > ? AND symbol IN ({marks})",
+            [scope, ANY, now] + chunk,
+        ).fetchall()
+        out.update(r[0] for r in rows)
+    return out
+
+
+def is_blocked(scope, symbol, now=None):
+    return bool(symbol) and symbol.upper() in blocked(scope, [symbol], now)
+
+
+def mark(scope, symbol, kind="nodata", reason=None, now=None):
+    """记录一次空结果；invalid 记在 "*" 下。返回下次重查的时间戳"""
+    if not ENABLED or not symbol:
+        return None
+    now = time.time() if now is None else now
+    sym = symbol.upper()
+    key_scope = ANY if kind == "invalid" else scope
+    conn = connect()
+    with conn:
+        row = conn.execute("SELECT failures FROM negative WHERE scope=? AND symbol=?", (key_scope, sym)).fetchone()
+        failures = (row[0] if row else 0) + 1
+        next_at = now + interval(kind, failures)
+        conn.execute(
+            "INSERT INTO negative (scope, symbol, kind, failures, first_at, last_at, next_at, reason) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(scope, symbol) DO UPDATE SET kind=excluded.kind, failures=excluded.failures, "
+            "last_at=excluded.last_at, next_at=excluded.next_at, reason=excluded.reason",
+            (key_scope, sym, kind, failures, now, now, next_at, reason),
+        )
+    log(f"🚫 [negative_cache] {scope}/{sym} {kind} 第 {failures} 次，{(next_at - now) / 3600:.1f}h 后再查")
+    return next_at
+
+
+def clear(scope, symbol):
+    """查到数据：清掉本 scope 与 "*" 下的记录（先读再删，没有记录时不产生写事务）"""
+    if not ENABLED or not symbol:
+        return False
+    sym = symbol.upper()
+    conn = connect()
+    if not conn.execute("SELECT 1 FROM negative WHERE scope IN (?, ?) AND symbol=? LIMIT 1",
+                        (scope, ANY, sym)).fetchone():
+        return False
+    with conn:
+        conn.execute("DELETE FROM negative WHERE scope IN (?, ?) AND symbol=?", (scope, ANY, sym))
+    return True
+
+
+def observe(scope, symbol, has_data, kind="nodata", reason=None):
+    """按结果更新：有数据清除记录，没有数据记一次"""
+    if has_data:
+        clear(scope, symbol)
+    else:
+        mark(scope, symbol, kind, reason)
+
+
+def entries(scope=None):
+    conn = connect()
+    sql = "SELECT scope, symbol, kind, failures, first_at, last_at, next_at, reason FROM negative"
+    args = []
+    if scope:
+        sql += " WHERE scope IN (?, ?)"
+        args = [scope, ANY]
+    cols = ("scope", "symbol", "kind", "failures", "firstAt", "lastAt", "nextAt", "reason")
+    return [dict(zip(cols, r)) for r in conn.execute(sql + " ORDER BY next_at DESC", args).fetchall()]
+
+
+def clear_symbol(symbol, scope=None):
+    conn = connect()
+    with conn:
+        if scope:
+            cur = conn.execute("DELETE FROM negative WHERE symbol=? AND scope=?", (symbol.upper(), scope))
+        else:
+            cur = conn.execute("DELETE FROM negative WHERE symbol=?", (symbol.upper(),))
+    return cur.rowcount
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if not argv:
+        print(__doc__)
+        sys.exit(1)
+    cmd, rest = argv[0], argv[1:]
+    if cmd == "list":
+        result = entries(rest[0] if rest else None)
+    elif cmd == "check":
+        result = sorted(blocked(rest[0], rest[1:]))
+    elif cmd == "clear":
+        result = {"cleared": clear_symbol(rest[0], rest[1] if len(rest) > 1 else None)}
+    else:
+        print(json.dumps({"error": f"unknown command: {cmd}"}, ensure_ascii=False))
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False))
@@ -1,9 +1,98 @@
-import pandas as pd
-import yfinance as yf
+import os
+import sys
+import csv
+import time
 from datetime import datetime, timedelta
-from openbb import obb
+
+# openbb / pandas / yfinance 都很重（openbb 单独 import 就要好几秒），只在真正拉数据时才加载；
+# 结果 CSV 还新鲜时直接用标准库 csv 读出来打印，不碰这些模块
+OUTPUT_CSV = "upcoming_earnings_openbb.csv"
+CACHE_TTL = int(os.getenv("OPENBB_CACHE_TTL", str(60 * 30)))  # 30分钟
+# 输出格式：csv（整文件覆盖）/ parquet / ipc（按天分区，只写有变化的天，见 calendar_parquet）
+OUTPUT = os.getenv("OPENBB_OUTPUT", "csv")
+
+# 补全字段：profile_store 字段 -> 输出列
+ENRICH_COLUMNS = {"name": "Name", "sector": "Sector", "marketCap": "MarketCap", "price": "Price"}
+
+
+def load_cached(path=OUTPUT_CSV, ttl=CACHE_TTL):
+    """CSV 在 ttl 秒内且是今天生成的就返回行列表，否则返回 None"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if time.time() - mtime >= ttl or datetime.fromtimestamp(mtime).date() != datetime.today().date():
+        return None
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def dataset_fresh(ttl=CACHE_TTL):
+    """分区数据集的 manifest 在 ttl 秒内、今天更新过就返回 manifest（只读 JSON，不加载 pyarrow）"""
+    import calendar_parquet
+
+    m = calendar_parquet.load_manifest()
+    at = m.get("updated_at")
+    if not at or time.time() - at >= ttl or datetime.fromtimestamp(at).date() != datetime.today().date():
+        return None
+    return m
+
+
+def print_rows(rows):
+    if not rows:
+        return
+    cols = list(rows[0])
+    widths = {c: max(len(c), *(len(str(r.get(c) or "")) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r.get(c) or "").ljust(widths[c]) for c in cols))
+
+
+def enrich_frame(tickers, workers=None):
+    """
+    整个日历的公司信息补全，返回 Ticker + Name / Sector / MarketCap / Price 的 DataFrame（每个 ticker 一行）
+
+    - profile_store 里字段还新鲜的 ticker 不查上游（按字段 TTL，name / sector 30 天，price 6 小时）
+    - 其余交给 yf_enrich 并发拉取（有界线程池 + Yahoo host 并发上限 + 单 symbol 超时），
+      negative_cache 里近期无数据的 ticker 跳过
+    - 结果先攒成记录列表，最后一次性建 DataFrame
+    """
+    import pandas as pd
+    import negative_cache
+    import profile_store
+    from yf_enrich import enrich_symbols
+
+    fields = tuple(ENRICH_COLUMNS)
+    symbols = sorted({str(t).strip().upper() for t in tickers if isinstance(t, str) and t.strip()})
+    stale = profile_store.stale_fields(symbols, fields=fields)
+    cache = profile_store.get_many(symbols, fresh_only=False, fields=fields)   # 刷新失败时沿用旧值
+    skipped = negative_cache.blocked("yf_info", stale)
+    todo = [s for s in stale if s not in skipped]
+    print(f"🔍 Enriching {len(symbols)} tickers: {len(symbols) - len(stale)} cached, "
+          f"{len(skipped)} known empty, {len(todo)} via yfinance...")
+
+    if todo:
+        fetched, report = enrich_symbols(todo, workers=workers)
+        profile_store.put_many(fetched, source="yfinance")
+        for sym, info in fetched.items():
+            cache.setdefault(sym, {}).update({k: v for k, v in info.items() if v is not None})
+        print(f"⏱️ yfinance: {report['ok']}/{report['symbols']} ok in {report['wall']}s (p95 {report['p95']}s)")
+
+    records = []
+    for sym in symbols:
+        info = cache.get(sym, {})
+        rec = {"Ticker": sym}
+        for field, col in ENRICH_COLUMNS.items():
+            v = info.get(field)
+            rec[col] = None if v in ("", "N/A") else v
+        records.append(rec)
+    return pd.DataFrame.from_records(records, columns=["Ticker"] + list(ENRICH_COLUMNS.values()))
+
 
 def get_upcoming_earnings(days_ahead: int = 7, enrich: bool = True):
+    import pandas as pd
+    from openbb import obb
+
     start = datetime.today().date()
     end = start + timedelta(days=days_ahead)
     print(f"📅 Fetching earnings calendar: {start} → {end}")
@@ -24,27 +113,9 @@ def get_upcoming_earnings(days_ahead: int = 7, enrich: bool = True):
     df.columns = ["Ticker", "Earnings Date", "EPS Est", "Revenue Est"]
 
     if enrich:
-        print("🔍 Enriching company info via yfinance...")
-        infos = []
-        for t in df["Ticker"].head(30):
-            try:
-                info = yf.Ticker(t).info
-                infos.append({
-                    "Ticker": t,
-                    "Name": info.get("shortName"),
-                    "Sector": info.get("sector"),
-                    "MarketCap": info.get("marketCap"),
-                    "Price": info.get("currentPrice"),
-                })
-            except Exception as e:
-                infos.append({
-                    "Ticker": t,
-                    "Name": None,
-                    "Sector": None,
-                    "MarketCap": None,
-                    "Price": None
-                })
-        extra = pd.DataFrame(infos)
+        # 全量补全：一次建好 extra，再做一次 merge
+        df["Ticker"] = df["Ticker"].astype(str).str.strip().str.upper()
+        extra = enrich_frame(df["Ticker"].tolist())
         df = pd.merge(df, extra, on="Ticker", how="left")
 
     df["Earnings Date"] = pd.to_datetime(df["Earnings Date"]).dt.strftime("%Y-%m-%d")
@@ -54,8 +125,43 @@ def get_upcoming_earnings(days_ahead: int = 7, enrich: bool = True):
     return df
 
 if __name__ == "__main__":
+    argv = sys.argv[1:]
+    force = "--force" in argv
+    output = OUTPUT
+    if "--output" in argv:
+        i = argv.index("--output")
+        output = argv[i + 1] if i + 1 < len(argv) else ""
+    if output not in ("csv", "parquet", "ipc"):
+        print(f"❌ unknown output format '{output}' (expected csv / parquet / ipc)")
+        sys.exit(1)
+    if output != "csv":
+        import calendar_parquet
+
+        if not calendar_parquet.available():
+            print("⚠️ pyarrow not installed, falling back to CSV output")
+            output = "csv"
+
+    if output == "csv":
+        cached = None if force else load_cached()
+        if cached is not None:
+            print(f"📁 Using cached '{OUTPUT_CSV}' ({len(cached)} rows)")
+            print_rows(cached[:20])
+            sys.exit(0)
+    else:
+        m = None if force else dataset_fresh()
+        if m is not None and m.get("format") == output:
+            days = m["days"]
+            print(f"📁 Using cached dataset '{calendar_parquet.DATASET_DIR}' "
+                  f"({len(days)} days, {sum(v['count'] for v in days.values())} rows)")
+            sys.exit(0)
+
     result = get_upcoming_earnings(days_ahead=7, enrich=True)
     if not result.empty:
         print(result.head(20))
-        result.to_csv("upcoming_earnings_openbb.csv", index=False)
-        print("💾 Saved to 'upcoming_earnings_openbb.csv'")
+        if output == "csv":
+            result.to_csv(OUTPUT_CSV, index=False)
+            print(f"💾 Saved to '{OUTPUT_CSV}'")
+        else:
+            stats = calendar_parquet.write_days(result, fmt=output)
+            print(f"💾 Saved {len(stats['written'])} changed days ({stats['rows']} rows) to "
+                  f"'{calendar_parquet.DATASET_DIR}', {stats['unchanged']} unchanged")
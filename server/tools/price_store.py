@@ -0,0 +1,473 @@
+# server/tools/price_store.py
+"""
+本地日线行情（OHLCV）：每个 symbol 一组定长二进制列文件，读取时 np.memmap 映射，切片零拷贝
+
+prices/
+    AAPL/
+        date.bin      datetime64[D]（升序，行数以它为准）
+        open.bin      float64
+        high.bin
+        low.bin
+        close.bin
+        volume.bin
+
+- update() 只追加最后一根已存 K 线之后的数据：按起始日期把 symbol 分组，每组 PRICE_BATCH 个一起
+  yf.download()，不再每次 history(period="1y") 整年重下
+- 追加时多取一根重叠 K 线和本地最后一根比对收盘价，对不上（拆股 / 复权修订）就整只重下
+- 当天还没收盘的 K 线不写入（追加只增不改），收盘后（美东 16:30 之后）才算定稿；
+  "是否最新"按最后一个已收盘的 NYSE 交易日判断，周末 / 休市日不会再去下载只有重叠 K 线的数据
+- 写入顺序：先追加各价格列，最后追加 date；读取方按 date 的行数映射，写到一半也只会看到完整行
+- 读取：PriceView 持有 memmap，range() 按日期二分查找后返回切片视图，不复制数据
+
+命令行：
+    python price_store.py update [AAPL MSFT ...]     # 不给 symbol 时更新 watchlist + 日历里的全部 symbol
+    python price_store.py status [AAPL ...]
+    python price_store.py show AAPL [--from 2025-01-01] [--to 2025-06-30]
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+from cache_io import FileLock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PRICE_DIR = os.getenv("PRICE_STORE_DIR") or os.path.join(HERE, "..", "data", "prices")
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE") or os.path.join(HERE, "..", "cache", "watchlist.json")
+BATCH = int(os.getenv("PRICE_BATCH", "100"))              # 每次 yf.download 的 symbol 数
+BACKFILL = os.getenv("PRICE_BACKFILL", "5y")              # 新 symbol 首次回填的区间
+SPLIT_TOLERANCE = 0.005                                   # 重叠 K 线收盘价相对误差超过 0.5% 视为历史被改写
+
+FIELDS = ("open", "high", "low", "close", "volume")
+SOURCE_COLUMNS = {"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"}
+# symbol 直接拼进目录名，只接受这些字符（防路径穿越）
+SYMBOL_RE = re.compile(r"^[A-Z0-9.\-^=]{1,15}$")
+DATE_DTYPE = np.dtype("<M8[D]")
+VALUE_DTYPE = np.dtype("<f8")
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def valid_symbol(symbol):
+    return bool(SYMBOL_RE.match(str(symbol or "").strip().upper()))
+
+
+def symbol_dir(symbol, root=None):
+    sym = str(symbol).strip().upper()
+    if not SYMBOL_RE.match(sym):
+        raise ValueError(f"invalid symbol: {symbol!r}")
+    return os.path.join(root or PRICE_DIR, sym)
+
+
+def _path(symbol, name, root=None):
+    return os.path.join(symbol_dir(symbol, root), f"{name}.bin")
+
+
+def _rows(path, dtype):
+    try:
+        return os.path.getsize(path) // dtype.itemsize
+    except OSError:
+        return 0
+
+
+def _map(path, dtype, n):
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+
+
+class PriceView:
+    """
+    一个 symbol 的行情视图；dates / open / high / low / close / volume 都是只读 memmap（或它的切片），
+    range() 返回新的 PriceView，底层仍是同一块映射
+    """
+
+    def __init__(self, symbol, dates, columns):
+        self.symbol = symbol
+        self.dates = dates
+        self.columns = columns
+
+    @classmethod
+    def open(cls, symbol, root=None):
+        symbol = symbol.upper()
+        n = _rows(_path(symbol, "date", root), DATE_DTYPE)
+        dates = _map(_path(symbol, "date", root), DATE_DTYPE, n)
+        return cls(symbol, dates, {f: _map(_path(symbol, f, root), VALUE_DTYPE, n) for f in FIELDS})
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns") or {}
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @property
+    def first(self):
+        return str(self.dates[0]) if len(self.dates) else None
+
+    @property
+    def last(self):
+        return str(self.dates[-1]) if len(self.dates) else None
+
+    def range(self, start=None, end=None):
+        """[start, end] 闭区间（"YYYY-MM-DD" / date / datetime64），返回切片视图"""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, "D"), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end, "D"), side="right"))
+        return PriceView(self.symbol, self.dates[lo:hi], {f: c[lo:hi] for f, c in self.columns.items()})
+
+    def tail(self, days):
+        """最近 days 个自然日"""
+        if not len(self.dates):
+            return self
+        return self.range(start=self.dates[-1] - np.timedelta64(days - 1, "D"))
+
+    def to_frame(self):
+        """转成 pandas DataFrame（这一步会复制）"""
+        import pandas as pd
+
+        return pd.DataFrame({SOURCE_COLUMNS[f]: np.asarray(c) for f, c in self.columns.items()},
+                            index=pd.DatetimeIndex(np.asarray(self.dates), name="Date"))
+
+    def to_records(self):
+        return [{"date": str(d), **{f: (None if np.isnan(v) else float(v))
+                                    for f, v in zip(FIELDS, row)}}
+                for d, row in zip(self.dates, zip(*(self.columns[f] for f in FIELDS)))]
+
+
+def read(symbol, start=None, end=None, root=None):
+    return PriceView.open(symbol, root).range(start, end)
+
+
+def last_date(symbol, root=None):
+    path = _path(symbol, "date", root)
+    n = _rows(path, DATE_DTYPE)
+    if not n:
+        return None
+    with open(path, "rb") as f:
+        f.seek((n - 1) * DATE_DTYPE.itemsize)
+        return np.frombuffer(f.read(DATE_DTYPE.itemsize), dtype=DATE_DTYPE)[0]
+
+
+def _easter(year):
+    """公历复活节（匿名格里高利算法）"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """某月第 n 个星期 weekday（n=-1 为最后一个）"""
+    if n > 0:
+        d = date(year, month, 1)
+        return d + timedelta(days=(weekday - d.weekday()) % 7 + 7 * (n - 1))
+    d = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return d - timedelta(days=(d.weekday() - weekday) % 7)
+
+
+def _observed(d):
+    """周六的假日提前到周五，周日的顺延到周一"""
+    return d - timedelta(days=1) if d.weekday() == 5 else d + timedelta(days=1) if d.weekday() == 6 else d
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year):
+    """NYSE 全天休市日（按规则推算；临时休市如国丧日不在内）"""
+    days = {
+        _nth_weekday(year, 1, 0, 3),            # MLK Day
+        _nth_weekday(year, 2, 0, 3),            # Presidents' Day
+        _easter(year) - timedelta(days=2),      # Good Friday
+        _nth_weekday(year, 5, 0, -1),           # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),            # Labor Day
+        _nth_weekday(year, 11, 3, 4),           # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:                 # 元旦逢周六不补休（不提前到上一年 12-31）
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    return frozenset(days)
+
+
+def is_session(day):
+    return day.weekday() < 5 and day not in nyse_holidays(day.year)
+
+
+def final_day(now=None):
+    """
+    已经定稿的最后一个 NYSE 交易日（美东时间 16:30 前当天的 K 线还在变）；
+    周末 / 休市日往前找，这样本地已有上一个交易日的 symbol 就算最新，不会再去下载
+    """
+    from zoneinfo import ZoneInfo
+
+    ny = (now or datetime.now(ZoneInfo("America/New_York"))).astimezone(ZoneInfo("America/New_York"))
+    day = ny.date() if (ny.hour, ny.minute) >= (16, 30) else ny.date() - timedelta(days=1)
+    while not is_session(day):
+        day -= timedelta(days=1)
+    return np.datetime64(day, "D")
+
+
+# === 写入 ===
+def _frame_arrays(df, until):
+    """yfinance 单个 symbol 的 DataFrame -> (dates, {field: array})；去掉空行和未定稿的 K 线"""
+    if df is None or len(df) == 0:
+        return np.empty(0, dtype=DATE_DTYPE), {f: np.empty(0, dtype=VALUE_DTYPE) for f in FIELDS}
+    idx = df.index
+    if getattr(idx, "tz", None) is not None:
+        idx = idx.tz_localize(None)
+    dates = np.asarray(idx.values).astype(DATE_DTYPE)
+    cols = {f: np.asarray(df[SOURCE_COLUMNS[f]] if SOURCE_COLUMNS[f] in df.columns else np.full(len(df), np.nan),
+                          dtype=VALUE_DTYPE) for f in FIELDS}
+    keep = (dates <= until) & ~np.isnan(cols["close"])
+    dates = dates[keep]
+    order = np.argsort(dates, kind="stable")
+    _, first = np.unique(dates[order], return_index=True)
+    order = order[first]
+    return dates[order], {f: c[keep][order] for f, c in cols.items()}
+
+
+def _append_file(path, arr, rows):
+    """截掉 rows 行之后的残留（上次写到一半），再追加 arr"""
+    with open(path, "ab") as f:
+        f.truncate(rows * arr.dtype.itemsize)
+        f.write(np.ascontiguousarray(arr).tobytes())
+
+
+def append(symbol, dates, cols, root=None):
+    """追加严格晚于本地最后一天的行；返回追加的行数"""
+    symbol = symbol.upper()
+    os.makedirs(symbol_dir(symbol, root), exist_ok=True)
+    with FileLock(os.path.join(symbol_dir(symbol, root), ".lock")):
+        n = _rows(_path(symbol, "date", root), DATE_DTYPE)
+        last = last_date(symbol, root)
+        keep = dates > last if last is not None else np.ones(len(dates), dtype=bool)
+        if not keep.any():
+            return 0
+        for f in FIELDS:
+            _append_file(_path(symbol, f, root), cols[f][keep].astype(VALUE_DTYPE), n)
+        _append_file(_path(symbol, "date", root), dates[keep].astype(DATE_DTYPE), n)   # 最后写 date
+        return int(keep.sum())
+
+
+def rewrite(symbol, dates, cols, root=None):
+    """
+    整只重写（首次回填 / 历史被改写）。每个文件都是写临时文件再 os.replace（换 inode，
+    已经映射旧文件的读取方不受影响）；先换上空的 date，读取方不会看到新旧混合的行
+    """
+    symbol = symbol.upper()
+    os.makedirs(symbol_dir(symbol, root), exist_ok=True)
+    with FileLock(os.path.join(symbol_dir(symbol, root), ".lock")):
+        steps = [("date", np.empty(0, dtype=DATE_DTYPE), DATE_DTYPE)] if last_date(symbol, root) is not None else []
+        steps += [(f, cols[f], VALUE_DTYPE) for f in FIELDS] + [("date", dates, DATE_DTYPE)]
+        for name, arr, dtype in steps:
+            path = _path(symbol, name, root)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+            os.replace(tmp, path)
+        return len(dates)
+
+
+def remove(symbol, root=None):
+    shutil.rmtree(symbol_dir(symbol, root), ignore_errors=True)
+
+
+# === 上游 ===
+def download(symbols, start=None, period=None):
+    """一次 yf.download 多个 symbol；返回 {symbol: DataFrame}"""
+    import yfinance as yf
+
+    kwargs = {"start": str(start)} if start is not None else {"period": period or BACKFILL}
+    df = yf.download(list(symbols), interval="1d", auto_adjust=False, actions=False, group_by="ticker",
+                     threads=True, progress=False, **kwargs)
+    out = {}
+    if df is None or df.empty:
+        return out
+    multi = getattr(df.columns, "nlevels", 1) > 1
+    for sym in symbols:
+        if multi:
+            if sym not in df.columns.get_level_values(0):
+                continue
+            part = df[sym]
+        else:
+            part = df
+        out[sym] = part.dropna(how="all")
+    return out
+
+
+def plan(symbols, until=None, root=None):
+    """按起始日期分组：{start_date 或 None（无本地数据）: [symbol, ...]}；已是最新的不出现"""
+    until = until if until is not None else final_day()
+    groups = {}
+    for sym in symbols:
+        last = last_date(sym, root)
+        if last is None:
+            groups.setdefault(None, []).append(sym)
+        elif last < until:
+            groups.setdefault(last, []).append(sym)   # 从最后一根开始取，用来比对重叠 K 线
+    return groups
+
+
+def _overlap_ok(symbol, dates, cols, root=None):
+    last = last_date(symbol, root)
+    hit = np.flatnonzero(dates == last)
+    if last is None or not len(hit):
+        return True
+    view = PriceView.open(symbol, root)
+    old = float(view.close[-1])
+    new = float(cols["close"][hit[0]])
+    return old == new or abs(new - old) <= SPLIT_TOLERANCE * max(abs(old), 1e-9)
+
+
+def update(symbols, until=None, root=None, batch=None):
+    """
+    增量更新一批 symbol；返回 {"appended": {sym: n}, "rebuilt": [...], "empty": [...], "upToDate": n}
+    """
+    import negative_cache
+
+    until = until if until is not None else final_day()
+    symbols = sorted({s.strip().upper() for s in symbols if s and s.strip()})
+    bad = [s for s in symbols if not valid_symbol(s)]
+    if bad:
+        log(f"⚠️ 非法 symbol，跳过: {', '.join(bad)}")
+        symbols = [s for s in symbols if s not in bad]
+    blocked = negative_cache.blocked("yf_prices", symbols)
+    groups = plan([s for s in symbols if s not in blocked], until, root)
+    stats = {"appended": {}, "rebuilt": [], "empty": [], "upToDate": len(symbols) - len(blocked)
+             - sum(len(v) for v in groups.values()), "skipped": sorted(blocked)}
+    batch = batch or BATCH
+    rebuild = []
+
+    for start, syms in sorted(groups.items(), key=lambda kv: (kv[0] is not None, str(kv[0]))):
+        for i in range(0, len(syms), batch):
+            chunk = syms[i:i + batch]
+            try:
+                frames = download(chunk, start=None if start is None else start.astype(object))
+            except Exception as e:
+                log(f"⚠️ yf.download 失败（{len(chunk)} 个，起始 {start}）：{e}")
+                continue
+            for sym in chunk:
+                dates, cols = _frame_arrays(frames.get(sym), until)
+                if start is None:
+                    negative_cache.observe("yf_prices", sym, bool(len(dates)))
+                    if len(dates):
+                        rewrite(sym, dates, cols, root)
+                        stats["appended"][sym] = len(dates)
+                    else:
+                        stats["empty"].append(sym)
+                elif not _overlap_ok(sym, dates, cols, root):
+                    rebuild.append(sym)
+                else:
+                    n = append(sym, dates, cols, root)
+                    if n:
+                        stats["appended"][sym] = n
+
+    # 重叠 K 线对不上：拆股 / 复权修订，整只重下
+    for i in range(0, len(rebuild), batch):
+        chunk = rebuild[i:i + batch]
+        try:
+            frames = download(chunk)
+        except Exception as e:
+            log(f"⚠️ 重下失败（{len(chunk)} 个）：{e}")
+            continue
+        for sym in chunk:
+            dates, cols = _frame_arrays(frames.get(sym), until)
+            if len(dates):
+                rewrite(sym, dates, cols, root)
+                stats["rebuilt"].append(sym)
+    log(f"📈 行情更新：{len(stats['appended'])} 个追加 / {len(stats['rebuilt'])} 个重建 / "
+        f"{stats['upToDate']} 个已最新 / {len(stats['empty'])} 个无数据")
+    return stats
+
+
+def universe():
+    """watchlist + 本地日历快照里出现过的 symbol"""
+    symbols = set()
+    try:
+        with open(WATCHLIST_FILE, "r", encoding="utf-8") as f:
+            symbols.update(str(x.get("symbol") if isinstance(x, dict) else x).upper()
+                           for x in json.load(f) if x)
+    except Exception as e:
+        log(f"⚠️ 读取 watchlist 失败：{e}")
+    try:
+        import calendar_store
+
+        if calendar_store.snapshot_age() is not None:
+            symbols.update(str(r["symbol"]).upper() for r in calendar_store.load_all() if r.get("symbol"))
+    except Exception as e:
+        log(f"⚠️ 读取日历快照失败：{e}")
+    symbols.discard("NONE")
+    return sorted(symbols)
+
+
+def status(symbols, root=None):
+    out = {}
+    for sym in symbols:
+        view = PriceView.open(sym, root)
+        out[sym.upper()] = {"rows": len(view), "first": view.first, "last": view.last}
+    return out
+
+
+def history(symbol, days=365, root=None, refresh=True):
+    """
+    最近 days 天的 DataFrame（替代 ticker.history(period="1y")）；refresh 时先增量更新这一只，
+    批量场景应先对全部 symbol 调一次 update() 再用 refresh=False 读。
+    列为未复权的 Open / High / Low / Close / Volume（yf.download(auto_adjust=False)），
+    和 ticker.history() 默认的复权价不同，也没有 Dividends / Stock Splits 列
+    """
+    if refresh:
+        update([symbol], root=root)
+    return PriceView.open(symbol, root).tail(days).to_frame()
+
+
+def parse_args(argv):
+    opts, rest = {"from": None, "to": None}, []
+    i = 0
+    while i < len(argv):
+        if argv[i] in ("--from", "--to") and i + 1 < len(argv):
+            opts[argv[i][2:]] = argv[i + 1]
+            i += 2
+            continue
+        rest.append(argv[i])
+        i += 1
+    return opts, rest
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if not argv:
+        print(__doc__)
+        sys.exit(1)
+    cmd, (opts, rest) = argv[0], parse_args(argv[1:])
+    if cmd == "update":
+        t0 = time.time()
+        stats = update(rest or universe())
+        stats["elapsed"] = round(time.time() - t0, 2)
+        print(json.dumps(stats, ensure_ascii=False))
+    elif cmd == "status":
+        print(json.dumps(status(rest or (sorted(os.listdir(PRICE_DIR)) if os.path.isdir(PRICE_DIR) else [])),
+                         ensure_ascii=False, indent=1))
+    elif cmd == "show" and rest:
+        for rec in read(rest[0], opts["from"], opts["to"]).to_records():
+            print(json.dumps(rec, ensure_ascii=False))
+    else:
+        print(json.dumps({"error": f"unknown command: {cmd}"}, ensure_ascii=False))
+        sys.exit(1)
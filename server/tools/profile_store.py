@@ -0,0 +1,132 @@
+# server/tools/profile_store.py
+"""
+按 symbol 持久化的公司概况缓存（price / marketCap / sector），每个字段单独 TTL
+
+- 底层 SQLite（WAL），多个进程同时读写安全
+- stale_fields() 只列出过期字段，调用方只刷新这些
+- TTL 可用环境变量覆盖：PROFILE_TTL_PRICE / PROFILE_TTL_MARKETCAP / PROFILE_TTL_SECTOR / PROFILE_TTL_NAME（秒）
+- 上游明确返回空的字段（ETF / SPAC / OTC 没有 sector 之类）也记下来（value 为 NULL），
+  在 PROFILE_TTL_EMPTY 内算“已知为空”，stale_fields 不再列出，避免每次刷新都重查
+- name（公司简称）只有 openbb 日历补全会用到，默认的 get_many / stale_fields 不包含它
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv("PROFILE_DB") or os.path.join(HERE, "..", "data", "profile_cache.db")
+
+TTLS = {
+    "price": int(os.getenv("PROFILE_TTL_PRICE", str(60 * 60 * 6))),            # 6 小时
+    "marketCap": int(os.getenv("PROFILE_TTL_MARKETCAP", str(60 * 60 * 24))),    # 1 天
+    "sector": int(os.getenv("PROFILE_TTL_SECTOR", str(60 * 60 * 24 * 30))),     # 30 天
+    "name": int(os.getenv("PROFILE_TTL_NAME", str(60 * 60 * 24 * 30))),         # 30 天
+}
+EMPTY_TTL = int(os.getenv("PROFILE_TTL_EMPTY", str(60 * 60 * 24 * 3)))          # 3 天（不超过字段本身的 TTL）
+FIELDS = ("price", "marketCap", "sector")   # 默认读取 / 检查的字段
+
+_local = threading.local()
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def connect():
+    """每个线程一个连接；busy_timeout 让并发写入排队而不是报错"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS profile (
+                symbol     TEXT NOT NULL,
+                field      TEXT NOT NULL,
+                value      TEXT,
+                source     TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (symbol, field)
+            )
+        """)
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _is_empty(v):
+    return v is None or v == "N/A" or v == ""
+
+
+def _ttl(field, value):
+    return min(TTLS[field], EMPTY_TTL) if value is None else TTLS[field]
+
+
+def get_many(symbols, fresh_only=True, fields=FIELDS, include_empty=False):
+    """
+    返回 {symbol: {field: value}}；fresh_only=True 时忽略过期字段。
+    已知为空的字段默认不返回；include_empty=True 时未过期的空字段以 None 出现
+    """
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    now = time.time()
+    out = {}
+    conn = connect()
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT symbol, field, value, updated_at FROM profile WHERE symbol IN ({marks})", chunk
+        ).fetchall()
+        for sym, field, value, updated_at in rows:
+            if field not in fields:
+                continue
+            if value is None:
+                if include_empty and now - updated_at < _ttl(field, None):
+                    out.setdefault(sym, {})[field] = None
+                continue
+            if fresh_only and now - updated_at >= TTLS[field]:
+                continue
+            out.setdefault(sym, {})[field] = json.loads(value)
+    return out
+
+
+def stale_fields(symbols, fields=FIELDS):
+    """返回 {symbol: [过期或缺失的字段]}，全部新鲜（含已知为空）的 symbol 不出现"""
+    fresh = get_many(symbols, fields=fields, include_empty=True)
+    plan = {}
+    for sym in symbols:
+        have = fresh.get(sym, {})
+        missing = [f for f in fields if f not in have]
+        if missing:
+            plan[sym] = missing
+    return plan
+
+
+def put(symbol, values, source=None):
+    """写入/覆盖 symbol 的若干字段；空值（None / "N/A" / ""）记为已知为空，EMPTY_TTL 后重查"""
+    put_many({symbol: values}, source)
+
+
+def put_many(profiles, source=None):
+    now = time.time()
+    rows = []
+    for sym, values in profiles.items():
+        for field, v in (values or {}).items():
+            if field in TTLS:
+                rows.append((sym, field, None if _is_empty(v) else json.dumps(v), source, now))
+    if not rows:
+        return 0
+    conn = connect()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO profile (symbol, field, value, source, updated_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    return len(rows)
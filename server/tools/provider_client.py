@@ -0,0 +1,214 @@
+# server/tools/provider_client.py
+"""
+上游数据源（FMP / Finnhub / AlphaVantage / EODHD / Yahoo）共用的 asyncio HTTP 客户端
+
+- 每个事件循环一个连接池（keep-alive），装了 httpx 就用 httpx（装了 h2 则启用 HTTP/2），
+  否则退回 requests.Session + 线程池
+- 每个 provider 独立的并发上限（PROVIDERS[...]["concurrency"]，可用 PROVIDER_CONCURRENCY_<NAME> 覆盖）
+- 请求前经过 rate_limit 令牌桶；429/5xx 和网络错误自动退避并重试（PROVIDER_RETRIES 次）
+- 异步调用：   resp = await client().get("fmp", url)
+  并发调用：   resps = await client().get_many([("fmp", u1), ("finnhub", u2)])
+  同步脚本：   resp = get_sync("fmp", url)   # 在常驻后台事件循环里执行，连接跨调用复用
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import rate_limit
+
+try:
+    import httpx
+except ImportError:  # 退回 requests
+    httpx = None
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = httpx is not None
+except ImportError:
+    HTTP2 = False
+
+DEFAULT_TIMEOUT = 15
+RETRIES = int(os.getenv("PROVIDER_RETRIES", "2"))
+
+PROVIDERS = {
+    "fmp": {"host": "financialmodelingprep.com", "concurrency": 8},
+    "finnhub": {"host": "finnhub.io", "concurrency": 8},
+    "alphavantage": {"host": "www.alphavantage.co", "concurrency": 2},
+    "eodhd": {"host": "eodhd.com", "concurrency": 4},
+    "yahoo": {"host": "query2.finance.yahoo.com", "concurrency": 8},
+    "sec": {"host": "data.sec.gov", "concurrency": 4},
+}
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def concurrency_for(provider):
+    default = PROVIDERS.get(provider, {}).get("concurrency", 4)
+    return int(os.getenv(f"PROVIDER_CONCURRENCY_{provider.upper()}", str(default)))
+
+
+@dataclass
+class ProviderResponse:
+    provider: str
+    url: str
+    status: Optional[int]
+    data: Any = None
+    elapsed: float = 0.0
+    nbytes: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.status == 200 and self.error is None
+
+
+class ProviderClient:
+    """绑定在单个事件循环上的连接池 + per-provider 并发闸门"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._http = None
+        self._session = None
+        self._sems = {}
+
+    def _sem(self, provider):
+        sem = self._sems.get(provider)
+        if sem is None:
+            sem = asyncio.Semaphore(concurrency_for(provider))
+            self._sems[provider] = sem
+        return sem
+
+    def _ensure(self):
+        if httpx is not None:
+            if self._http is None:
+                limits = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60)
+                self._http = httpx.AsyncClient(http2=HTTP2, limits=limits, timeout=self.timeout,
+                                               follow_redirects=True)
+        elif self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(PROVIDERS), pool_maxsize=32)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+
+    async def _fetch(self, url, params, timeout, headers=None):
+        """返回 (status, body_bytes, headers)"""
+        self._ensure()
+        if self._http is not None:
+            r = await self._http.get(url, params=params, timeout=timeout, headers=headers)
+            return r.status_code, r.content, r.headers
+        r = await asyncio.to_thread(self._session.get, url, params=params, timeout=timeout, headers=headers)
+        return r.status_code, r.content, r.headers
+
+    async def get(self, provider, url, params=None, timeout=None, headers=None):
+        """GET 并解析 JSON；网络/解析/限额错误不抛出，写进 ProviderResponse.error（headers：如 SEC 要求的 User-Agent）"""
+        timeout = timeout or self.timeout
+        for attempt in range(RETRIES + 1):
+            try:
+                bucket = await rate_limit.acquire(provider, url)
+            except rate_limit.BudgetExhausted as e:
+                log(f"⛔ [{provider}] {e}")
+                return ProviderResponse(provider, url, None, error=str(e))
+
+            error = None
+            async with self._sem(provider):
+                t0 = time.perf_counter()
+                try:
+                    status, body, resp_headers = await self._fetch(url, params, timeout, headers)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                elapsed = time.perf_counter() - t0
+
+            if error is not None:
+                # 连接失败 / 读超时 / TLS 重置：按 5xx 的退避节奏重试，用完次数才返回错误
+                if attempt < RETRIES:
+                    backoff = min(rate_limit.MAX_BACKOFF / 4, 0.5 * 2 ** (attempt + 1))
+                    log(f"⏳ [{provider}] {error}，退避 {backoff:.1f}s 后重试（{attempt + 1}/{RETRIES}）")
+                    await asyncio.sleep(backoff)
+                    continue
+                return ProviderResponse(provider, url, None, elapsed=elapsed, error=error)
+
+            backoff = bucket.on_result(status, _retry_after(resp_headers))
+            if backoff and attempt < RETRIES:
+                log(f"⏳ [{provider}] HTTP {status}，退避 {backoff:.1f}s 后重试（{attempt + 1}/{RETRIES}）")
+                continue
+            break
+
+        resp = ProviderResponse(provider, url, status, elapsed=elapsed, nbytes=len(body or b""))
+        try:
+            resp.data = json.loads(body) if body else None
+        except Exception as e:
+            resp.error = f"JSON decode error: {e}"
+        return resp
+
+    async def get_many(self, calls, timeout=None):
+        """calls: [(provider, url), ...]，并发执行，结果顺序与输入一致"""
+        return await asyncio.gather(*(self.get(p, u, timeout=timeout) for p, u in calls))
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except Exception:
+        return None
+
+
+_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def client():
+    """当前事件循环对应的共享客户端"""
+    loop = asyncio.get_running_loop()
+    c = _CLIENTS.get(loop)
+    if c is None:
+        c = ProviderClient()
+        _CLIENTS[loop] = c
+    return c
+
+
+# === 同步桥：后台常驻事件循环 ===
+_bg_loop = None
+_bg_lock = threading.Lock()
+
+
+def _background_loop():
+    global _bg_loop
+    with _bg_lock:
+        if _bg_loop is None:
+            loop = asyncio.new_event_loop()
+            t = threading.Thread(target=loop.run_forever, name="provider-client", daemon=True)
+            t.start()
+            _bg_loop = loop
+        return _bg_loop
+
+
+def run(coro):
+    """在后台事件循环里执行协程并等待结果（同步代码使用）"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+async def _get(provider, url, params, timeout):
+    return await client().get(provider, url, params=params, timeout=timeout)
+
+
+def get_sync(provider, url, params=None, timeout=None):
+    return run(_get(provider, url, params, timeout))
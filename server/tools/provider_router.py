@@ -0,0 +1,240 @@
+# server/tools/provider_router.py
+"""
+按实测表现给数据源排序（自适应路由）
+
+每次真实请求或探测（test_multi_earnings_api_v3.py 的 probe_runs.ndjson）都记一条观测：
+(kind, provider, symbol_class, latency, ok, 字段填充率)。rank() 用最近 WINDOW 条观测算出
+p50 / p95 延迟、错误率、填充率，把候选源排成：可靠的在前 → 填充率高的在前 → 延迟低的在前。
+观测不足 MIN_SAMPLES 条的源保持调用方给的默认顺序（不会因为没数据被排到最后）。
+
+- kind：请求类型，如 "calendar" / "revenue" / "profile"
+- symbol_class：按市值分档（mega / large / mid / small / unknown，取自 profile_store），
+  不针对单个 symbol 的请求（如整段日历）用 "all"
+- 观测存在 SQLite（PROVIDER_STATS_DB），多进程共享，每个 key 只保留最近 KEEP 条
+
+命令行：
+    python provider_router.py stats [kind]
+    python provider_router.py import-probes ../../probe_runs.ndjson   # 输出导入前后的 rank()，确认探测数据生效
+    python provider_router.py rank revenue yfinance,edgar [symbol]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv("PROVIDER_STATS_DB") or os.path.join(HERE, "..", "data", "provider_stats.db")
+
+WINDOW = int(os.getenv("ROUTER_WINDOW", "200"))       # 计算统计用的最近观测数
+KEEP = WINDOW * 2                                      # 每个 key 保留的观测上限
+MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+MAX_ERROR = float(os.getenv("ROUTER_MAX_ERROR", "0.2"))  # 错误率高于此值视为不可靠
+FILL_STEP = 0.05                                        # 填充率差距小于此值时按延迟比较
+
+CAP_CLASSES = [(200e9, "mega"), (10e9, "large"), (2e9, "mid"), (0, "small")]
+
+# 探测 (来源, endpoint) -> 线上 rank() 实际查询的 (kind, provider)，名称必须与调用方完全一致：
+#   日历：earnings_calendar_fetch._sources() 的 "FMP" / "Finnhub"（fill 按 eps / revenueEstimate / time 计）
+#   季度营收：fetchEarnings.js REVENUE_SOURCES 的 "yfinance" / "edgar"（fill 按拿到的季度数 / 8 计）
+# 其余探测（AlphaVantage / EODHD / 指标类 endpoint）没有线上排序在用，不计入观测
+PROBE_ROUTES = {
+    ("FMP", "earning-calendar"): [("calendar", "FMP")],
+    ("Finnhub", "calendar"): [("calendar", "Finnhub")],
+    ("Yahoo", "revenue-timeseries"): [("revenue", "yfinance")],
+    ("EDGAR", "companyfacts"): [("revenue", "edgar")],
+}
+
+_db_lock = threading.Lock()
+_db = None
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def _conn():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        _db = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.executescript("""
+            CREATE TABLE IF NOT EXISTS observation (
+                id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind         TEXT NOT NULL,
+                provider     TEXT NOT NULL,
+                symbol_class TEXT NOT NULL,
+                at           REAL NOT NULL,
+                latency      REAL,
+                ok           INTEGER NOT NULL,
+                fill         REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_obs_key ON observation (kind, symbol_class, provider, id);
+        """)
+        _db.commit()
+    return _db
+
+
+def symbol_class(symbol):
+    """按 profile_store 里的市值分档；没有市值时为 unknown"""
+    if not symbol:
+        return "all"
+    try:
+        import profile_store
+
+        cap = profile_store.get_many([symbol.upper()], fresh_only=False).get(symbol.upper(), {}).get("marketCap")
+    except Exception:
+        cap = None
+    if not isinstance(cap, (int, float)) or cap <= 0:
+        return "unknown"
+    for floor, name in CAP_CLASSES:
+        if cap >= floor:
+            return name
+    return "small"
+
+
+def record(kind, provider, latency=None, ok=True, fill=None, symbol_class="all", at=None):
+    """记录一次观测；fill 为期望字段的填充比例（0~1），未知可不填"""
+    with _db_lock:
+        conn = _conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO observation (kind, provider, symbol_class, at, latency, ok, fill) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, provider, symbol_class, at or time.time(), latency, 1 if ok else 0, fill),
+            )
+            conn.execute(
+                "DELETE FROM observation WHERE kind=? AND provider=? AND symbol_class=? AND id <= "
+                "(SELECT id FROM observation WHERE kind=? AND provider=? AND symbol_class=? "
+                " ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (kind, provider, symbol_class, kind, provider, symbol_class, KEEP),
+            )
+
+
+def _percentile(xs, p):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    k = (len(xs) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def stats(kind, provider, symbol_class="all"):
+    """最近 WINDOW 条观测的统计；symbol_class 没数据时退回 all"""
+    with _db_lock:
+        rows = _conn().execute(
+            "SELECT latency, ok, fill FROM observation WHERE kind=? AND provider=? AND symbol_class=? "
+            "ORDER BY id DESC LIMIT ?",
+            (kind, provider, symbol_class, WINDOW),
+        ).fetchall()
+    if len(rows) < MIN_SAMPLES and symbol_class != "all":
+        return stats(kind, provider, "all")
+    lat = [r[0] for r in rows if r[0] is not None and r[1]]
+    fills = [r[2] for r in rows if r[2] is not None]
+    n = len(rows)
+    return {
+        "provider": provider,
+        "symbolClass": symbol_class,
+        "n": n,
+        "errorRate": round(1 - sum(r[1] for r in rows) / n, 4) if n else None,
+        "fillRate": round(sum(fills) / len(fills), 4) if fills else None,
+        "p50": _percentile(lat, 50),
+        "p95": _percentile(lat, 95),
+    }
+
+
+def rank(kind, candidates, symbol=None, cls=None):
+    """
+    返回排好序的候选源列表。
+    观测不足的源按原顺序插在可靠源之后、不可靠源之前，保证新源也有机会被试到。
+    """
+    cls = cls or symbol_class(symbol)
+    known, unknown = [], []
+    for i, p in enumerate(candidates):
+        s = stats(kind, p, cls)
+        if s["n"] < MIN_SAMPLES:
+            unknown.append(p)
+            continue
+        reliable = s["errorRate"] <= MAX_ERROR
+        fill = round((s["fillRate"] if s["fillRate"] is not None else 1.0) / FILL_STEP)
+        known.append(((not reliable, -fill, s["p50"] if s["p50"] is not None else float("inf"), i), p, reliable))
+    known.sort()
+    good = [p for _, p, r in known if r]
+    bad = [p for _, p, r in known if not r]
+    return good + unknown + bad
+
+
+def probe_routes(source, endpoint):
+    """探测记录对应的路由 key 列表 [(kind, provider)]；没有线上排序使用的返回 []"""
+    return PROBE_ROUTES.get((source, endpoint), [])
+
+
+def routed_candidates():
+    """{kind: [provider, ...]}：探测能影响到的排序（候选顺序按 PROBE_ROUTES 声明顺序）"""
+    out = {}
+    for keys in PROBE_ROUTES.values():
+        for kind, provider in keys:
+            if provider not in out.setdefault(kind, []):
+                out[kind].append(provider)
+    return out
+
+
+def import_probe_runs(path):
+    """
+    把 probe_runs.ndjson 的每个 endpoint 汇总折算成观测（路由 key 见 PROBE_ROUTES）。
+    返回导入条数、每个路由 key 的条数、被忽略的 endpoint，以及导入前后各 kind 的 rank() 结果
+    """
+    before = {kind: rank(kind, c, cls="all") for kind, c in routed_candidates().items()}
+    n, routed, ignored = 0, {}, set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            run = json.loads(line)
+            at = time.mktime(time.strptime(run["at"][:19], "%Y-%m-%dT%H:%M:%S")) if run.get("at") else None
+            for key, s in run.get("endpoints", {}).items():
+                source, endpoint = key.split("/", 1)
+                keys = probe_routes(source, endpoint)
+                if not keys:
+                    ignored.add(key)
+                    continue
+                comp = list(s.get("completeness", {}).values())
+                fill = sum(comp) / len(comp) if comp else None
+                ok_n = round(s["okRate"] * s["n"])
+                for kind, provider in keys:
+                    for i in range(s["n"]):
+                        record(kind, provider, latency=s.get("p50"), ok=i < ok_n, fill=fill, at=at)
+                        n += 1
+                    routed[f"{kind}/{provider}"] = routed.get(f"{kind}/{provider}", 0) + s["n"]
+    after = {kind: rank(kind, c, cls="all") for kind, c in routed_candidates().items()}
+    return {"imported": n, "routed": routed, "ignored": sorted(ignored),
+            "rank": {kind: {"before": before[kind], "after": after[kind]} for kind in after}}
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if not argv:
+        print(__doc__)
+        sys.exit(1)
+    cmd, rest = argv[0], argv[1:]
+    if cmd == "stats":
+        sql = "SELECT DISTINCT kind, provider, symbol_class FROM observation"
+        args = []
+        if rest:
+            sql += " WHERE kind=?"
+            args.append(rest[0])
+        with _db_lock:
+            keys = _conn().execute(sql + " ORDER BY kind, provider", args).fetchall()
+        result = [dict(stats(k, p, c), kind=k) for k, p, c in keys]
+    elif cmd == "import-probes":
+        result = import_probe_runs(rest[0])
+    elif cmd == "rank":
+        result = rank(rest[0], rest[1].split(","), symbol=rest[2] if len(rest) > 2 else None)
+    else:
+        print(json.dumps({"error": f"unknown command: {cmd}"}, ensure_ascii=False))
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False))
@@ -0,0 +1,242 @@
+# server/tools/rate_limit.py
+"""
+按 (provider, API key) 的令牌桶限速 + 429/5xx 自适应退避
+
+- 每分钟速率按各家文档的免费额度设置，可用 RATE_<PROVIDER>_PER_MINUTE 覆盖
+- 每日额度（FMP 250/天、AlphaVantage 25/天、EODHD 20/天）记在 SQLite 里，多个进程共享计数；
+  可用 RATE_<PROVIDER>_PER_DAY 覆盖，设为 0 表示不限
+- 429：速率减半，按 Retry-After 或指数退避暂停；5xx：速率降到 3/4，短暂退避
+  成功后速率逐步恢复到基准
+- metrics() 返回每个桶的剩余令牌、当前速率、今日剩余额度等
+
+直接运行本文件会打印今日各 provider/key 的用量。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from datetime import date
+from urllib.parse import urlparse, parse_qs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv("RATE_LIMIT_DB") or os.path.join(HERE, "..", "data", "rate_limit.db")
+
+# 文档额度（免费档）：per_minute 为持续速率，burst 为桶容量，per_day 为每日上限（None 不限）
+QUOTAS = {
+    "finnhub": {"per_minute": 60, "burst": 30, "per_day": None},
+    "fmp": {"per_minute": 300, "burst": 10, "per_day": 250},
+    "alphavantage": {"per_minute": 5, "burst": 1, "per_day": 25},
+    "eodhd": {"per_minute": 60, "burst": 5, "per_day": 20},
+    "yahoo": {"per_minute": 120, "burst": 20, "per_day": None},
+}
+DEFAULT_QUOTA = {"per_minute": 60, "burst": 5, "per_day": None}
+
+KEY_PARAMS = ("apikey", "token", "api_token")
+MAX_BACKOFF = 120.0
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def quota_for(provider):
+    q = dict(QUOTAS.get(provider, DEFAULT_QUOTA))
+    name = provider.upper()
+    if os.getenv(f"RATE_{name}_PER_MINUTE"):
+        q["per_minute"] = float(os.getenv(f"RATE_{name}_PER_MINUTE"))
+    if os.getenv(f"RATE_{name}_PER_DAY") is not None:
+        q["per_day"] = int(os.getenv(f"RATE_{name}_PER_DAY")) or None
+    return q
+
+
+def key_id(url):
+    """从 URL 里取 API key 并做摘要（不落盘明文 key）"""
+    qs = parse_qs(urlparse(url).query)
+    for p in KEY_PARAMS:
+        if qs.get(p):
+            return hashlib.sha1(qs[p][0].encode("utf-8")).hexdigest()[:10]
+    return "anon"
+
+
+# === 每日额度（跨进程共享） ===
+_db_lock = threading.Lock()
+_db = None
+
+
+def _conn():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        _db = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("""
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                day      TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                key_id   TEXT NOT NULL,
+                used     INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, provider, key_id)
+            )
+        """)
+        _db.commit()
+    return _db
+
+
+def take_daily(provider, kid, limit):
+    """占用一次每日额度；超额返回 False"""
+    today = date.today().isoformat()
+    with _db_lock:
+        conn = _conn()
+        with conn:
+            row = conn.execute(
+                "SELECT used FROM daily_usage WHERE day=? AND provider=? AND key_id=?", (today, provider, kid)
+            ).fetchone()
+            used = row[0] if row else 0
+            if limit and used >= limit:
+                return False
+            conn.execute(
+                "INSERT INTO daily_usage (day, provider, key_id, used) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(day, provider, key_id) DO UPDATE SET used = used + 1",
+                (today, provider, kid),
+            )
+    return True
+
+
+def used_today(provider=None):
+    today = date.today().isoformat()
+    with _db_lock:
+        sql = "SELECT provider, key_id, used FROM daily_usage WHERE day=?"
+        args = [today]
+        if provider:
+            sql += " AND provider=?"
+            args.append(provider)
+        return _conn().execute(sql, args).fetchall()
+
+
+# === 令牌桶 ===
+class TokenBucket:
+    def __init__(self, provider, kid):
+        q = quota_for(provider)
+        self.provider = provider
+        self.kid = kid
+        self.base_rate = q["per_minute"] / 60.0     # 每秒令牌数
+        self.rate = self.base_rate
+        self.capacity = max(1.0, float(q["burst"]))
+        self.per_day = q["per_day"]
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.streak = 0          # 连续失败次数，用于指数退避
+        self.n429 = 0
+        self.n5xx = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """占一个令牌，返回需要等待的秒数（线程安全，不阻塞）"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.blocked_until - now)
+
+    def on_result(self, status, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            if status == 429 or (status is not None and status >= 500):
+                self.streak += 1
+                if status == 429:
+                    self.n429 += 1
+                    self.rate = max(self.base_rate / 16, self.rate * 0.5)
+                    backoff = retry_after if retry_after else min(MAX_BACKOFF, 2 ** self.streak)
+                else:
+                    self.n5xx += 1
+                    self.rate = max(self.base_rate / 16, self.rate * 0.75)
+                    backoff = min(MAX_BACKOFF / 4, 0.5 * 2 ** self.streak)
+                self.blocked_until = max(self.blocked_until, now + backoff)
+                self.tokens = min(self.tokens, 0.0)
+                return backoff
+            self.streak = 0
+            if self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+            return 0.0
+
+    def snapshot(self):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "tokens": round(max(self.tokens, 0.0), 2),
+                "capacity": self.capacity,
+                "ratePerMin": round(self.rate * 60, 2),
+                "baseRatePerMin": round(self.base_rate * 60, 2),
+                "blockedFor": round(max(0.0, self.blocked_until - now), 2),
+                "n429": self.n429,
+                "n5xx": self.n5xx,
+            }
+
+
+_BUCKETS = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket(provider, url):
+    kid = key_id(url)
+    with _buckets_lock:
+        b = _BUCKETS.get((provider, kid))
+        if b is None:
+            b = TokenBucket(provider, kid)
+            _BUCKETS[(provider, kid)] = b
+        return b
+
+
+async def acquire(provider, url):
+    """请求前调用：等待令牌；每日额度用完抛 BudgetExhausted"""
+    b = bucket(provider, url)
+    # SQLite 写入（多进程争用时可能等锁）放到线程里，不阻塞事件循环上的其他请求
+    if not await asyncio.to_thread(take_daily, provider, b.kid, b.per_day):
+        raise BudgetExhausted(f"{provider} daily budget ({b.per_day}) exhausted")
+    wait = b.reserve()
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return b
+
+
+def metrics():
+    """各桶状态 + 今日剩余额度"""
+    used = {(p, k): n for p, k, n in used_today()}
+    out = {}
+    with _buckets_lock:
+        items = list(_BUCKETS.items())
+    for (provider, kid), b in items:
+        snap = b.snapshot()
+        n = used.get((provider, kid), 0)
+        snap["usedToday"] = n
+        snap["remainingToday"] = None if not b.per_day else max(0, b.per_day - n)
+        out.setdefault(provider, {})[kid] = snap
+    return out
+
+
+if __name__ == "__main__":
+    rows = used_today()
+    report = {}
+    for provider, kid, n in rows:
+        per_day = quota_for(provider)["per_day"]
+        report.setdefault(provider, {})[kid] = {
+            "usedToday": n,
+            "remainingToday": None if not per_day else max(0, per_day - n),
+        }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
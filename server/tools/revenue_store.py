@@ -0,0 +1,223 @@
+# server/tools/revenue_store.py
+"""
+季度营收历史库：按 (symbol, period) 持久化，已披露的季度不再重复抓取
+
+- 底层 SQLite（WAL），多进程读写安全；period 统一为最近的日历季度末 YYYY-MM-DD
+  （quarterly_financials 给的财季末如 2024-09-28 和 quarterly_earnings 的 "3Q2024" 落到同一个 2024-09-30）
+- 写入只追加新季度；已有季度只补空值，不覆盖已披露数据
+- due_symbols() 判断哪些 symbol 该去上游查了：
+    上一季度末 + 一个季度 + 披露滞后（REVENUE_REPORT_LAG_DAYS，默认 45 天）之后才到期；
+    到期但上游还没出新季度时，每 REVENUE_RECHECK_HOURS（默认 24 小时）最多再查一次
+- 可从旧的 revenue_cache.json（{symbol: [{date, revenue}]}）导入
+
+命令行：
+    python revenue_store.py import ../../revenue_cache.json
+    python revenue_store.py history AAPL
+    python revenue_store.py due AAPL MSFT NVDA
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv("REVENUE_DB") or os.path.join(HERE, "..", "data", "revenue_history.db")
+
+QUARTER_DAYS = 91
+REPORT_LAG_DAYS = int(os.getenv("REVENUE_REPORT_LAG_DAYS", "45"))
+RECHECK = int(os.getenv("REVENUE_RECHECK_HOURS", "24")) * 3600
+
+_local = threading.local()
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS revenue (
+                symbol     TEXT NOT NULL,
+                period     TEXT NOT NULL,
+                revenue    REAL,
+                earnings   REAL,
+                source     TEXT,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (symbol, period)
+            );
+            CREATE TABLE IF NOT EXISTS symbol_meta (
+                symbol      TEXT PRIMARY KEY,
+                last_period TEXT,
+                checked_at  REAL NOT NULL
+            );
+        """)
+        conn.commit()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            _snap_periods(conn)
+        _local.conn = conn
+    return conn
+
+
+def _snap_periods(conn):
+    """一次性迁移：旧数据里的财季末日期合并到对应的日历季度末（已有的值优先，只补空值）"""
+    with conn:
+        rows = conn.execute("SELECT symbol, period, revenue, earnings, source, fetched_at FROM revenue").fetchall()
+        moved = [(sym, p, period_end(p), *rest) for sym, p, *rest in rows if period_end(p) != p]
+        for sym, old, new, revenue, earnings, source, fetched_at in moved:
+            conn.execute("DELETE FROM revenue WHERE symbol=? AND period=?", (sym, old))
+            conn.execute(
+                "INSERT INTO revenue (symbol, period, revenue, earnings, source, fetched_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(symbol, period) DO UPDATE SET "
+                "revenue = COALESCE(revenue, excluded.revenue), earnings = COALESCE(earnings, excluded.earnings)",
+                (sym, new, revenue, earnings, source, fetched_at),
+            )
+        conn.execute("UPDATE symbol_meta SET last_period = "
+                     "(SELECT MAX(period) FROM revenue WHERE revenue.symbol = symbol_meta.symbol)")
+        conn.execute("PRAGMA user_version = 1")
+    if moved:
+        log(f"♻️ revenue_store：{len(moved)} 条财季末日期已合并到日历季度末")
+
+
+def _quarter_end(y, q):
+    return {1: f"{y}-03-31", 2: f"{y}-06-30", 3: f"{y}-09-30", 4: f"{y}-12-31"}[q]
+
+
+def period_end(p):
+    """
+    '2025-06-28 00:00:00' / '2025-06-28' / '2Q2025' -> '2025-06-30'；无法识别返回 None
+    日期取最近的日历季度末：52/53 周财年的季末（9-28、10-01 之类）和 "nQyyyy" 标签归到同一个季度
+    """
+    s = str(p or "").strip()
+    try:
+        d = datetime.strptime(s[:10], "%Y-%m-%d").date()
+    except ValueError:
+        d = None
+    if d is not None:
+        ends = [date(d.year - 1, 12, 31)] + [datetime.strptime(_quarter_end(d.year, q), "%Y-%m-%d").date()
+                                             for q in (1, 2, 3, 4)]
+        return min(ends, key=lambda e: abs((d - e).days)).strftime("%Y-%m-%d")
+    m = re.fullmatch(r"([1-4])Q(\d{4})", s)
+    if m:
+        return _quarter_end(int(m.group(2)), int(m.group(1)))
+    return None
+
+
+def next_due(last_period):
+    """下一季度数据预计可取的日期"""
+    d = datetime.strptime(last_period, "%Y-%m-%d").date()
+    return d + timedelta(days=QUARTER_DAYS + REPORT_LAG_DAYS)
+
+
+def _meta(symbols):
+    conn = connect()
+    out = {}
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        for sym, last, checked in conn.execute(
+            f"SELECT symbol, last_period, checked_at FROM symbol_meta WHERE symbol IN ({marks})", chunk
+        ):
+            out[sym] = (last, checked)
+    return out
+
+
+def due_symbols(symbols, today=None, now=None):
+    """返回需要去上游查询的 symbol 列表（保持输入顺序）"""
+    symbols = [s.upper() for s in symbols]
+    today = today or date.today()
+    now = now or time.time()
+    meta = _meta(symbols)
+    due = []
+    for sym in symbols:
+        m = meta.get(sym)
+        if m is None:
+            due.append(sym)
+            continue
+        last, checked = m
+        if last and next_due(last) > today:
+            continue
+        if now - checked >= RECHECK:
+            due.append(sym)
+    return due
+
+
+def record(symbol, items, source=None, now=None):
+    """
+    写入一次上游结果（items: [{period, revenue, earnings?}]），并记录查询时间；
+    返回新增的季度数
+    """
+    sym = symbol.upper()
+    now = time.time() if now is None else now
+    rows = []
+    for it in items or []:
+        p = period_end(it.get("period") or it.get("date"))
+        if p:
+            rows.append((sym, p, it.get("revenue"), it.get("earnings"), source, now))
+    conn = connect()
+    with conn:
+        before = conn.execute("SELECT COUNT(*) FROM revenue WHERE symbol=?", (sym,)).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO revenue (symbol, period, revenue, earnings, source, fetched_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(symbol, period) DO UPDATE SET "
+            "revenue = COALESCE(revenue, excluded.revenue), earnings = COALESCE(earnings, excluded.earnings)",
+            rows,
+        )
+        after = conn.execute("SELECT COUNT(*) FROM revenue WHERE symbol=?", (sym,)).fetchone()[0]
+        last = conn.execute("SELECT MAX(period) FROM revenue WHERE symbol=?", (sym,)).fetchone()[0]
+        conn.execute(
+            "INSERT OR REPLACE INTO symbol_meta (symbol, last_period, checked_at) VALUES (?, ?, ?)",
+            (sym, last, now),
+        )
+    return after - before
+
+
+def history(symbol, limit=None):
+    """按季度倒序返回 [{symbol, period, revenue, earnings}]"""
+    sql = "SELECT symbol, period, revenue, earnings FROM revenue WHERE symbol=? ORDER BY period DESC"
+    args = [symbol.upper()]
+    if limit:
+        sql += " LIMIT ?"
+        args.append(int(limit))
+    return [
+        {"symbol": s, "period": p, "revenue": r, "earnings": e}
+        for s, p, r, e in connect().execute(sql, args)
+    ]
+
+
+def import_json(path, source="revenue_cache.json"):
+    """导入旧缓存；checked_at 记为 0，是否到期只看最后一个季度"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    added = 0
+    for sym, items in data.items():
+        added += record(sym, items, source=source, now=0)
+    return added
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if not argv:
+        print(__doc__)
+        sys.exit(1)
+    cmd, rest = argv[0], argv[1:]
+    if cmd == "import":
+        result = {"added": import_json(rest[0])}
+    elif cmd == "history":
+        result = history(rest[0], limit=int(rest[1]) if len(rest) > 1 else None)
+    elif cmd == "due":
+        result = due_symbols(rest)
+    else:
+        print(json.dumps({"error": f"unknown command: {cmd}"}, ensure_ascii=False))
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False))
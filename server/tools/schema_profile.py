@@ -0,0 +1,263 @@
+# server/tools/schema_profile.py
+"""
+上游数据的字段画像（流式、单遍、内存与记录数无关）
+
+对每个 provider、每一天、每个字段统计：
+- 出现率（记录里有这个 key 的比例）、空值率（None / "" / "N/A"）
+- 类型分布（int / float / str / bool / list / dict），出现多种非空类型即视为类型漂移
+- 数值的 min / max / mean，字符串的最短 / 最长长度
+- 少量取值样本（最多 SAMPLE_LIMIT 个不同值，用来看 hour 这类枚举字段）
+
+用法：
+    python schema_profile.py --finnhub-archive [--from 2024-01-01 --to 2024-12-31] [--by-day] [--json]
+    python schema_profile.py --provider fmp dump1.ndjson.gz dump2.json ... [--by-day] [--json]
+
+文件支持 .ndjson / .ndjson.gz（逐行流式）和 .json（列表、带 earningsCalendar 的对象或按桶分组的对象）。
+"""
+import os
+import sys
+import gzip
+import json
+
+SAMPLE_LIMIT = 12
+EMPTY = (None, "", "N/A")
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def type_name(v):
+    if v is None:
+        return "null"
+    if isinstance(v, bool):
+        return "bool"
+    if isinstance(v, int):
+        return "int"
+    if isinstance(v, float):
+        return "float"
+    if isinstance(v, str):
+        return "str"
+    if isinstance(v, list):
+        return "list"
+    if isinstance(v, dict):
+        return "dict"
+    return type(v).__name__
+
+
+class FieldStats:
+    __slots__ = ("present", "empty", "types", "num_min", "num_max", "num_sum", "num_n",
+                 "len_min", "len_max", "samples", "samples_full")
+
+    def __init__(self):
+        self.present = 0
+        self.empty = 0
+        self.types = {}
+        self.num_min = self.num_max = None
+        self.num_sum = 0.0
+        self.num_n = 0
+        self.len_min = self.len_max = None
+        self.samples = set()
+        self.samples_full = False
+
+    def add(self, v):
+        self.present += 1
+        if not isinstance(v, (list, dict)) and v in EMPTY:
+            self.empty += 1
+            return
+        t = type_name(v)
+        self.types[t] = self.types.get(t, 0) + 1
+        if t in ("int", "float"):
+            self.num_min = v if self.num_min is None else min(self.num_min, v)
+            self.num_max = v if self.num_max is None else max(self.num_max, v)
+            self.num_sum += v
+            self.num_n += 1
+        elif t == "str":
+            n = len(v)
+            self.len_min = n if self.len_min is None else min(self.len_min, n)
+            self.len_max = n if self.len_max is None else max(self.len_max, n)
+        if not self.samples_full and t in ("str", "bool", "int"):
+            self.samples.add(v)
+            if len(self.samples) > SAMPLE_LIMIT:
+                self.samples = set()
+                self.samples_full = True
+
+    def merge(self, other):
+        self.present += other.present
+        self.empty += other.empty
+        for t, n in other.types.items():
+            self.types[t] = self.types.get(t, 0) + n
+        for a in ("num_min", "len_min"):
+            o = getattr(other, a)
+            if o is not None:
+                setattr(self, a, o if getattr(self, a) is None else min(getattr(self, a), o))
+        for a in ("num_max", "len_max"):
+            o = getattr(other, a)
+            if o is not None:
+                setattr(self, a, o if getattr(self, a) is None else max(getattr(self, a), o))
+        self.num_sum += other.num_sum
+        self.num_n += other.num_n
+        if not self.samples_full:
+            if other.samples_full:
+                self.samples, self.samples_full = set(), True
+            else:
+                self.samples |= other.samples
+                if len(self.samples) > SAMPLE_LIMIT:
+                    self.samples, self.samples_full = set(), True
+
+    def report(self, total):
+        out = {
+            "presence": round(self.present / total, 4) if total else 0.0,
+            "nullRate": round(self.empty / self.present, 4) if self.present else None,
+            "types": dict(self.types),
+            # JSON 数字 1 / 1.5 分别解析成 int / float，算同一种 number，不视为漂移
+            "typeDrift": len({"number" if t in ("int", "float") else t for t in self.types}) > 1,
+        }
+        if self.num_n:
+            out.update({"min": self.num_min, "max": self.num_max, "mean": self.num_sum / self.num_n})
+        if self.len_min is not None:
+            out.update({"minLen": self.len_min, "maxLen": self.len_max})
+        if not self.samples_full and self.samples:
+            out["values"] = sorted(self.samples, key=str)
+        return out
+
+
+class Profile:
+    """{(provider, day): {"records": n, "fields": {name: FieldStats}}}"""
+
+    def __init__(self):
+        self.parts = {}
+
+    def add(self, provider, record, day=None):
+        day = day or str(record.get("date") or "")[:10] or "unknown"
+        part = self.parts.get((provider, day))
+        if part is None:
+            part = self.parts[(provider, day)] = {"records": 0, "fields": {}}
+        part["records"] += 1
+        fields = part["fields"]
+        for k, v in record.items():
+            fs = fields.get(k)
+            if fs is None:
+                fs = fields[k] = FieldStats()
+            fs.add(v)
+
+    def rollup(self):
+        """按 provider 汇总所有天"""
+        out = {}
+        for (provider, _), part in self.parts.items():
+            agg = out.setdefault(provider, {"records": 0, "days": 0, "fields": {}})
+            agg["records"] += part["records"]
+            agg["days"] += 1
+            for k, fs in part["fields"].items():
+                agg["fields"].setdefault(k, FieldStats()).merge(fs)
+        return out
+
+    def report(self, by_day=False):
+        out = {}
+        for provider, agg in self.rollup().items():
+            out[provider] = {
+                "records": agg["records"],
+                "days": agg["days"],
+                "fields": {k: fs.report(agg["records"]) for k, fs in sorted(agg["fields"].items())},
+            }
+        if by_day:
+            for (provider, day), part in sorted(self.parts.items()):
+                out[provider].setdefault("byDay", {})[day] = {
+                    "records": part["records"],
+                    "fields": {k: fs.report(part["records"]) for k, fs in sorted(part["fields"].items())},
+                }
+        return out
+
+
+def iter_file(path):
+    """逐条读出文件中的记录；.ndjson(.gz) 流式读，.json 整体读"""
+    opener = gzip.open if path.endswith(".gz") else open
+    if ".ndjson" in path or ".jsonl" in path:
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with opener(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        if "earningsCalendar" in data or "data" in data:
+            data = data.get("earningsCalendar") or data.get("data") or []
+        else:
+            # 分桶格式（{"today": [...], "thisWeek": [...]}）
+            data = [r for v in data.values() if isinstance(v, list) for r in v]
+    for r in data:
+        if isinstance(r, dict):
+            yield r
+
+
+def print_table(report):
+    for provider, p in report.items():
+        print(f"\n📊 {provider}: {p['records']} 条记录, {p['days']} 天")
+        print(f"{'field':<24} {'presence':>9} {'null':>7}  {'types':<22} {'range'}")
+        for k, f in p["fields"].items():
+            types = ",".join(f"{t}:{n}" for t, n in sorted(f["types"].items(), key=lambda x: -x[1]))
+            if "min" in f:
+                rng = f"{f['min']} .. {f['max']}"
+            elif "values" in f:
+                rng = "{" + ", ".join(str(v) for v in f["values"]) + "}"
+            elif "minLen" in f:
+                rng = f"len {f['minLen']}..{f['maxLen']}"
+            else:
+                rng = ""
+            null = f"{f['nullRate']:.1%}" if f["nullRate"] is not None else "-"
+            drift = " ⚠️" if f["typeDrift"] else ""
+            print(f"{k:<24} {f['presence']:>9.1%} {null:>7}  {types:<22} {rng}{drift}")
+
+
+def parse_args(argv):
+    opts = {"provider": None, "files": [], "finnhub_archive": False, "from": None, "to": None,
+            "by_day": False, "json": False}
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a in ("--provider", "--from", "--to"):
+            opts[a[2:]] = argv[i + 1]
+            i += 2
+            continue
+        if a == "--finnhub-archive":
+            opts["finnhub_archive"] = True
+        elif a == "--by-day":
+            opts["by_day"] = True
+        elif a == "--json":
+            opts["json"] = True
+        else:
+            opts["files"].append(a)
+        i += 1
+    return opts
+
+
+def main():
+    opts = parse_args(sys.argv[1:])
+    profile = Profile()
+    n = 0
+    if opts["finnhub_archive"]:
+        from finnhub_full_dump import iter_archive
+
+        for r in iter_archive(opts["from"], opts["to"]):
+            profile.add("finnhub", r)
+            n += 1
+    for path in opts["files"]:
+        provider = opts["provider"] or os.path.basename(path).split(".")[0]
+        for r in iter_file(path):
+            profile.add(provider, r)
+            n += 1
+    if not n:
+        print(__doc__)
+        sys.exit(1)
+    log(f"✅ 共扫描 {n} 条记录")
+
+    report = profile.report(by_day=opts["by_day"])
+    if opts["json"]:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+if __name__ == "__main__":
+    main()
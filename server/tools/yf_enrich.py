@@ -0,0 +1,190 @@
+# server/tools/yf_enrich.py
+"""
+yfinance 并发补全引擎
+
+- 有界线程池（YF_WORKERS）+ 每个 host 的并发上限（YF_HOST_CONCURRENCY）
+- 单个 symbol 超时（YF_SYMBOL_TIMEOUT 秒）后直接放弃，不拖住整批
+- 每完成一个 symbol 就回调 on_result，调用方可以边拿边用（部分结果流式输出）
+- 结束后返回耗时报告：总 wall time + 单 symbol 延迟分位数
+"""
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+WORKERS = int(os.getenv("YF_WORKERS", "16"))
+HOST_CONCURRENCY = int(os.getenv("YF_HOST_CONCURRENCY", "8"))
+SYMBOL_TIMEOUT = float(os.getenv("YF_SYMBOL_TIMEOUT", "20"))
+YAHOO_HOST = "query2.finance.yahoo.com"
+
+_HOST_SLOTS = {}
+_host_lock = threading.Lock()
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
+
+def safe_num(v):
+    try:
+        return float(v)
+    except:
+        return None
+
+
+def host_slot(host, limit=None):
+    """同一 host 在进程内共享一个信号量，限制并发连接数"""
+    with _host_lock:
+        sem = _HOST_SLOTS.get(host)
+        if sem is None:
+            sem = threading.BoundedSemaphore(limit or HOST_CONCURRENCY)
+            _HOST_SLOTS[host] = sem
+        return sem
+
+
+def _fetch_info(symbol):
+    import yfinance as yf
+    import negative_cache
+
+    try:
+        info = yf.Ticker(symbol).info or {}
+    except Exception as e:
+        kind = negative_cache.error_kind(e)
+        if kind is None:
+            raise
+        negative_cache.mark("yf_info", symbol, kind, str(e)[:200])
+        return {}
+    if not info.get("quoteType") and not info.get("regularMarketPrice"):
+        # 查不到的代码 yfinance 只返回 {"trailingPegRatio": None} 之类的空壳；
+        # 只算 Yahoo 这边没数据，明确 delisted / 代码无效才记为 invalid（会让所有数据源都跳过）
+        negative_cache.mark("yf_info", symbol, reason="empty quote")
+        return {}
+    out = {
+        "price": safe_num(info.get("currentPrice")),
+        "marketCap": safe_num(info.get("marketCap")),
+        "sector": info.get("sector") or "N/A",
+        "name": info.get("shortName") or info.get("longName"),
+    }
+    negative_cache.observe("yf_info", symbol, out["price"] is not None or out["marketCap"] is not None)
+    return out
+
+
+def fetch_info(symbol, slot=None, on_start=None):
+    """
+    单个 symbol 的 yfinance 基本面（price / marketCap / sector / name）；同一 symbol 的并发请求合并成一次。
+    negative_cache 里还没到重查时间的空 symbol 直接返回 {}
+    slot：Yahoo host 配额，只在真正查上游的 leader 里占用（等别人结果的调用不占配额）；
+    on_start()：leader 拿到配额、开始请求时回调
+    """
+    import coalesce
+    import negative_cache
+
+    if negative_cache.is_blocked("yf_info", symbol):
+        return {}
+
+    def leader():
+        with slot or host_slot(YAHOO_HOST):
+            if on_start:
+                on_start()
+            return _fetch_info(symbol)
+
+    return coalesce.run("yf_info", symbol, None, leader)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    xs = sorted(values)
+    k = (len(xs) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def latency_report(latencies, wall, ok, filled, failed, timed_out):
+    return {
+        "symbols": ok + failed + timed_out,
+        "ok": ok,
+        "filled": filled,
+        "failed": failed,
+        "timedOut": timed_out,
+        "wall": round(wall, 3),
+        "p50": _round(percentile(latencies, 50)),
+        "p90": _round(percentile(latencies, 90)),
+        "p95": _round(percentile(latencies, 95)),
+        "p99": _round(percentile(latencies, 99)),
+        "max": _round(max(latencies) if latencies else None),
+    }
+
+
+def _round(v):
+    return None if v is None else round(v, 3)
+
+
+def enrich_symbols(symbols, fetch=None, workers=None, host=YAHOO_HOST, host_limit=None,
+                   timeout=None, on_result=None):
+    """
+    并发抓取 symbols，返回 (results, report)
+    results: {symbol: dict}，只包含成功的 symbol
+    on_result(symbol, data): 每个 symbol 成功后立即在调用线程回调
+    """
+    workers = workers or WORKERS
+    timeout = timeout or SYMBOL_TIMEOUT
+    slot = host_slot(host, host_limit)
+
+    started = {}      # symbol -> 真正开始请求（拿到 host 配额）的时间
+    latencies = []
+    results = {}
+    ok = failed = timed_out = 0
+
+    def task(sym):
+        if fetch is None:
+            # 默认的 fetch_info 只在 coalesce leader 里占配额；等别人结果的调用不占，
+            # 也不进 started（等待时长由 coalesce 自己的超时兜底）
+            t = time.time()
+            data = fetch_info(sym, slot, on_start=lambda: started.__setitem__(sym, time.time()))
+            return data, time.time() - started.get(sym, t)
+        with slot:
+            started[sym] = time.time()
+            data = fetch(sym)
+            return data, time.time() - started[sym]
+
+    t0 = time.time()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = {pool.submit(task, s): s for s in symbols}
+    try:
+        while pending:
+            done, _ = wait(list(pending), timeout=0.5, return_when=FIRST_COMPLETED)
+            for fut in done:
+                sym = pending.pop(fut)
+                try:
+                    data, elapsed = fut.result()
+                except Exception as e:
+                    failed += 1
+                    log(f"⚠️ [yf_enrich] {sym} 失败: {e}")
+                    continue
+                ok += 1
+                latencies.append(elapsed)
+                if data:
+                    results[sym] = data
+                    if on_result:
+                        on_result(sym, data)
+
+            # 单 symbol 超时：放弃等待（线程自然结束，结果丢弃）
+            now = time.time()
+            for fut, sym in list(pending.items()):
+                st = started.get(sym)
+                if st is not None and now - st > timeout and not fut.done():
+                    pending.pop(fut)
+                    timed_out += 1
+                    latencies.append(now - st)
+                    log(f"⏳ [yf_enrich] {sym} 超时（>{timeout}s），跳过")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    report = latency_report(latencies, time.time() - t0, ok, len(results), failed, timed_out)
+    log(f"📈 [yf_enrich] {report['ok']}/{report['symbols']} 成功, 失败 {failed}, 超时 {timed_out}, "
+        f"wall={report['wall']}s p50={report['p50']}s p95={report['p95']}s p99={report['p99']}s")
+    return results, report
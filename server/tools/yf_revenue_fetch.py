@@ -1,21 +1,70 @@
 # server/tools/yf_revenue_fetch.py
-import sys, json, math
-import yfinance as yf
+"""
+yfinance 季度营收抓取
+
+    python yf_revenue_fetch.py AAPL                 # 单个（原有用法，输出一行 JSON）
+    python yf_revenue_fetch.py AAPL MSFT NVDA       # 批量
+    python yf_revenue_fetch.py - < symbols.txt      # 从 stdin 读（每行一个，逗号/空格分隔也可）
+
+批量模式在一个进程里并发抓取（YF_REVENUE_WORKERS，默认 8，且受 yf_enrich 的 Yahoo host 并发上限约束），
+每完成一个 symbol 立即输出一行 {"ok": ..., "symbol": ..., "items": [...]}（完成顺序，不保证输入顺序）。
+
+结果写入 revenue_store；只有到了新季度的预计披露时间才会再查上游，其余直接从本地历史返回
+（"cached": true）。YF_REVENUE_STORE=0 关闭本地历史，每次都查上游。
+上游返回空的 symbol 记入 negative_cache，按指数退避间隔重查（"negative": true）。
+"""
+import os
+import sys
+import json
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import coalesce
+import negative_cache
+import revenue_store
+from yf_enrich import host_slot, YAHOO_HOST
+
+WORKERS = int(os.getenv("YF_REVENUE_WORKERS", "8"))
+USE_STORE = os.getenv("YF_REVENUE_STORE", "1") == "1"
+REVENUE_ROWS = ["Total Revenue", "TotalRevenue", "Total revenue", "TotalRevenueNet"]
+
+
+def log(msg):
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
+
 
 def to_safe_number(x):
     try:
         if x is None: return None
-        if isinstance(x, float) and (math.isnan(x) or math.isinf(x)): 
+        if isinstance(x, float) and (math.isnan(x) or math.isinf(x)):
             return None
         return float(x)
     except:
         return None
 
-def main():
-    if len(sys.argv) < 2:
-        print(json.dumps({"ok": False, "error": "symbol required"}, ensure_ascii=False, allow_nan=False))
-        return
-    sym = sys.argv[1].strip().upper()
+
+def revenue_row(qf):
+    """quarterly_financials 里的营收行名不固定：先按常见名称找，再兜底找含 revenue/sales 的行"""
+    for k in REVENUE_ROWS:
+        if k in qf.index:
+            return k
+    for nm in qf.index:
+        if "revenue" in str(nm).lower() or "sales" in str(nm).lower():
+            return nm
+    return None
+
+
+def iso_period(p):
+    """统一成季度末日期 YYYY-MM-DD：quarterly_earnings 给的是 "3Q2024"，Node 端 toISO() 只认日期"""
+    return revenue_store.period_end(p) or str(p)
+
+
+def fetch_revenue(symbol):
+    import yfinance as yf  # 只有真正查上游时才加载（本地历史命中时省掉 yfinance + pandas 的 import）
+
+    sym = symbol.strip().upper()
     tk = yf.Ticker(sym)
 
     # 1) 先尝试 earnings（yfinance 自带的季度营收/净利）
@@ -27,7 +76,7 @@ def main():
                 # idx 是 Period (时间)，row['Revenue'] 可能是 NaN
                 out.append({
                     "symbol": sym,
-                    "period": str(idx),
+                    "period": iso_period(idx),
                     "revenue": to_safe_number(row.get("Revenue")),
                     "earnings": to_safe_number(row.get("Earnings"))
                 })
@@ -39,18 +88,109 @@ def main():
         try:
             qf = tk.quarterly_financials  # rows as index, columns are periods
             if qf is not None and not qf.empty:
-                if "Total Revenue" in qf.index:
-                    row = qf.loc["Total Revenue"]
+                key = revenue_row(qf)
+                if key is not None:
+                    row = qf.loc[key]
                     for period, val in row.items():
                         out.append({
                             "symbol": sym,
-                            "period": str(period),
+                            "period": iso_period(period),
                             "revenue": to_safe_number(val)
                         })
         except Exception as e:
             pass
 
-    print(json.dumps({"ok": True, "symbol": sym, "items": out}, ensure_ascii=False, allow_nan=False))
+    return {"ok": True, "symbol": sym, "items": out}
+
+
+def _fetch_observed(symbol, slot):
+    # 只有真正查上游的 leader 占 Yahoo host 配额；等待别的进程结果的调用不占
+    with slot:
+        result = fetch_revenue(symbol)
+    negative_cache.observe("yf_revenue", result["symbol"], bool(result["items"]))
+    return result
+
+
+def _fetch_one(symbol, slot, use_store=False):
+    if negative_cache.is_blocked("yf_revenue", symbol):
+        # 近期查过没有数据（OTC / SPAC / 退市），未到重查时间
+        items = revenue_store.history(symbol) if use_store else []
+        return {"ok": True, "symbol": symbol, "items": items, "cached": True, "negative": True}
+    try:
+        # 多个进程 / 线程同时要同一个 symbol 时只查一次上游
+        result = coalesce.run("yf_revenue", symbol, None, lambda: _fetch_observed(symbol, slot))
+    except Exception as e:
+        return {"ok": False, "symbol": symbol.strip().upper(), "error": str(e), "items": []}
+    if use_store:
+        try:
+            added = revenue_store.record(result["symbol"], result["items"], source="yfinance")
+            # 返回完整历史（上游只给最近几个季度）
+            result = {"ok": True, "symbol": result["symbol"], "items": revenue_store.history(result["symbol"]),
+                      "cached": False, "added": added}
+        except Exception as e:
+            log(f"⚠️ revenue_store 写入失败 {symbol}: {e}")
+    return result
+
+
+def _from_store(symbol):
+    return {"ok": True, "symbol": symbol, "items": revenue_store.history(symbol), "cached": True}
+
+
+def fetch_batch(symbols, workers=None, on_result=None, use_store=None):
+    """
+    并发抓取一批 symbol（可以是生成器，边读边提交）；返回 {symbol: result}
+    on_result(result): 每完成一个 symbol 回调一次
+    use_store: 默认按 YF_REVENUE_STORE；未到期的 symbol 直接读本地历史
+    """
+    use_store = USE_STORE if use_store is None else use_store
+    slot = host_slot(YAHOO_HOST)
+    results = {}
+    seen = set()
+    with ThreadPoolExecutor(max_workers=workers or WORKERS) as pool:
+        futures = []
+        for s in symbols:
+            sym = s.strip().upper()
+            if not sym or sym in seen:
+                continue
+            seen.add(sym)
+            if use_store and not revenue_store.due_symbols([sym]):
+                r = _from_store(sym)
+                results[sym] = r
+                if on_result:
+                    on_result(r)
+                continue
+            fut = pool.submit(_fetch_one, sym, slot, use_store)
+            if on_result:
+                fut.add_done_callback(lambda f: on_result(f.result()))
+            futures.append(fut)
+        for fut in futures:
+            r = fut.result()
+            results[r["symbol"]] = r
+    return results
+
+
+def iter_stdin_symbols(fp=None):
+    for line in fp or sys.stdin:
+        for s in line.replace(",", " ").split():
+            yield s
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(json.dumps({"ok": False, "error": "symbol required"}, ensure_ascii=False, allow_nan=False))
+        return
+    symbols = iter_stdin_symbols() if args == ["-"] else args
+
+    lock = threading.Lock()
+
+    def emit(result):
+        line = json.dumps(result, ensure_ascii=False, allow_nan=False)
+        with lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    fetch_batch(symbols, on_result=emit)
 
 if __name__ == "__main__":
     main()
@@ -1,148 +1,382 @@
+"""
+多数据源并发探测（AlphaVantage / Finnhub / FMP / EODHD / Yahoo / EDGAR）
+
+所有 provider × endpoint × symbol 并发请求（节奏交给 rate_limit 令牌桶），每个 endpoint 记录：
+状态码分布、成功率、延迟分位数（p50/p90/p99）、响应大小、字段完整度（期望字段的非空比例）。
+
+每次运行追加一行到 probe_runs.ndjson（时间序列），同时保留 earnings_results_*.json（每个 symbol / 来源是否可用）；
+线上实际在排序的源（日历 FMP / Finnhub，季度营收 yfinance / EDGAR）的探测记入 provider_router
+（对应关系见 provider_router.PROBE_ROUTES），线上请求据此给数据源排序。
+
+    python test_multi_earnings_api_v3.py [AAPL NVDA ...] [--rounds 3]
+    python test_multi_earnings_api_v3.py --history [--last 20]   # 只读时间序列：每个字段最快且可靠的来源
+"""
 import os
-import requests
+import sys
 import time
 import json
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server", "tools"))
+import provider_client as pc
+import provider_router
+import rate_limit
+from yf_enrich import percentile
+
 init(autoreset=True)
 load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"))
 
 symbols = ["AAPL", "NVDA"]
 timeout = 10
-results = {}
+RUNS_FILE = "probe_runs.ndjson"
+RELIABLE = 0.9    # 成功率低于此值的 endpoint 不参与“最快来源”评选
 
 ALPHA_KEY = os.getenv("ALPHA_VANTAGE_KEY")
 FINNHUB_KEY = os.getenv("FINNHUB_KEY")
 FMP_KEY = os.getenv("FMP_KEY")
 EODHD_KEY = os.getenv("EODHD_KEY")
 
-def safe_get(url):
-    try:
-        r = requests.get(url, timeout=timeout)
-        return r.status_code, r.json()
-    except Exception as e:
-        return None, {"error": str(e)}
+
+def first(x):
+    return x[0] if isinstance(x, list) and x else {}
+
+
+def quarters(values, n=8):
+    """最近 n 个季度的值 -> {"q1": ..., "qn": ...}；完整度与线上营收来源一致（拿到的季度数 / 8）"""
+    values = list(values or [])[-n:][::-1]
+    return {f"q{i + 1}": (values[i] if i < len(values) else None) for i in range(n)}
+
+
+def eodhd_quarter(d):
+    q = ((d or {}).get("Financials") or {}).get("Income_Statement", {}).get("quarterly") or {}
+    return next(iter(q.values()), {}) if isinstance(q, dict) else {}
+
+
+# === 抽取函数：原始响应 -> {统一字段: 值} ===
+def av_earnings(d):
+    q = first((d or {}).get("quarterlyEarnings"))
+    return {"eps": q.get("reportedEPS"), "epsEstimate": q.get("estimatedEPS"),
+            "surprisePct": q.get("surprisePercentage")}
+
+
+def av_overview(d):
+    d = d or {}
+    return {"revenueTTM": d.get("RevenueTTM"), "pe": d.get("PERatio"),
+            "marketCap": d.get("MarketCapitalization"), "sector": d.get("Sector")}
+
+
+def finnhub_earnings(d):
+    q = first(d)
+    return {"eps": q.get("actual"), "epsEstimate": q.get("estimate"), "surprisePct": q.get("surprisePercent")}
+
+
+def finnhub_metric(d):
+    m = (d or {}).get("metric") or {}
+    return {"pe": m.get("peInclExtraTTM"), "epsTTM": m.get("epsTTM"), "marketCap": m.get("marketCapitalization")}
+
+
+def fmp_key_metrics(d):
+    q = first(d)
+    return {"pe": q.get("peRatio"), "epsTTM": q.get("netIncomePerShare"), "roe": q.get("roe")}
+
+
+def fmp_income(d):
+    q = first(d)
+    return {"revenue": q.get("revenue"), "netIncome": q.get("netIncome"), "eps": q.get("eps")}
+
+
+def fmp_earning_calendar(d):
+    q = first(d)
+    return {"eps": q.get("epsEstimated"), "revenueEstimate": q.get("revenueEstimated"), "time": q.get("time")}
+
+
+def finnhub_calendar(d):
+    q = first((d or {}).get("earningsCalendar"))
+    return {"eps": q.get("epsEstimate"), "revenueEstimate": q.get("revenueEstimate"), "time": q.get("hour")}
+
+
+def yahoo_revenue(d):
+    result = first(((d or {}).get("timeseries") or {}).get("result"))
+    series = result.get("quarterlyTotalRevenue") or []
+    return quarters((x or {}).get("reportedValue", {}).get("raw") for x in series)
+
+
+def edgar_revenue(d):
+    facts = ((d or {}).get("facts") or {}).get("us-gaap") or {}
+    for tag in ("Revenues", "RevenueFromContractWithCustomerExcludingAssessedTax", "SalesRevenueNet"):
+        units = ((facts.get(tag) or {}).get("units") or {}).get("USD") or []
+        qs = {u["end"]: u.get("val") for u in units if u.get("fp", "").startswith("Q") and u.get("end")}
+        if qs:
+            return quarters(v for _, v in sorted(qs.items()))
+    return quarters([])
+
+
+def eodhd_fundamentals(d):
+    highlights = (d or {}).get("Highlights") or {}
+    general = (d or {}).get("General") or {}
+    return {"epsTTM": highlights.get("EarningsShare"), "marketCap": highlights.get("MarketCapitalization"),
+            "sector": general.get("Sector"), "revenue": eodhd_quarter(d).get("totalRevenue")}
+
+
+# (来源, endpoint, provider, url 模板, 抽取函数)
+ENDPOINTS = [
+    ("AlphaVantage", "earnings", "alphavantage",
+     "https://www.alphavantage.co/query?function=EARNINGS&symbol={symbol}&apikey={ALPHA_KEY}", av_earnings),
+    ("AlphaVantage", "overview", "alphavantage",
+     "https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={ALPHA_KEY}", av_overview),
+    ("Finnhub", "earnings", "finnhub",
+     "https://finnhub.io/api/v1/stock/earnings?symbol={symbol}&token={FINNHUB_KEY}", finnhub_earnings),
+    ("Finnhub", "metric", "finnhub",
+     "https://finnhub.io/api/v1/stock/metric?symbol={symbol}&metric=all&token={FINNHUB_KEY}", finnhub_metric),
+    ("FMP", "key-metrics", "fmp",
+     "https://financialmodelingprep.com/api/v3/key-metrics/{symbol}?limit=1&apikey={FMP_KEY}", fmp_key_metrics),
+    ("FMP", "income-statement", "fmp",
+     "https://financialmodelingprep.com/api/v3/income-statement/{symbol}?limit=1&apikey={FMP_KEY}", fmp_income),
+    ("EODHD", "fundamentals", "eodhd",
+     "https://eodhd.com/api/fundamentals/{symbol_us}?api_token={EODHD_KEY}&fmt=json", eodhd_fundamentals),
+    # 以下四个与线上排序的源一一对应（provider_router.PROBE_ROUTES）
+    ("FMP", "earning-calendar", "fmp",
+     "https://financialmodelingprep.com/api/v3/historical/earning_calendar/{symbol}?limit=4&apikey={FMP_KEY}",
+     fmp_earning_calendar),
+    ("Finnhub", "calendar", "finnhub",
+     "https://finnhub.io/api/v1/calendar/earnings?symbol={symbol}&from={from_date}&to={to_date}&token={FINNHUB_KEY}",
+     finnhub_calendar),
+    ("Yahoo", "revenue-timeseries", "yahoo",
+     "https://query2.finance.yahoo.com/ws/fundamentals-timeseries/v1/finance/timeseries/{symbol}"
+     "?type=quarterlyTotalRevenue&padTimeSeries=true&period1=0&period2=9999999999", yahoo_revenue),
+    ("EDGAR", "companyfacts", "sec",
+     "https://data.sec.gov/api/xbrl/companyfacts/CIK{cik}.json", edgar_revenue),
+]
+# SEC 要求带联系方式的 User-Agent；Yahoo 对默认 UA 常返回 401/429（与 Node 端请求头一致）
+HEADERS = {
+    "sec": {"User-Agent": "EarningsPro/1.0 (contact@example.com)"},
+    "yahoo": {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                            "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"},
+}
+_ciks = None
+_ciks_lock = None
+
+
+async def sec_cik(symbol):
+    """ticker -> 10 位 CIK（company_tickers.json 成功拉到一次后整个进程复用；失败时返回 None，下次再试）"""
+    global _ciks, _ciks_lock
+    _ciks_lock = _ciks_lock or asyncio.Lock()
+    async with _ciks_lock:
+        if _ciks is None:
+            r = await pc.client().get("sec", "https://www.sec.gov/files/company_tickers.json",
+                                      timeout=timeout, headers=HEADERS["sec"])
+            if not r.ok or not isinstance(r.data, dict) or not r.data:
+                print(fail(f"SEC company_tickers.json 获取失败 (status={r.status}{', ' + r.error if r.error else ''})"))
+                return None
+            _ciks = {str(x.get("ticker", "")).upper(): str(x.get("cik_str", "")).zfill(10)
+                     for x in r.data.values()}
+    return _ciks.get(symbol.upper())
+
 
 def ok(text): return Fore.GREEN + "✅ " + Style.RESET_ALL + text
 def fail(text): return Fore.RED + "❌ " + Style.RESET_ALL + text
 
-def test_alpha(symbol):
-    ok_count = 0
-    url = f"https://www.alphavantage.co/query?function=EARNINGS&symbol={symbol}&apikey={ALPHA_KEY}"
-    status, data = safe_get(url)
-    if data.get("quarterlyEarnings"):
-        latest = data["quarterlyEarnings"][0]
-        eps = latest.get("reportedEPS")
-        surprise = latest.get("surprisePercentage")
-        print(ok(f"AlphaVantage {symbol}: EPS={eps}, Surprise%={surprise}"))
-        ok_count += 1
-    else:
-        print(fail(f"AlphaVantage {symbol}: 无季度数据 (status={status})"))
 
-    url2 = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={ALPHA_KEY}"
-    s2, d2 = safe_get(url2)
-    if d2.get("RevenueTTM"):
-        print(ok(f"AlphaVantage {symbol}: RevenueTTM={d2['RevenueTTM']}"))
-        ok_count += 1
-    else:
-        print(fail(f"AlphaVantage {symbol}: 无 RevenueTTM"))
-    return ok_count > 0
-
-def test_finnhub(symbol):
-    ok_count = 0
-    url = f"https://finnhub.io/api/v1/stock/earnings?symbol={symbol}&token={FINNHUB_KEY}"
-    status, data = safe_get(url)
-    if isinstance(data, list) and data:
-        last = data[0]
-        print(ok(f"Finnhub {symbol}: EPS={last.get('actual')}, Est={last.get('estimate')}, Surprise%={last.get('surprisePercent')}"))
-        ok_count += 1
-    else:
-        print(fail(f"Finnhub {symbol}: 无历史 EPS 数据 (status={status})"))
-
-    url2 = f"https://finnhub.io/api/v1/stock/metric?symbol={symbol}&metric=all&token={FINNHUB_KEY}"
-    s2, d2 = safe_get(url2)
-    if d2.get("metric"):
-        pe = d2["metric"].get("peInclExtraTTM")
-        eps = d2["metric"].get("epsTTM")
-        print(ok(f"Finnhub {symbol}: PE={pe}, EPS={eps}"))
-        ok_count += 1
-    else:
-        print(fail(f"Finnhub {symbol}: 无 metric 数据"))
-    return ok_count > 0
-
-def test_fmp(symbol):
-    ok_count = 0
-    url = f"https://financialmodelingprep.com/api/v3/key-metrics/{symbol}?limit=1&apikey={FMP_KEY}"
-    status, data = safe_get(url)
-    if isinstance(data, list) and data:
-        d = data[0]
-        print(ok(f"FMP {symbol}: PE={d.get('peRatio')}, EPS={d.get('netIncomePerShare')}, ROE={d.get('roe')}"))
-        ok_count += 1
-    else:
-        print(fail(f"FMP {symbol}: 无 key-metrics 数据 (status={status})"))
-
-    url2 = f"https://financialmodelingprep.com/api/v3/income-statement/{symbol}?limit=1&apikey={FMP_KEY}"
-    s2, d2 = safe_get(url2)
-    if isinstance(d2, list) and d2:
-        r = d2[0]
-        print(ok(f"FMP {symbol}: Revenue={r.get('revenue')}, NetIncome={r.get('netIncome')}"))
-        ok_count += 1
-    else:
-        print(fail(f"FMP {symbol}: 无 income-statement 数据"))
-    return ok_count > 0
+def filled(v):
+    return v not in (None, "", "None", "-", "N/A")
+
 
-def test_eodhd(symbol):
-    ok_count = 0
+async def probe(source, endpoint, provider, template, extract, symbol):
     symbol_us = symbol if symbol.endswith(".US") else f"{symbol}.US"
-    url = f"https://eodhd.com/api/fundamentals/{symbol_us}?api_token={EODHD_KEY}&fmt=json"
-    status, data = safe_get(url)
-    if not isinstance(data, dict):
-        print(fail(f"EODHD {symbol}: 无返回 (status={status})"))
-        return False
-    highlights = data.get("Highlights", {})
-    eps = highlights.get("EarningsShare")
-    if eps:
-        print(ok(f"EODHD {symbol}: EPS={eps}"))
-        ok_count += 1
-    fin = data.get("Financials", {}).get("Income_Statement", {}).get("quarterly", {})
-    if fin:
-        last_period = list(fin.values())[0]
-        revenue = last_period.get("totalRevenue")
-        print(ok(f"EODHD {symbol}: Revenue={revenue}"))
-        ok_count += 1
+    today = datetime.now().date()
+    cik = None
+    if "{cik}" in template:
+        cik = await sec_cik(symbol)
+        if cik is None:
+            # 拿不到 CIK 不是 EDGAR 本身的失败：跳过，不进汇总 / provider_router
+            print(f"⏭️ {source} {endpoint} {symbol}: 无 CIK，跳过")
+            return None
+    url = template.format(symbol=symbol, symbol_us=symbol_us, ALPHA_KEY=ALPHA_KEY,
+                          FINNHUB_KEY=FINNHUB_KEY, FMP_KEY=FMP_KEY, EODHD_KEY=EODHD_KEY, cik=cik,
+                          from_date=today - timedelta(days=120), to_date=today + timedelta(days=240))
+    r = await pc.client().get(provider, url, timeout=timeout, headers=HEADERS.get(provider))
+    try:
+        fields = extract(r.data) if r.data is not None else {}
+    except Exception:
+        fields = {}
+    got = {k: v for k, v in fields.items() if filled(v)}
+    rec = {
+        "source": source, "endpoint": endpoint, "symbol": symbol,
+        "status": r.status, "ok": r.ok and bool(got), "error": r.error,
+        "latency": round(r.elapsed, 4), "bytes": r.nbytes,
+        "fields": {k: filled(v) for k, v in fields.items()},
+    }
+    label = f"{source} {endpoint} {symbol}"
+    if rec["ok"]:
+        print(ok(f"{label}: {', '.join(f'{k}={v}' for k, v in got.items())} ({rec['latency'] * 1000:.0f}ms)"))
     else:
-        print(fail(f"EODHD {symbol}: 无 Income_Statement 数据"))
-    return ok_count > 0
+        print(fail(f"{label}: 无数据 (status={r.status}{', ' + r.error if r.error else ''})"))
+    return rec
+
+
+def summarize(records):
+    """按 (来源, endpoint) 汇总探测记录"""
+    groups = {}
+    for rec in records:
+        groups.setdefault(f"{rec['source']}/{rec['endpoint']}", []).append(rec)
+    out = {}
+    for key, recs in sorted(groups.items()):
+        lat = [r["latency"] for r in recs if r["status"] is not None]
+        statuses = {}
+        for r in recs:
+            statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+        field_names = sorted({f for r in recs for f in r["fields"]})
+        out[key] = {
+            "n": len(recs),
+            "okRate": round(sum(r["ok"] for r in recs) / len(recs), 4),
+            "status": statuses,
+            "p50": percentile(lat, 50), "p90": percentile(lat, 90), "p99": percentile(lat, 99),
+            "bytesAvg": round(sum(r["bytes"] for r in recs) / len(recs)),
+            "completeness": {
+                f: round(sum(1 for r in recs if r["fields"].get(f)) / len(recs), 4) for f in field_names
+            },
+        }
+    return out
+
+
+def best_by_field(runs):
+    """综合多次运行：每个字段在可靠（成功率 >= RELIABLE）的 endpoint 里，按完整度、再按 p50 选最优"""
+    agg = {}
+    for run in runs:
+        for key, s in run["endpoints"].items():
+            a = agg.setdefault(key, {"n": 0, "ok": 0.0, "p50": [], "fields": {}})
+            a["n"] += s["n"]
+            a["ok"] += s["okRate"] * s["n"]
+            if s["p50"] is not None:
+                a["p50"].append(s["p50"])
+            for f, c in s["completeness"].items():
+                fa = a["fields"].setdefault(f, [0.0, 0])
+                fa[0] += c * s["n"]
+                fa[1] += s["n"]
+    best = {}
+    for key, a in agg.items():
+        ok_rate = a["ok"] / a["n"] if a["n"] else 0
+        if ok_rate < RELIABLE:
+            continue
+        p50 = percentile(a["p50"], 50)
+        for f, (hit, n) in a["fields"].items():
+            if not hit:
+                continue
+            cand = {"endpoint": key, "completeness": round(hit / n, 4), "p50": p50, "okRate": round(ok_rate, 4)}
+            cur = best.get(f)
+            if cur is None or (cand["completeness"], -(p50 or 1e9)) > (cur["completeness"], -(cur["p50"] or 1e9)):
+                best[f] = cand
+    return best
+
+
+def feed_router(records):
+    """线上在排序的源（PROBE_ROUTES）的探测记录喂给 provider_router，其余 endpoint 不记"""
+    classes = {}
+    for rec in records:
+        keys = provider_router.probe_routes(rec["source"], rec["endpoint"])
+        if not keys:
+            continue
+        sym = rec["symbol"]
+        if sym not in classes:
+            classes[sym] = provider_router.symbol_class(sym)
+        fields = rec["fields"]
+        for kind, provider in keys:
+            provider_router.record(
+                kind, provider, latency=rec["latency"] if rec["status"] is not None else None, ok=rec["ok"],
+                fill=sum(fields.values()) / len(fields) if fields else None, symbol_class=classes[sym],
+            )
+
+
+def load_runs(last=None):
+    if not os.path.exists(RUNS_FILE):
+        return []
+    with open(RUNS_FILE, "r", encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return runs[-last:] if last else runs
+
+
+def ms(v):
+    return f"{v * 1000:.0f}ms" if v is not None else "-"
+
+
+def print_summary(summary):
+    print(f"\n{'endpoint':<30} {'n':>4} {'ok':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'bytes':>9}  status")
+    for key, s in summary.items():
+        print(f"{key:<30} {s['n']:>4} {s['okRate']:>6.0%} {ms(s['p50']):>8} {ms(s['p90']):>8} {ms(s['p99']):>8} "
+              f"{s['bytesAvg']:>9}  {s['status']}")
+
+
+def print_best(best):
+    print(f"\n🏆 各字段最快可靠来源（成功率 >= {RELIABLE:.0%}）:")
+    for f, b in sorted(best.items()):
+        print(f"  {f:<14} {b['endpoint']:<30} 完整度 {b['completeness']:.0%}  p50 {ms(b['p50'])}")
+
+
+async def run_all(syms, rounds):
+    # 不再固定 sleep：节奏交给 rate_limit 的令牌桶（429 时自动退避）
+    t0 = time.time()
+    tasks = [probe(*ep, sym) for _ in range(rounds) for sym in syms for ep in ENDPOINTS]
+    records = [rec for rec in await asyncio.gather(*tasks) if rec is not None]
+    return records, round(time.time() - t0, 2)
+
+
+def parse_args(argv):
+    opts = {"symbols": [], "rounds": 1, "history": False, "last": None}
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a in ("--rounds", "--last"):
+            opts[a[2:]] = int(argv[i + 1])
+            i += 2
+            continue
+        if a == "--history":
+            opts["history"] = True
+        else:
+            opts["symbols"].append(a.upper())
+        i += 1
+    return opts
+
 
 def main():
-    print("\n🧪 Running Multi-Source Earnings API Test (v3)...\n")
+    opts = parse_args(sys.argv[1:])
+    if opts["history"]:
+        runs = load_runs(opts["last"])
+        print(f"📈 共 {len(runs)} 次运行记录（{RUNS_FILE}）")
+        print_best(best_by_field(runs))
+        return
+
+    print("\n🧪 Running Multi-Source Earnings API Probe (v3)...\n")
     if not all([ALPHA_KEY, FINNHUB_KEY, FMP_KEY, EODHD_KEY]):
         print("⚠️ 请确认四个 API Key 已在 .env 中设置。\n")
         return
 
-    for sym in symbols:
-        print(f"{'='*20} {sym} {'='*20}")
-        start = time.time()
-        res = {
-            "AlphaVantage": test_alpha(sym),
-            "Finnhub": test_finnhub(sym),
-            "FMP": test_fmp(sym),
-            "EODHD": test_eodhd(sym),
-        }
-        elapsed = round(time.time() - start, 2)
-        valid = sum(1 for v in res.values() if v)
-        print(f"{Fore.CYAN}➡️  {sym} 有效来源数: {valid}/4 | 耗时: {elapsed}s{Style.RESET_ALL}")
-        print("-" * 70)
-        results[sym] = res
-        time.sleep(2)
-
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    outfile = f"earnings_results_{ts}.json"
+    syms = opts["symbols"] or symbols
+    records, wall = asyncio.run(run_all(syms, opts["rounds"]))
+    summary = summarize(records)
+    feed_router(records)
+    print_summary(summary)
+    print(f"\n⏱️ {len(records)} 次请求，总耗时 {wall}s")
+    print(f"📊 限速状态: {json.dumps(rate_limit.metrics(), ensure_ascii=False)}")
+
+    ts = datetime.now()
+    run = {"at": ts.isoformat(timespec="seconds"), "symbols": syms, "rounds": opts["rounds"],
+           "wall": wall, "endpoints": summary}
+    with open(RUNS_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run, ensure_ascii=False) + "\n")
+    print_best(best_by_field(load_runs()))
+
+    # 兼容旧输出：每个 symbol / 来源是否至少有一个 endpoint 可用
+    results = {}
+    for rec in records:
+        src = results.setdefault(rec["symbol"], {})
+        src[rec["source"]] = src.get(rec["source"], False) or rec["ok"]
+    outfile = f"earnings_results_{ts.strftime('%Y%m%d_%H%M%S')}.json"
     with open(outfile, "w", encoding="utf-8") as f:
         json.dump(results, f, indent=2, ensure_ascii=False)
-    print(f"\n✅ 测试完成，结果已保存至 {outfile}\n")
+    print(f"\n✅ 探测完成，结果已保存至 {outfile}，时间序列追加到 {RUNS_FILE}\n")
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,9 @@
-import requests
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server", "tools"))
+import provider_client as pc
 
 keys = {
     "FMP": "z1m4vMNiLtZ1oXbdGJIulSpbMxGfLqvx",
@@ -7,49 +12,53 @@ keys = {
     "EODHD": "690cd18c78e591.25613652"
 }
 
-def test_finnhub(symbol):
+async def test_finnhub(symbol):
     url = f"https://finnhub.io/api/v1/calendar/earnings?symbol={symbol}&token={keys['FINNHUB']}"
-    r = requests.get(url)
-    if r.status_code == 200:
-        data = r.json().get("earningsCalendar", [])
+    r = await pc.client().get("finnhub", url)
+    if r.status == 200:
+        data = (r.data or {}).get("earningsCalendar", [])
         if data:
             d = data[0]
             print(f"🟢 Finnhub {symbol}: EPS={d.get('epsActual')} vs {d.get('epsEstimate')} | Rev={d.get('revenueActual')} vs {d.get('revenueEstimate')}")
         else:
             print(f"⚪ Finnhub 无数据 {symbol}")
     else:
-        print(f"🔴 Finnhub Error {r.status_code}")
+        print(f"🔴 Finnhub Error {r.status or r.error}")
 
-def test_eodhd(symbol):
+async def test_eodhd(symbol):
     url = f"https://eodhd.com/api/calendar_earnings?symbol={symbol}&api_token={keys['EODHD']}&fmt=json"
-    r = requests.get(url)
-    if r.status_code == 200:
-        data = r.json()
+    r = await pc.client().get("eodhd", url)
+    if r.status == 200:
+        data = r.data
         if data:
             d = data[0]
             print(f"🟢 EODHD {symbol}: EPS={d.get('epsActual')} vs {d.get('epsEstimate')} | Rev={d.get('revenueActual')} vs {d.get('revenueEstimate')}")
         else:
             print(f"⚪ EODHD 无数据 {symbol}")
     else:
-        print(f"🔴 EODHD Error {r.status_code}")
+        print(f"🔴 EODHD Error {r.status or r.error}")
 
-def test_alphav(symbol):
+async def test_alphav(symbol):
     url = f"https://www.alphavantage.co/query?function=EARNINGS&symbol={symbol}&apikey={keys['ALPHAV']}"
-    r = requests.get(url)
-    if r.status_code == 200:
-        data = r.json().get("quarterlyEarnings", [])
+    r = await pc.client().get("alphavantage", url)
+    if r.status == 200:
+        data = (r.data or {}).get("quarterlyEarnings", [])
         if data:
             d = data[0]
             print(f"🟢 AlphaV {symbol}: EPS={d.get('reportedEPS')} vs {d.get('estimatedEPS')}")
         else:
             print(f"⚪ AlphaV 无数据 {symbol}")
     else:
-        print(f"🔴 AlphaV Error {r.status_code}")
+        print(f"🔴 AlphaV Error {r.status or r.error}")
+
+async def run_symbol(s):
+    await asyncio.gather(test_finnhub(s), test_eodhd(s), test_alphav(s))
+    print(f"==== {s} 完成 ====")
+
+async def main(symbols):
+    # 所有 symbol × 数据源并发，单个数据源的并发度由 provider_client 限制
+    await asyncio.gather(*(run_symbol(s) for s in symbols))
 
 if __name__ == "__main__":
     symbols = ["AAPL", "MSFT", "NVDA", "AMZN"]
-    for s in symbols:
-        print(f"\n==== {s} ====")
-        test_finnhub(s)
-        test_eodhd(s)
-        test_alphav(s)
+    asyncio.run(main(symbols))